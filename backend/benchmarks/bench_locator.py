@@ -0,0 +1,101 @@
+"""Benchmarks for locating sentences in BaseX databases, by id or by their
+stored pre value (see SentenceLocation). Unlike the other benchmarks,
+these need a running BaseX server. Databases of the requested numbers of
+sentences (GRETEL_BENCHMARK_SIZES) are created from the sentences of the
+test treebank in testdata, and deleted afterwards."""
+
+from django.conf import settings
+
+import gzip
+import random
+
+import lxml.etree as etree
+import pytest
+
+from search.basex_search import (generate_xquery_showtree,
+                                 generate_xquery_context,
+                                 generate_xquery_sentence_locations)
+from services.basex import basex
+from treebanks.models import Treebank, Component, BaseXDB
+
+# Number of sentences that is looked up in every run
+LOOKUPS = 50
+
+
+@pytest.fixture(scope='module')
+def template_sentences():
+    path = settings.BASE_DIR / 'testdata' / 'TEST_TROONREDE' / 'COMPACT' / \
+        'troonrede1990.data.dz'
+    with gzip.open(path) as f:
+        documents = f.read().decode().split('<?xml version="1.0" '
+                                            'encoding="UTF-8"?>')
+    return [etree.fromstring(x) for x in documents if x.strip()]
+
+
+@pytest.fixture(scope='module')
+def databases():
+    """Names of the created BaseX databases by size"""
+    if not basex.test_connection():
+        pytest.skip('requires running BaseX server')
+    created = {}
+    yield created
+    for dbname in created.values():
+        basex.execute('DROP DB {}'.format(dbname))
+
+
+@pytest.fixture
+def database(databases, template_sentences, size):
+    if size not in databases:
+        dbname = 'GRETEL_BENCHMARK_LOCATOR_{}'.format(size)
+        sentences = []
+        for number in range(size):
+            tree = template_sentences[number % len(template_sentences)]
+            tree.set('id', 'benchmark:{}'.format(number))
+            sentences.append(etree.tostring(tree, encoding='unicode'))
+        basex.create(dbname, '<treebank>' + ''.join(sentences) +
+                     '</treebank>')
+        databases[size] = dbname
+    return databases[size]
+
+
+@pytest.fixture
+def lookups(database, size):
+    """Sentence ids and pre values of LOOKUPS random sentences"""
+    items = basex.perform_query_iter(
+        generate_xquery_sentence_locations(database))
+    locations = [(sentence_id, int(pre))
+                 for (_, sentence_id), (_, pre) in zip(items, items)]
+    return random.Random(size).sample(locations, min(LOOKUPS, size))
+
+
+@pytest.mark.django_db
+def test_build_sentence_index(benchmark, database, size):
+    treebank = Treebank.objects.create(slug='benchmark', title='Benchmark')
+    component = Component.objects.create(
+        slug='comp', title='comp', nr_sentences=size, nr_words=0,
+        treebank=treebank
+    )
+    basex_db = BaseXDB.objects.create(dbname=database, size=0,
+                                      component=component)
+    assert benchmark(basex_db.build_sentence_index) == size
+
+
+@pytest.mark.parametrize('use_pre', [False, True])
+def test_showtree(benchmark, database, lookups, use_pre):
+    def lookup():
+        return [basex.perform_query(generate_xquery_showtree(
+            database, sentence_id, pre if use_pre else None
+        )) for sentence_id, pre in lookups]
+
+    trees = benchmark(lookup)
+    assert all(tree.startswith('<alpino_ds') for tree in trees)
+
+
+@pytest.mark.parametrize('use_pre', [False, True])
+def test_context(benchmark, database, lookups, use_pre):
+    def lookup():
+        return [basex.perform_query(generate_xquery_context(
+            database, sentence_id, pre if use_pre else None
+        )) for sentence_id, pre in lookups]
+
+    benchmark(lookup)
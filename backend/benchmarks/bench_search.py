@@ -0,0 +1,180 @@
+"""Benchmarks for the search hot path. The input consists of matches in
+the format returned by BaseX for the XQuery of generate_xquery_search,
+built from the test treebank in testdata. These are repeated (with unique
+sentence ids) to create cache files of the requested sizes."""
+
+from django.conf import settings
+from django.utils import timezone
+
+from functools import partial
+from itertools import cycle, islice
+import gzip
+import random
+import zlib
+
+import lxml.etree as etree
+import pytest
+
+from search import cache as cache_format
+from search.basex_search import (parse_search_result,
+                                 parse_metadata_count_result)
+from search.models import SearchQuery
+from search.views import filter_include, filter_exclude, filter_expand
+from treebanks.models import Treebank, Component, BaseXDB
+
+TEMPLATE_XPATH = '//node[@cat="smain" and node[@rel="su"] and ' \
+                 'node[@rel="hd"]]'
+VARIABLES = [
+    {'name': '$node', 'path': '*'},
+    {'name': '$node1', 'path': '$node/node[@rel="su"]'},
+    {'name': '$node2', 'path': '$node/node[@rel="hd"]'},
+]
+INCLUDE_XPATH = 'node[@rel="hd" and @pt="ww"]'
+EXCLUDE_XPATH = 'node[@rel="su" and @cat="np"]'
+DATABASE = 'GRETEL5_TEST_TROONREDE_ID_TROONREDE1990'
+
+
+def _match_for_node(node, sentid: str) -> str:
+    """Return a match as BaseX returns it for the given node."""
+    tree = node.getroottree().getroot()
+    ids = node.xpath('descendant-or-self::node/@id')
+    begins = []
+    for begin in node.xpath('descendant-or-self::node/@begin'):
+        if begin not in begins:
+            begins.append(begin)
+    sentence = tree.findtext('sentence')
+    xml = etree.tostring(node, encoding='unicode', with_tail=False)
+    return '<match>{}||{}||{}||{}||{}||||||{}</match>'.format(
+        sentid, sentence, '-'.join(ids), '-'.join(begins), xml, DATABASE
+    )
+
+
+@pytest.fixture(scope='module')
+def template_matches():
+    path = settings.BASE_DIR / 'testdata' / 'TEST_TROONREDE' / 'COMPACT' / \
+        'troonrede1990.data.dz'
+    with gzip.open(path) as f:
+        documents = f.read().decode().split('<?xml version="1.0" '
+                                            'encoding="UTF-8"?>')
+    matches = []
+    for number, document in enumerate(x for x in documents if x.strip()):
+        tree = etree.fromstring(document)
+        sentid = 'troonrede1990.data.dz:{}'.format(number)
+        for node in tree.xpath(TEMPLATE_XPATH):
+            matches.append((sentid, _match_for_node(node, sentid)))
+    return matches
+
+
+def make_cache(template_matches, size: int) -> str:
+    """Return the contents of a cache file with size matches"""
+    return ''.join(
+        match.replace(sentid, '{}-{}'.format(sentid, i), 1)
+        for i, (sentid, match) in
+        enumerate(islice(cycle(template_matches), size))
+    )
+
+
+@pytest.fixture
+def cache(template_matches, size):
+    return make_cache(template_matches, size)
+
+
+@pytest.fixture
+def parsed_results(cache):
+    results = parse_search_result(cache, 'component')
+    for result in results:
+        result.tree  # Parse trees beforehand
+    return results
+
+
+def test_parse_search_result(benchmark, cache, size):
+    results = benchmark(parse_search_result, cache, 'component')
+    assert len(results) == size
+
+
+def test_augment_with_variables(benchmark, cache, size):
+    query = SearchQuery(xpath=TEMPLATE_XPATH, variables=VARIABLES)
+
+    def setup():
+        # augment_with_variables changes the trees, so use new ones
+        results = parse_search_result(cache, 'component')
+        for result in results:
+            result.tree
+        return (results,)
+
+    results = benchmark(
+        lambda results: list(query.augment_with_variables(results)),
+        setup=setup
+    )
+    assert len(results) == size
+    assert 'name="$node1"' in results[0].variables
+
+
+def test_filter_include(benchmark, parsed_results):
+    benchmark(lambda: list(filter_include(INCLUDE_XPATH, parsed_results)))
+
+
+def test_filter_exclude(benchmark, parsed_results):
+    benchmark(lambda: list(filter_exclude(EXCLUDE_XPATH, parsed_results)))
+
+
+def test_filter_expand(benchmark, parsed_results, size):
+    results = benchmark(lambda: list(filter_expand(parsed_results)))
+    assert len(results) == size
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('filtered', [False, True])
+def test_get_results(benchmark, settings, tmp_path, template_matches, size,
+                     filtered):
+    settings.CACHING_DIR = tmp_path
+    treebank = Treebank.objects.create(slug='benchmark', title='Benchmark')
+    query = SearchQuery(xpath=TEMPLATE_XPATH, variables=VARIABLES)
+    query.save()
+    # Divide matches over a number of components
+    number_of_components = 10
+    for i in range(number_of_components):
+        component = Component.objects.create(
+            slug='comp{}'.format(i), title='comp{}'.format(i),
+            nr_sentences=0, nr_words=0, treebank=treebank
+        )
+        BaseXDB.objects.create(dbname='BENCHMARK_{}'.format(i), size=100,
+                               component=component)
+        query.components.add(component)
+    query.initialize()
+    for i, csr in enumerate(query.results.all()):
+        matches = make_cache(template_matches, size // number_of_components)
+        encoded = matches.encode()
+        csr._get_cache_path().write_text(
+            cache_format.HEADER + matches +
+            cache_format.database_record(
+                'BENCHMARK_{}'.format(i), size // number_of_components,
+                len(encoded), zlib.crc32(encoded)) +
+            cache_format.complete_record(size // number_of_components,
+                                         size // number_of_components, 1)
+        )
+        csr.search_completed = timezone.now()
+        csr.completed_part = 100
+        csr.number_of_results = size // number_of_components
+        csr.save()
+    if filtered:
+        query.add_filter(partial(filter_include, INCLUDE_XPATH))
+    results, percentage, counts = benchmark(query.get_results)
+    assert percentage == 100
+    assert len(counts) == number_of_components
+
+
+def test_parse_metadata_count_result(benchmark, size):
+    # One count per match, divided over a number of metadata fields
+    rng = random.Random(size)
+    fields = 10
+    pieces = ['<metadata>']
+    for field in range(fields):
+        pieces.append('<meta name="field{}" type="text">'.format(field))
+        for value in range(max(1, size // fields)):
+            pieces.append('<count value="value{}">{}</count>'
+                          .format(value, rng.randint(1, 100)))
+        pieces.append('</meta>')
+    pieces.append('</metadata>')
+    totals = benchmark(parse_metadata_count_result, ''.join(pieces))
+    assert len(totals) == fields
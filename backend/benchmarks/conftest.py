@@ -0,0 +1,119 @@
+"""Fixtures for the offline benchmark suite. The benchmarks do not need
+BaseX or Alpino. Run them from the backend directory with:
+
+    pytest benchmarks/bench_search.py
+
+The suite is configured using the following environment variables:
+
+GRETEL_BENCHMARK_SIZES
+    Comma-separated list of numbers of matches to benchmark with
+    (default: 100,1000,10000; use e.g. 100,1000,10000,100000,1000000
+    for a full run)
+GRETEL_BENCHMARK_ROUNDS
+    Number of times every benchmark is timed; the fastest run is
+    reported (default: 3)
+GRETEL_BENCHMARK_SAVE
+    Path of a JSON file to write the results to
+GRETEL_BENCHMARK_COMPARE
+    Path of a JSON file written earlier with GRETEL_BENCHMARK_SAVE;
+    benchmarks fail if they are slower than the saved results by more
+    than GRETEL_BENCHMARK_TOLERANCE (default: 0.5, i.e. 50%)
+"""
+
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+
+SIZES = [int(x) for x in
+         os.environ.get('GRETEL_BENCHMARK_SIZES', '100,1000,10000').split(',')]
+ROUNDS = int(os.environ.get('GRETEL_BENCHMARK_ROUNDS', 3))
+TOLERANCE = float(os.environ.get('GRETEL_BENCHMARK_TOLERANCE', 0.5))
+
+_results = {}
+
+
+def _load_baseline():
+    path = os.environ.get('GRETEL_BENCHMARK_COMPARE')
+    if not path:
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+_baseline = _load_baseline()
+
+
+def pytest_generate_tests(metafunc):
+    if 'size' in metafunc.fixturenames:
+        metafunc.parametrize('size', SIZES)
+
+
+class Benchmark:
+    """Callable that runs a function a number of times and records the
+    fastest wall clock time and the peak memory usage. Peak memory is
+    measured in a separate run using tracemalloc, so that tracing does not
+    influence the timing. Note that tracemalloc only sees memory allocated
+    through Python, not memory allocated internally by lxml."""
+    def __init__(self, name: str):
+        self.name = name
+        self.stats = None
+
+    def __call__(self, func, *args, setup=None, **kwargs):
+        """Benchmark func with the given arguments. If setup is given, it
+        is called (untimed) before every run and its return value is used
+        as the arguments of func instead."""
+        durations = []
+        for _ in range(ROUNDS):
+            if setup is not None:
+                args = setup()
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            durations.append(time.perf_counter() - start)
+        if setup is not None:
+            args = setup()
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.stats = {'time': min(durations), 'peak_memory': peak}
+        _results[self.name] = self.stats
+        self._compare()
+        return result
+
+    def _compare(self):
+        baseline = _baseline.get(self.name)
+        if baseline is None:
+            return
+        if self.stats['time'] > baseline['time'] * (1 + TOLERANCE):
+            pytest.fail('{} took {:.4f}s, baseline is {:.4f}s'.format(
+                self.name, self.stats['time'], baseline['time']
+            ))
+
+
+@pytest.fixture
+def benchmark(request):
+    return Benchmark(request.node.name)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section('benchmarks')
+    width = max(len(name) for name in _results)
+    terminalreporter.write_line('{}  {:>12}  {:>14}'.format(
+        'name'.ljust(width), 'time (s)', 'peak mem (KiB)'
+    ))
+    for name, stats in _results.items():
+        terminalreporter.write_line('{}  {:>12.4f}  {:>14}'.format(
+            name.ljust(width), stats['time'], stats['peak_memory'] // 1024
+        ))
+    path = os.environ.get('GRETEL_BENCHMARK_SAVE')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(_results, f, indent=4)
+        terminalreporter.write_line('Results saved to {}'.format(path))
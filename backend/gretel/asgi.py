@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gretel.settings')
+# Serve searches, trees and metadata counts with async views
+os.environ.setdefault('GRETEL_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
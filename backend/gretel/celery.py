@@ -15,9 +15,20 @@ app.autodiscover_tasks()
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):
     sender.add_periodic_task(crontab(hour=3), purge_cache.s())
+    sender.add_periodic_task(crontab(hour=4, minute=0), purge_exports.s())
 
 
 @app.task
 def purge_cache():
-    from search.models import ComponentSearchResult
-    ComponentSearchResult.purge_cache()
+    from search.models import ComponentSearchResult, DatabaseCount
+    from search.tasks import schedule_warm_up
+    DatabaseCount.purge()
+    if ComponentSearchResult.purge_cache():
+        # Popular searches may have been deleted
+        schedule_warm_up()
+
+
+@app.task
+def purge_exports():
+    from search.models import SearchExport
+    return SearchExport.purge()
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from datetime import timedelta
+import logging
+
+import redis
+
+from search.models import ComponentSearchResult, SearchQuery
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _celery_queue_lengths():
+    '''Return a dict with the number of waiting tasks per Celery queue.
+    In the broker, every priority of a queue is a separate Redis list.'''
+    options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+    steps = options.get('priority_steps', [0])
+    try:
+        client = redis.Redis.from_url(settings.CELERY_BROKER_URL,
+                                      socket_timeout=0.5,
+                                      socket_connect_timeout=0.5)
+        pipeline = client.pipeline(transaction=False)
+        for queue in settings.METRICS_CELERY_QUEUES:
+            for step in steps:
+                pipeline.llen('{}{}{}'.format(queue, options['sep'], step)
+                              if step else queue)
+        lengths = pipeline.execute()
+        return {
+            queue: sum(lengths[i * len(steps):(i + 1) * len(steps)])
+            for i, queue in enumerate(settings.METRICS_CELERY_QUEUES)
+        }
+    except redis.RedisError as err:
+        logger.debug('Cannot get length of Celery queues: {}'.format(err))
+        return {}
+
+
+def _gauges():
+    '''Return the metrics that are computed when scraping, as tuples of
+    name, help text and value'''
+    cache = ComponentSearchResult.objects.aggregate(
+        size=Sum('cache_size'), entries=Count('id')
+    )
+    # Queries that were used during the last day (see purge_cache) and
+    # still have components that are being searched
+    active_queries = SearchQuery.objects.filter(
+        cancelled=False,
+        last_accessed__gte=timezone.now() - timedelta(days=1),
+        results__search_completed__isnull=True
+    ).distinct().count()
+    waiting_queries = SearchQuery.objects.filter(
+        cancelled=False, queued__isnull=False, started__isnull=True,
+        last_accessed__gte=timezone.now() - timedelta(days=1)
+    ).count()
+    gauges = [
+        ('gretel_cache_size_bytes',
+         'Total size of the search result cache', cache['size'] or 0),
+        ('gretel_cache_maximum_size_bytes',
+         'Size above which the search result cache is purged',
+         settings.MAXIMUM_CACHE_SIZE * 1024 * 1024),
+        ('gretel_cache_entries',
+         'Number of cached component search results', cache['entries']),
+        ('gretel_active_search_queries',
+         'Number of search queries that are not completed yet',
+         active_queries),
+        ('gretel_waiting_search_queries',
+         'Number of search queries that are waiting for a worker',
+         waiting_queries),
+    ]
+    for queue, length in _celery_queue_lengths().items():
+        gauges.append(('gretel_celery_queue_length{{queue="{}"}}'
+                       .format(queue),
+                       'Number of tasks waiting in a Celery queue', length))
+    return gauges
+
+
+@require_GET
+def metrics_view(request):
+    '''Export metrics in the Prometheus text format'''
+    return HttpResponse(metrics.render(_gauges()),
+                        content_type='text/plain; version=0.0.4')
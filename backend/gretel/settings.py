@@ -14,6 +14,8 @@ import os
 from pathlib import Path
 from typing import List
 
+from kombu import Queue
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -147,12 +149,87 @@ LOGGING = {
 
 # Celery settings
 CELERY_BROKER_URL = 'redis://' + os.getenv('REDIS_HOST', 'localhost')
+# Separate queues for searching, counting and uploading, so that workers
+# can be dedicated to one kind of work using the -Q option. Workers
+# started without -Q consume all queues.
+CELERY_TASK_QUEUES = [Queue('celery'), Queue('search'), Queue('count'),
+                      Queue('upload')]
+CELERY_TASK_ROUTES = {
+    'search.tasks.run_search_query': {'queue': 'search'},
+    'search.tasks.warm_up*': {'queue': 'search'},
+    'search.tasks.run_export': {'queue': 'search'},
+    'search.tasks.run_count*': {'queue': 'count'},
+    'upload.tasks.*': {'queue': 'upload'},
+}
+# Within each queue, tasks are taken by priority (0 is the highest); the
+# queues themselves are consumed in turn (round robin), so that one kind
+# of work cannot starve the others. Workers reserve only one task in
+# advance, so that the priority of tasks that are added later is respected.
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
+# Searches get a lower priority for every threshold (total size of the
+# searched databases in KiB) they exceed
+SEARCH_PRIORITY_THRESHOLDS = [10 * 1024, 100 * 1024, 1024 ** 2,
+                              10 * 1024 ** 2, 100 * 1024 ** 2]
+# Maximum number of searches that run concurrently for one user or session
+# (None for no limit). Other searches of the user are postponed by
+# SEARCH_ADMISSION_RETRY_DELAY seconds.
+SEARCH_MAX_CONCURRENT_PER_OWNER = 2
+SEARCH_ADMISSION_RETRY_DELAY = 5
+
+# Metrics settings. Metrics are stored in Redis so that they are shared
+# between the web server and the Celery workers, and can be scraped from
+# the /metrics endpoint in the Prometheus text format.
+METRICS_ENABLED = True
+METRICS_REDIS_URL = CELERY_BROKER_URL
+# Upper bounds in seconds of the buckets of the duration histograms
+METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                   10, 30, 60, 120, 300]
+# Celery queues of which the length is exported
+METRICS_CELERY_QUEUES = [queue.name for queue in CELERY_TASK_QUEUES]
 
 # BaseX connection settings - change in production
 BASEX_HOST = os.getenv('BASEX_HOST', 'localhost')
 BASEX_PORT = 1984
 BASEX_USER = 'admin'
 BASEX_PASSWORD = 'admin'
+# BaseX servers (nodes) by name. Every database is stored on one node
+# (see BaseXDB.node); uploaded databases are placed on the node with the
+# smallest total size of databases. Queries on databases for which no
+# node is known are sent to BASEX_DEFAULT_NODE. The node of every
+# database is cached in each process for BASEX_NODE_CACHE_TIMEOUT seconds.
+# A node can have read replicas with copies of its databases, e.g.
+# 'REPLICAS': [{'HOST': 'basex-replica', 'PORT': 1984}]; USER and PASSWORD
+# default to those of the node. Queries are sent to the least busy server
+# of the node and retried on another server if a server is unreachable;
+# such a server is avoided for BASEX_UNHEALTHY_TIMEOUT seconds. Databases
+# are created on the primary server only, so replicas have to be kept up
+# to date outside GrETEL.
+BASEX_NODES = {
+    'default': {
+        'HOST': BASEX_HOST,
+        'PORT': BASEX_PORT,
+        'USER': BASEX_USER,
+        'PASSWORD': BASEX_PASSWORD,
+    },
+}
+BASEX_DEFAULT_NODE = 'default'
+BASEX_NODE_CACHE_TIMEOUT = 60
+BASEX_UNHEALTHY_TIMEOUT = 30
+# Maximum number of queries of one component search that run at the same
+# time on one server of a node. Databases on different nodes are searched
+# in parallel.
+BASEX_SEARCH_QUERIES_PER_NODE = 1
+# Maximum number of BaseX sessions used concurrently for one task
+BASEX_MAX_CONCURRENT_QUERIES = 4
+# Use async views for searches, trees and metadata counts, so that a
+# process does not block while waiting for BaseX. Only useful when
+# running under ASGI, so this is enabled by gretel/asgi.py.
+ASYNC_VIEWS = os.getenv('GRETEL_ASYNC_VIEWS', '0') == '1'
 
 # Alpino connection settings
 # Provide ALPINO_HOST and ALPINO_PORT to use Alpino as a server. Provide
@@ -161,6 +238,14 @@ BASEX_PASSWORD = 'admin'
 ALPINO_HOST = os.getenv('ALPINO_HOST', 'localhost')
 ALPINO_PORT = 7001
 ALPINO_PATH = '/opt/Alpino'
+# Maximum number of sentences parsed concurrently by the Alpino server per
+# process, and the number of seconds a parse waits for others to finish
+ALPINO_MAX_CONCURRENT_PARSES = 4
+ALPINO_PARSE_WAIT_TIMEOUT = 30
+# Maximum number of sentences that can be parsed in one batch request
+MAXIMUM_PARSE_BATCH = 100
+# Maximum number of trees that can be retrieved in one batch request
+MAXIMUM_TREES_BATCH = 1000
 
 MAXIMUM_RESULTS = 500
 MAXIMUM_RESULTS_ANALYSIS = 5000
@@ -170,7 +255,60 @@ DELETE_COMPONENTS_FROM_BASEX = False
 
 MAXIMUM_RESULTS_PER_COMPONENT = 5000
 
+# Searches are stopped if they take longer than SEARCH_QUERY_TIMEOUT
+# seconds, or if they are not polled by the client for SEARCH_ABANDON_TIMEOUT
+# seconds. A search of a single BaseX database is stopped (and the search
+# continues with the next database) if it takes longer than
+# SEARCH_DATABASE_TIMEOUT seconds. Set to None to disable. These are checked
+# every SEARCH_WATCHDOG_INTERVAL seconds.
+SEARCH_QUERY_TIMEOUT = 60 * 60
+SEARCH_DATABASE_TIMEOUT = 10 * 60
+SEARCH_ABANDON_TIMEOUT = 5 * 60
+SEARCH_WATCHDOG_INTERVAL = 1
+# Only one worker at a time searches a component; others wait for it,
+# checking every SEARCH_LOCK_POLL_INTERVAL seconds. If the worker dies,
+# another one takes over after SEARCH_LOCK_TIMEOUT seconds.
+SEARCH_LOCK_TIMEOUT = 60
+SEARCH_LOCK_POLL_INTERVAL = 1
+
+# Searches of a single BaseX database taking longer than this number of
+# seconds are logged as SlowQuery, including the query plan. Set to None
+# to disable.
+SLOW_QUERY_THRESHOLD = 10
+
 CACHING_DIR = BASE_DIR / 'query_result_cache'
 MAXIMUM_CACHE_SIZE = 256  # Maximum cache size in MiB
+# Popular searches are precomputed with a low priority after the cache
+# has been emptied or purged and after a treebank has been uploaded. A
+# search is popular if it was performed at least WARMUP_MINIMUM_COUNT
+# times in the last WARMUP_HISTORY_DAYS days. At most
+# WARMUP_MAXIMUM_SEARCHES component searches are scheduled at once, which
+# are discarded if they have not started within WARMUP_MAXIMUM_DURATION
+# seconds. No searches are started if the cache is larger than
+# WARMUP_MAXIMUM_CACHE_FRACTION times its maximum size.
+WARMUP_ENABLED = True
+WARMUP_HISTORY_DAYS = 30
+WARMUP_MINIMUM_COUNT = 2
+WARMUP_MAXIMUM_SEARCHES = 100
+WARMUP_MAXIMUM_DURATION = 60 * 60
+WARMUP_MAXIMUM_CACHE_FRACTION = 0.5
+# Sentence trees are cached in memory by every process, up to
+# TREE_CACHE_SIZE MiB. Browsers and proxies may cache trees for
+# TREE_MAX_AGE seconds, after which they are revalidated using their ETag.
+TREE_CACHE_SIZE = 32
+TREE_MAX_AGE = 60 * 60
+# All results of a search can be exported. Exports are streamed directly,
+# unless the databases of the components are larger than
+# EXPORT_STREAMING_MAXIMUM_SIZE KiB in total, in which case a file is
+# written to EXPORT_DIR in the background. Exports are deleted daily by a
+# periodic task (or the purge_exports command) after EXPORT_MAX_AGE
+# seconds.
+EXPORT_STREAMING_MAXIMUM_SIZE = 512 * 1024
+EXPORT_DIR = BASE_DIR / 'exports'
+EXPORT_MAX_AGE = 7 * 24 * 60 * 60
+# Exact counts of an XPath per database are cached until the database
+# changes, and deleted together with the search cache (see purge_cache)
+# when they were made more than COUNT_CACHE_MAX_AGE seconds ago
+COUNT_CACHE_MAX_AGE = 30 * 24 * 60 * 60
 STATICFILES_DIRS: List[str] = []
 PROXY_FRONTEND = None
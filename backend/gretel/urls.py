@@ -4,6 +4,7 @@ from django.urls import include, path, re_path
 from django.views.generic.base import RedirectView
 
 from .index import index
+from .metrics import metrics_view
 from .proxy_frontend import proxy_frontend
 
 if settings.PROXY_FRONTEND:
@@ -18,6 +19,8 @@ urlpatterns = [
 
     path('mwe/', include('mwe.urls')),
 
+    path('metrics', metrics_view, name='metrics'),
+
     path('admin', RedirectView.as_view(url='/admin/', permanent=True)),
     path('admin/', admin.site.urls),
     spa_url,  # catch-all; unknown paths to be handled by a SPA
@@ -1,5 +1,8 @@
 from django.test import TestCase
 
+import json
+from unittest import mock
+
 from services.alpino import alpino, AlpinoError
 
 EXAMPLE_XML = '''<?xml version="1.0" encoding="UTF-8"?><alpino_ds
@@ -58,6 +61,74 @@ class ParseViewTestCase(TestCase):
             self.assertIn('error', response.json())
 
 
+class ParseBatchViewTestCase(TestCase):
+    def test_invalid_input(self):
+        for request_data in ({}, {'sentences': 'Dit is een zin.'},
+                             {'sentences': [1, 2]}):
+            response = self.client.post(
+                '/parse/parse-sentences/',
+                request_data,
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+        with self.settings(MAXIMUM_PARSE_BATCH=1):
+            response = self.client.post(
+                '/parse/parse-sentences/',
+                {'sentences': ['Dit is een zin.', 'Nog een zin.']},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_parse_batch_stream(self):
+        def parse_line(sentence, sentence_id):
+            if sentence == 'Fout.':
+                raise AlpinoError('cannot parse')
+            return '<alpino_ds><sentence>{}</sentence></alpino_ds>' \
+                .format(sentence)
+
+        sentences = ['Dit is een zin.', 'Fout.', 'Nog een zin.']
+        with mock.patch.object(alpino, 'initialize'), \
+                mock.patch.object(alpino, 'parse_line', parse_line):
+            response = self.client.post(
+                '/parse/parse-sentences/',
+                {'sentences': sentences},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'],
+                             'application/x-ndjson')
+            lines = [json.loads(line) for line in
+                     b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(line['index'] for line in lines), [0, 1, 2])
+        lines = {line['index']: line for line in lines}
+        self.assertEqual(lines[1], {'index': 1,
+                                    'error': 'Parsing error: cannot parse'})
+        for index in (0, 2):
+            self.assertEqual(lines[index], {
+                'index': index,
+                'parsed_sentence': '<alpino_ds><sentence>{}</sentence>'
+                                   '</alpino_ds>'.format(sentences[index])
+            })
+
+    def test_parse_batch_view(self):
+        try:
+            alpino.initialize()
+        except AlpinoError:
+            self.skipTest('need Alpino to run')
+        sentences = ['Dit is een zin.', 'Dit is nog een zin.']
+        response = self.client.post(
+            '/parse/parse-sentences/',
+            {'sentences': sentences},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in
+                 b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(x['index'] for x in lines), [0, 1])
+        for line in lines:
+            self.assertIn('parsed_sentence', line)
+
+
 class GenerateXPathViewTestCase(TestCase):
     def test_xpath_view(self):
         request_data = {
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import parse_view, generate_xpath_view
+from .views import parse_view, parse_batch_view, generate_xpath_view
 
 urlpatterns = [
     path('parse-sentence/', parse_view, name='parse-sentence'),
+    path('parse-sentences/', parse_batch_view, name='parse-sentences'),
     path('generate-xpath/', generate_xpath_view, name='generate-xpath'),
 ]
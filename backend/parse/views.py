@@ -1,3 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework.decorators import (
     api_view, parser_classes, renderer_classes, authentication_classes
@@ -29,7 +34,7 @@ def parse_view(request):
 
     try:
         alpino.initialize()
-        parsed_sentence = alpino.client.parse_line(sentence, 'zin')
+        parsed_sentence = alpino.parse_line(sentence, 'zin')
     except AlpinoError as err:
         return Response(
             {'error': 'Parsing error: {}'.format(err)},
@@ -38,6 +43,71 @@ def parse_view(request):
     return Response({'parsed_sentence': parsed_sentence})
 
 
+def _parse_sentences(sentences):
+    '''Generator parsing the given sentences concurrently (see
+    AlpinoService.parse_line), yielding a JSON line for every sentence as
+    soon as it has been parsed (so not necessarily in the original order).'''
+    executor = ThreadPoolExecutor(
+        max_workers=settings.ALPINO_MAX_CONCURRENT_PARSES)
+    futures = {
+        executor.submit(alpino.parse_line, sentence, 'zin'): index
+        for index, sentence in enumerate(sentences)
+    }
+    try:
+        for future in as_completed(futures):
+            line = {'index': futures[future]}
+            try:
+                line['parsed_sentence'] = future.result()
+            except AlpinoError as err:
+                line['error'] = 'Parsing error: {}'.format(err)
+            yield json.dumps(line) + '\n'
+    finally:
+        # Stop parsing if the client went away before we were done
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication])
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+@parser_classes([JSONParser])
+def parse_batch_view(request):
+    '''Parse a list of sentences. The parses are streamed back as JSON
+    lines containing the index of the sentence in the list and either
+    parsed_sentence or error, in the order in which they complete.'''
+    data = request.data
+    try:
+        sentences = data['sentences']
+    except KeyError as err:
+        return Response(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not isinstance(sentences, list) or \
+            not all(isinstance(x, str) for x in sentences):
+        return Response(
+            {'error': 'sentences should be a list of strings'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(sentences) > settings.MAXIMUM_PARSE_BATCH:
+        return Response(
+            {'error': 'At most {} sentences can be parsed at once'
+                      .format(settings.MAXIMUM_PARSE_BATCH)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        alpino.initialize()
+    except AlpinoError as err:
+        return Response(
+            {'error': 'Parsing error: {}'.format(err)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return StreamingHttpResponse(_parse_sentences(sentences),
+                                 content_type='application/x-ndjson')
+
+
 @api_view(['POST'])
 @authentication_classes([BasicAuthentication])
 @renderer_classes([JSONRenderer, BrowsableAPIRenderer])
@@ -4,7 +4,9 @@ from django.utils import formats
 
 import pprint
 
-from .models import ComponentSearchResult, SearchQuery, SearchError
+from .models import (ComponentSearchResult, SearchQuery, SearchError,
+                     SlowQuery)
+from .tasks import run_count_query
 
 
 @admin.action(description='Perform search')
@@ -13,8 +15,13 @@ def perform_search(modeladmin, request, queryset):
     errors = False
     for component_search in queryset:
         try:
-            component_search.perform_search()
-            if component_search.errors:
+            if not component_search.perform_search():
+                modeladmin.message_user(
+                    request,
+                    '{} is already being searched'.format(component_search),
+                    messages.WARNING
+                )
+            elif component_search.errors:
                 errors = True
         except SearchError:
             errors = True
@@ -31,7 +38,18 @@ def perform_search(modeladmin, request, queryset):
 @admin.action(description='Perform count')
 def perform_count(modeladmin, request, queryset):
     '''Admin action to perform a count on a search query, to check if
-    the frontend is returning all results'''
+    the frontend is returning all results. The count is performed by a
+    worker of the count queue, unless there is no message broker.'''
+    try:
+        for search_query in queryset:
+            run_count_query.delay(search_query.id)
+    except run_count_query.OperationalError:
+        pass
+    else:
+        modeladmin.message_user(request,
+                                'Count has been started. See the log of the '
+                                'Celery worker for the results.')
+        return
     total_count = 0
     for search_query in queryset:
         try:
@@ -51,13 +69,27 @@ def perform_count(modeladmin, request, queryset):
 
 @admin.register(SearchQuery)
 class SearchQueryAdmin(admin.ModelAdmin):
-    list_display = ['id', 'xpath', 'query_of', 'total_database_size']
-    readonly_fields = ['total_database_size']
+    list_display = ['id', 'xpath', 'query_of', 'total_database_size',
+                    'owner', 'queued', 'waiting_time', 'search_time']
+    readonly_fields = ['total_database_size', 'owner', 'queued', 'started',
+                       'finished']
     actions = [perform_count]
 
     def query_of(self, obj):
         return str(obj.components.all().first()) + ', …'
 
+    @admin.display(description='Waiting time')
+    def waiting_time(self, obj):
+        if obj.queued is None or obj.started is None:
+            return None
+        return obj.started - obj.queued
+
+    @admin.display(description='Search time')
+    def search_time(self, obj):
+        if obj.started is None or obj.finished is None:
+            return None
+        return obj.finished - obj.started
+
 
 @admin.register(ComponentSearchResult)
 class ComponentSearchResultAdmin(admin.ModelAdmin):
@@ -66,4 +98,17 @@ class ComponentSearchResultAdmin(admin.ModelAdmin):
     actions = [perform_search]
     readonly_fields = ['search_completed', 'last_accessed',
                        'number_of_results', 'errors', 'completed_part',
-                       'cache_size']
+                       'cache_size', 'timings']
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['created', 'xpath', 'database', 'duration',
+                    'number_of_results']
+    list_filter = ['created', 'component__treebank']
+    search_fields = ['xpath', 'database']
+    readonly_fields = ['xpath', 'shape', 'component', 'database', 'duration',
+                       'number_of_results', 'query_plan', 'created']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,230 @@
+"""Asynchronous versions of the views that wait for BaseX, used when
+running under ASGI (see settings.ASYNC_VIEWS). While BaseX is working, the
+process can serve other requests instead of blocking a worker thread."""
+import asyncio
+import functools
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.http import (
+    HttpResponseNotAllowed, HttpResponseNotModified, JsonResponse,
+    StreamingHttpResponse
+)
+from rest_framework import status
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from services.basex_async import async_basex
+from treebanks.models import SentenceLocation
+from .models import SearchExport
+from .basex_search import generate_xquery_context, parse_context_result
+from .timing import PhaseTimer
+from .types import ResultSet
+from .views import (
+    get_search_results, get_search_response, get_tree_request, TreesRequest,
+    get_metadata_count_queries, combine_metadata_counts, get_count_request,
+    get_export,
+    get_export_response, get_export_download_response
+)
+
+log = logging.getLogger(__name__)
+
+
+def _authenticate(request) -> None:
+    """Set request.user like the BasicAuthentication of the synchronous
+    views does"""
+    user_auth = BasicAuthentication().authenticate(request)
+    request.user = user_auth[0] if user_auth else AnonymousUser()
+
+
+def async_api_view(methods):
+    """Return a decorator for async views taking the request, its data
+    (the JSON body, or the query parameters of GET requests) and the
+    arguments of the URL and returning a JsonResponse, so that they
+    accept requests like the views using the Django Rest Framework"""
+    def decorator(view):
+        # The decorators of Django 4.2 (e.g. csrf_exempt) do not support
+        # async views, so their work is done here
+        @functools.wraps(view)
+        async def wrapper(request, **kwargs):
+            return await _handle(view, methods, request, kwargs)
+        wrapper.csrf_exempt = True  # No CSRF verification for now
+        return wrapper
+    return decorator
+
+
+async def _handle(view, methods, request, kwargs):
+    if request.method not in methods:
+        return HttpResponseNotAllowed(methods)
+    if request.method == 'GET':
+        data = request.GET
+    else:
+        try:
+            data = json.loads(request.body)
+        except ValueError as err:
+            return JsonResponse(
+                {'detail': 'JSON parse error - {}'.format(err)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+    try:
+        await sync_to_async(_authenticate)(request)
+    except AuthenticationFailed as err:
+        return JsonResponse({'detail': str(err.detail)},
+                            status=err.status_code)
+    try:
+        return await view(request, data, **kwargs)
+    except KeyError as err:
+        return JsonResponse(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as err:
+        return JsonResponse(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+
+async def _gather_limited(coroutines):
+    """Run coroutines concurrently, but at most
+    settings.BASEX_MAX_CONCURRENT_QUERIES at the same time, and return
+    their results"""
+    semaphore = asyncio.Semaphore(settings.BASEX_MAX_CONCURRENT_QUERIES)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def _augment_with_context(results: ResultSet) -> ResultSet:
+    """Fetch preceding and following sentences for results, like
+    SearchQuery.augment_with_context"""
+    pres = await sync_to_async(SentenceLocation.get_pres)(
+        [(result._match.database, result.context_id) for result in results])
+
+    async def fetch(result):
+        database = result._match.database
+        response = await async_basex.perform_query(
+            generate_xquery_context(
+                database, result.context_id,
+                pres.get((database, result.context_id))),
+            database=database
+        )
+        result.add_context(*parse_context_result(response))
+
+    await _gather_limited(fetch(result) for result in results)
+    return results
+
+
+@async_api_view(['POST'])
+async def search_view(request, data):
+    query, results, percentage, counts = \
+        await sync_to_async(get_search_results)(request, data)
+
+    timer = PhaseTimer()
+    if data.get('retrieveContext'):
+        with timer.phase('context'):
+            results = await _augment_with_context(results)
+
+    return JsonResponse(await sync_to_async(get_search_response)(
+        query, results, percentage, counts, timer
+    ))
+
+
+@async_api_view(['GET', 'POST'])
+async def tree_view(request, data):
+    tree_request = await sync_to_async(get_tree_request)(data)
+    headers = tree_request.get_headers()
+    if tree_request.is_not_modified(request):
+        return HttpResponseNotModified(headers=headers)
+    result = tree_request.get_cached()
+    if result is None:
+        try:
+            result = await async_basex.perform_query(
+                tree_request.xquery, database=tree_request.database)
+        except OSError as err:
+            return JsonResponse(
+                {'error': str(err)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        tree_request.cache(result)
+    return JsonResponse({'tree': result}, headers=headers)
+
+
+async def _fetch_trees(trees_request: TreesRequest):
+    for line in trees_request.get_cached_lines():
+        yield line
+    for database, xquery in trees_request.get_queries():
+        sentence_id = None
+        try:
+            # Every tree is preceded by its sentence id
+            async for _, item in async_basex.perform_query_iter(
+                    xquery, database=database):
+                if sentence_id is None:
+                    sentence_id = item
+                    continue
+                for line in trees_request.get_lines(database, sentence_id,
+                                                    item):
+                    yield line
+                sentence_id = None
+        except OSError as err:
+            log.error('Error in trees view: {}'.format(err))
+            error = 'BaseX error'
+        else:
+            error = 'Sentence not found'
+        for line in trees_request.get_missing_lines(database, error):
+            yield line
+
+
+@async_api_view(['POST'])
+async def trees_view(request, data):
+    trees_request = await sync_to_async(TreesRequest)(data)
+    return StreamingHttpResponse(_fetch_trees(trees_request),
+                                 content_type='application/x-ndjson')
+
+
+@async_api_view(['POST'])
+async def metadata_count_view(request, data):
+    queries = await sync_to_async(get_metadata_count_queries)(data)
+    try:
+        xml_counts = await _gather_limited(
+            async_basex.perform_query(xquery, database=db)
+            for db, xquery in queries
+        )
+    except OSError as err:
+        log.error('Error in metadata count view: {}'.format(err))
+        return JsonResponse(
+            {'error': 'BaseX search error'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    return JsonResponse(combine_metadata_counts(xml_counts))
+
+
+@async_api_view(['POST'])
+async def count_view(request, data):
+    count_request = await sync_to_async(get_count_request)(data)
+    return StreamingHttpResponse(count_request.aiter_lines(),
+                                 content_type='application/x-ndjson')
+
+
+@async_api_view(['POST'])
+async def export_view(request, data):
+    result_export = await sync_to_async(get_export)(request, data)
+    if isinstance(result_export, SearchExport):
+        return JsonResponse(result_export.get_status(),
+                            status=status.HTTP_202_ACCEPTED)
+    return get_export_response(result_export, result_export.aiter_lines())
+
+
+@async_api_view(['GET'])
+async def export_download_view(request, data, export_id):
+    search_export = await SearchExport.objects.filter(pk=export_id).afirst()
+    return get_export_download_response(
+        search_export, request.headers,
+        lambda download: download.aiter_chunks()
+    )
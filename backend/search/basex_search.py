@@ -1,9 +1,10 @@
 """Auxiliary functions to facilitate searching in BaseX."""
 
 import lxml.etree
+import re
 import string
 from io import StringIO
-from typing import List
+from typing import Dict, List, Optional, Tuple
 
 from .types import BaseXMatch, Result
 
@@ -110,6 +111,43 @@ def generate_xquery_search(basex_db: str, xpath: str, variables=None) -> str:
     return query
 
 
+def tag_xquery(query: str, tag: str) -> str:
+    """Return the query preceded by a comment containing tag, so that
+    the query can be found in the list of running jobs of BaseX."""
+    if not all(x in ALLOWED_VARNAME_CHARS for x in tag):
+        raise ValueError('Invalid tag: {}'.format(tag))
+    return '(: {} :) {}'.format(tag, query)
+
+
+def generate_xquery_stop(tag: str) -> str:
+    """Return XQuery string that stops all running queries that were
+    tagged with tag_xquery() and returns the number of stopped queries.
+    The tag is split so that this query does not match itself."""
+    if not all(x in ALLOWED_VARNAME_CHARS for x in tag) or len(tag) < 2:
+        raise ValueError('Invalid tag: {}'.format(tag))
+    return 'let $jobs := jobs:list-details()[' \
+           'contains(., "{}" || "{}") and @id != jobs:current()] ' \
+           'return (for $job in $jobs return jobs:stop($job/@id), ' \
+           'count($jobs))'.format(tag[:1], tag[1:])
+
+
+def generate_xquery_plan(query: str) -> str:
+    """Return XQuery string that compiles (but does not evaluate) a
+    query and returns the optimized query plan as XML."""
+    literal = query.replace('&', '&amp;').replace('"', '""')
+    return 'xquery:parse("{}", map {{ "compile": true(), "plan": true() }})' \
+        .format(literal)
+
+
+def xpath_shape(xpath: str) -> str:
+    """Return the XPath with string and number literals replaced by
+    placeholders and normalized whitespace, so that XPaths that only
+    differ in e.g. the lemmas they search for get the same shape."""
+    shape = re.sub(r'"[^"]*"|\'[^\']*\'', '"…"', xpath)
+    shape = re.sub(r'(?<![\w.$-])\d+(\.\d+)?(?![\w.-])', '0', shape)
+    return ' '.join(shape.split())
+
+
 def generate_xquery_count(basex_db: str, xpath: str) -> str:
     """Return XQuery string for use in BaseX to get the count of all
     occurances of a given XPath in a given BaseX database."""
@@ -119,6 +157,17 @@ def generate_xquery_count(basex_db: str, xpath: str) -> str:
         .format(basex_db, xpath)
 
 
+def generate_xquery_matching_trees(basex_db: str, xpath: str) -> str:
+    """Return XQuery string to get the trees of all sentences in a given
+    BaseX database containing an occurance of a given XPath, in the order
+    of the database. Every tree is returned once, even if the XPath
+    occurs in it more than once."""
+    if not check_db_name(basex_db) or not check_xpath(xpath):
+        raise ValueError('Incorrect database or malformed XPath given')
+    return '(db:open("{}")/treebank{})/ancestor::alpino_ds' \
+        .format(basex_db, xpath)
+
+
 def generate_xquery_metadata_count(basex_db: str, xpath: str) -> str:
     if not check_db_name(basex_db) or not check_xpath(xpath):
         raise ValueError('Incorrect database or malformed XPath given')
@@ -147,11 +196,75 @@ def generate_xquery_metadata_count(basex_db: str, xpath: str) -> str:
     return query
 
 
-def generate_xquery_showtree(basex_db: str, sentence_id: str) -> str:
+def _xquery_sentence(basex_db: str, sentence_id: str,
+                     pre: Optional[int] = None) -> str:
+    '''Return XQuery expression selecting the tree of a sentence. If its
+    pre value (see SentenceLocation) is given, the tree is accessed
+    directly. It is looked up by id if it is not found there, e.g.
+    because the database was changed after its pre values were stored.'''
+    by_id = 'db:open("' + basex_db + '")/treebank/alpino_ds[@id="' + \
+        sentence_id + '"]'
+    if pre is None:
+        return by_id
+    return '(let $tree := (try {{ db:open-pre("{}", {}) }} catch * {{ () }})' \
+        '[self::alpino_ds][@id="{}"] return if ($tree) then $tree else {})' \
+        .format(basex_db, int(pre), sentence_id, by_id)
+
+
+def generate_xquery_showtree(basex_db: str, sentence_id: str,
+                             pre: Optional[int] = None) -> str:
     if not check_db_name(basex_db) or '"' in sentence_id:
         raise ValueError('Incorrect database or malformed sentence ID given')
-    return 'db:open("' + basex_db + '")/treebank/alpino_ds[@id="' + \
-        sentence_id + '"]'
+    return _xquery_sentence(basex_db, sentence_id, pre)
+
+
+def generate_xquery_showtrees(basex_db: str, sentence_ids: List[str],
+                              pres: Optional[Dict[str, int]] = None) -> str:
+    '''Return XQuery to get the trees of several sentences of a database.
+    For every sentence found, its id and its tree are returned as two
+    separate items. pres optionally gives the pre values of sentences.'''
+    if not check_db_name(basex_db) or \
+            any('"' in sentence_id for sentence_id in sentence_ids):
+        raise ValueError('Incorrect database or malformed sentence ID given')
+    pres = pres or {}
+    trees = [_xquery_sentence(basex_db, sentence_id, pres[sentence_id])
+             for sentence_id in sentence_ids if sentence_id in pres]
+    ids = ', '.join('"{}"'.format(sentence_id)
+                    for sentence_id in sentence_ids
+                    if sentence_id not in pres)
+    if ids:
+        trees.append('db:open("' + basex_db + '")/treebank/alpino_ds['
+                     '@id = (' + ids + ')]')
+    return 'for $tree in (' + ', '.join(trees) + ') ' \
+        'return (string($tree/@id), $tree)'
+
+
+def generate_xquery_context(basex_db: str, sentence_id: str,
+                            pre: Optional[int] = None) -> str:
+    '''Return XQuery to get the preceding and following sentence of a
+    sentence, to be parsed with parse_context_result'''
+    if not check_db_name(basex_db) or '"' in sentence_id:
+        raise ValueError('Incorrect database or malformed sentence ID given')
+    return 'let $tree := ' + _xquery_sentence(basex_db, sentence_id, pre) + \
+        ' let $prevs := $tree/preceding-sibling::alpino_ds[1]/sentence ' \
+        'let $nexts := $tree/following-sibling::alpino_ds[1]/sentence ' \
+        'return <match>{data($prevs)}||{data($nexts)}</match>'
+
+
+def parse_context_result(result: str) -> Tuple[str, str]:
+    '''Return the preceding and following sentence from the result of
+    the query generated by generate_xquery_context'''
+    prevs, nexts = result.split('||')
+    return prevs.replace('<match>', ''), nexts.replace('</match>', '')
+
+
+def generate_xquery_sentence_locations(basex_db: str) -> str:
+    '''Return XQuery to get the id and the pre value (see db:node-pre) of
+    every sentence in a database, as two separate items per sentence'''
+    if not check_db_name(basex_db):
+        raise ValueError('Incorrect database name given')
+    return 'for $tree in db:open("' + basex_db + '")/treebank/alpino_ds ' \
+        'return (string($tree/@id), db:node-pre($tree))'
 
 
 def generate_xquery_count_words(basex_db: str) -> str:
@@ -178,6 +291,41 @@ def generate_xquery_get_version(basex_db: str) -> str:
         .format(basex_db)
 
 
+def generate_xquery_statistics(basex_db: str) -> str:
+    '''Return XQuery to get the size in bytes, number of words, number of
+    sentences and Alpino version of a database in one go. Words and
+    sentences are determined on the basis of the top nodes, as in
+    generate_xquery_count_words and generate_xquery_count_sentences.'''
+    if not check_db_name(basex_db):
+        raise ValueError('Incorrect database name given')
+    return f"""let $db := db:open("{basex_db}")
+               let $tops := $db//node[@cat="top"]
+               return element statistics {{
+                   attribute size {{db:property("{basex_db}", "size")}},
+                   attribute words {{sum($tops ! data(@end))}},
+                   attribute sentences {{count($tops)}},
+                   attribute version {{
+                       data($db/treebank/alpino_ds[1]/@version)
+                   }}
+               }}"""
+
+
+def parse_statistics_result(result_str: str) -> dict:
+    '''Convert the XML generated by BaseX according to the XQuery
+    generated by generate_xquery_statistics to a dictionary with the keys
+    size (in KiB), words, sentences and version.'''
+    try:
+        root = lxml.etree.fromstring(result_str)
+        return {
+            'size': int(int(root.get('size')) / 1024),
+            'words': int(root.get('words')),
+            'sentences': int(root.get('sentences')),
+            'version': root.get('version', ''),
+        }
+    except (lxml.etree.XMLSyntaxError, TypeError) as err:
+        raise ValueError('Error parsing statistics: {}'.format(err))
+
+
 def parse_search_result(result_str: str, component) -> List[Result]:
     """Parse the results returned by BaseX according to the searching
     XQuery generated by generate_xquery_search.
@@ -198,35 +346,51 @@ def parse_search_result(result_str: str, component) -> List[Result]:
         result = result.strip()
         if result == '':
             continue
-        if result.endswith('</match>'):
-            result = result[:-len('</match>')]
-        else:
-            raise ValueError('Cannot parse XQuery result: <match> '
-                             'is not closed in {}'.format(result))
-        splitted = result.split('||')
-        try:
-            (sentid, sentence, ids, begins, xml_sentences, meta,
-             variables, database) = splitted
-        except ValueError as err:
-            raise ValueError('Cannot parse XQuery result: {}'.format(err))
-        # Make sentid-s unique by appending a match index (there may be
-        # multiple matches per sentence)
-        # TODO: can we change this to something more comprehensible?
-        sentid = sentid + '+match=' + str(i)
-        matches.append(Result(BaseXMatch(
-            sentid=sentid,
-            sentence=sentence,
-            ids=ids,
-            begins=begins,
-            xml_sentences=xml_sentences,
-            meta=meta,
-            component=component,
-            database=database,
-        )))
+        matches.append(parse_search_match('<match>' + result, component, i))
         i += 1
     return matches
 
 
+def parse_search_match(match_str: str, component: str,
+                       number: int) -> Result:
+    """Parse a single match returned by the searching XQuery generated
+    by generate_xquery_search. number is the position of the match among
+    the matches of the component, which is used to make the sentence id
+    unique.
+
+    Raises:
+      ValueError: If the match cannot be parsed
+    """
+    result = match_str.strip()
+    if result.startswith('<match>'):
+        result = result[len('<match>'):]
+    if result.endswith('</match>'):
+        result = result[:-len('</match>')]
+    else:
+        raise ValueError('Cannot parse XQuery result: <match> '
+                         'is not closed in {}'.format(result))
+    splitted = result.split('||')
+    try:
+        (sentid, sentence, ids, begins, xml_sentences, meta,
+         variables, database) = splitted
+    except ValueError as err:
+        raise ValueError('Cannot parse XQuery result: {}'.format(err))
+    # Make sentid-s unique by appending a match index (there may be
+    # multiple matches per sentence)
+    # TODO: can we change this to something more comprehensible?
+    sentid = sentid + '+match=' + str(number)
+    return Result(BaseXMatch(
+        sentid=sentid,
+        sentence=sentence,
+        ids=ids,
+        begins=begins,
+        xml_sentences=xml_sentences,
+        meta=meta,
+        component=component,
+        database=database,
+    ))
+
+
 def parse_metadata_count_result(result_str: str) -> dict:
     '''Convert the XML generated by BaseX according to the XQuery
     generated by generate_xquery_metadata_count to a dictionary
@@ -0,0 +1,163 @@
+"""Format of the files in which the results of a component search are
+cached. A file starts with a header line, followed by the matches of
+every database (in the format of generate_xquery_search) each followed
+by a record with the number of matches, the number of bytes and the
+CRC-32 checksum of those matches. A file of a completed search ends with
+a record containing the totals. Records are XML comments on their own
+line, so that they are easy to recognize.
+
+While searching, results are written to a partial file that is renamed
+to the final name when the search is complete, so that a final file is
+always complete."""
+
+import re
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+VERSION = 1
+HEADER = '<!--gretel-cache version="{}"-->\n'.format(VERSION)
+RECORD_PATTERN = re.compile(r'\n<!--(database|complete)((?: \w+="[^"]*")*)-->\n')
+ATTRIBUTE_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+# Maximum length of the final record, used to read it in constant time
+MAXIMUM_COMPLETE_RECORD_LENGTH = 128
+# Number of characters read at once by iter_matches
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class CacheError(ValueError):
+    pass
+
+
+def _record(kind: str, **attributes) -> str:
+    return '\n<!--{}{}-->\n'.format(kind, ''.join(
+        ' {}="{}"'.format(name, value) for name, value in attributes.items()
+    ))
+
+
+def database_record(database: str, matches: int, length: int,
+                    checksum: int) -> str:
+    """Return the record to write after the matches of a database, given
+    the number of matches, their length in bytes and their CRC-32
+    checksum (see zlib.crc32)"""
+    return _record('database', name=database, matches=matches,
+                   bytes=length, crc32=checksum)
+
+
+def complete_record(matches: int, results: int, databases: int) -> str:
+    """Return the record to write at the end of a completed search, given
+    the number of matches in the file, the total number of results
+    (including those that were only counted) and the number of
+    databases"""
+    return _record('complete', matches=matches, results=results,
+                   databases=databases)
+
+
+def _parse_attributes(attributes: str) -> dict:
+    return {name: int(value) if value.isdigit() else value
+            for name, value in ATTRIBUTE_PATTERN.findall(attributes)}
+
+
+def parse(content: str, verify: bool = True) \
+        -> Tuple[str, List[dict], Optional[dict]]:
+    """Parse the contents of a cache file. Return a tuple of the matches
+    (without records), the database records and the complete record (None
+    if the search has not been completed). Matches after the last database
+    record, which belong to a database that is still being searched, are
+    included as far as they are complete. If verify is True, the lengths
+    and checksums of the matches of every database are checked.
+
+    Raises a CacheError if the file has an unknown format or if the
+    verification fails."""
+    if content == '':
+        # The search has not started yet
+        return '', [], None
+    if not content.startswith(HEADER):
+        raise CacheError('Cache file has an unknown format')
+    pieces = RECORD_PATTERN.split(content[len(HEADER):])
+    matches = []
+    databases = []
+    complete = None
+    # Pieces consist of data, followed by kind and attributes of a record,
+    # repeated, and ending with data
+    for i in range(0, len(pieces) - 1, 3):
+        data, kind, attributes = pieces[i:i + 3]
+        record = _parse_attributes(attributes)
+        if kind == 'complete':
+            if data or complete is not None:
+                raise CacheError('Unexpected data in cache file')
+            complete = record
+            continue
+        if verify:
+            encoded = data.encode()
+            if len(encoded) != record['bytes'] or \
+                    zlib.crc32(encoded) != record['crc32']:
+                raise CacheError('Results of database {} are corrupt'
+                                 .format(record['name']))
+        matches.append(data)
+        databases.append(record)
+    rest = pieces[-1]
+    if complete is not None:
+        if rest:
+            raise CacheError('Unexpected data in cache file')
+        if len(databases) != complete['databases']:
+            raise CacheError('Cache file is missing databases')
+    else:
+        # Remove the last match if it has not been written completely
+        end = rest.rfind('</match>')
+        matches.append(rest[:end + len('</match>')] if end != -1 else '')
+    return ''.join(matches), databases, complete
+
+
+def has_header(path) -> bool:
+    """Return True if the file at path exists and starts with the header
+    of the current format"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(HEADER)) == HEADER.encode()
+    except OSError:
+        return False
+
+
+def read_complete_record(path) -> Optional[dict]:
+    """Return the complete record of a cache file, without reading the
+    whole file, or None if the file is not a complete cache file"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(len(HEADER)) != HEADER.encode():
+                return None
+            f.seek(0, 2)
+            size = f.tell()
+            f.seek(max(len(HEADER), size - MAXIMUM_COMPLETE_RECORD_LENGTH))
+            tail = f.read().decode(errors='replace')
+    except OSError:
+        return None
+    start = tail.rfind('\n<!--complete ')
+    if start == -1:
+        return None
+    match = RECORD_PATTERN.fullmatch(tail[start:])
+    if match is None:
+        return None
+    return _parse_attributes(match.group(2))
+
+
+def iter_matches(path) -> Iterator[str]:
+    """Yield the matches of a cache file one by one, without reading the
+    whole file. Records are skipped and matches are not verified, so the
+    file should be checked with read_complete_record first."""
+    with open(path, encoding='utf-8') as f:
+        buffer = ''
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), ''):
+            buffer += chunk
+            start = buffer.find('<match>')
+            while start != -1:
+                end = buffer.find('</match>', start)
+                if end == -1:
+                    break
+                end += len('</match>')
+                yield buffer[start:end]
+                start = buffer.find('<match>', end)
+            if start == -1:
+                # Keep the end, which may be the start of the next match
+                buffer = buffer[-len('<match>'):]
+            else:
+                buffer = buffer[start:]
@@ -0,0 +1,188 @@
+"""Exact numbers of occurrences of an XPath per component, without
+retrieving any results. The databases of the components are counted
+concurrently, with at most settings.BASEX_SEARCH_QUERIES_PER_NODE queries
+per server of a BaseX node, and the count of every database is cached
+(see DatabaseCount). Counts are reported progressively as JSON lines with
+the count of a component so far, followed by a line with the total."""
+from django.conf import settings
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import logging
+import threading
+from typing import (AsyncIterator, Dict, Iterable, Iterator, List, Optional,
+                    Set, Tuple)
+
+from asgiref.sync import sync_to_async
+
+from services.basex import basex
+from services.basex_async import async_basex
+from treebanks.models import Component
+from .basex_search import check_xpath, generate_xquery_count
+from .models import DatabaseCount
+
+logger = logging.getLogger(__name__)
+
+
+class CountRequest:
+    """Count of an XPath in components. The cached counts and the nodes of
+    the databases are read on creation, so that counting does not access
+    the Django database except for caching the counts. If use_cache is
+    False, all databases are counted again."""
+
+    def __init__(self, xpath: str, components: Iterable[Component],
+                 use_cache: bool = True):
+        if not check_xpath(xpath):
+            raise ValueError('Malformed XPath given')
+        self.xpath = xpath
+        # Count so far and errors per component
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, str] = {}
+        # Databases of every component that have not been counted yet
+        self._remaining: Dict[str, Set[str]] = {}
+        # Component and primary key of every database
+        self._components: Dict[str, str] = {}
+        self._database_ids: Dict[str, int] = {}
+        for component in components:
+            self.counts[component.slug] = 0
+            self._remaining[component.slug] = set()
+            for database in component.databases.all():
+                self._remaining[component.slug].add(database.dbname)
+                self._components[database.dbname] = component.slug
+                self._database_ids[database.dbname] = database.pk
+        self._cached: Dict[str, int] = {}
+        if use_cache:
+            self._cached = dict(DatabaseCount.objects.filter(
+                xpath=xpath, database_id__in=self._database_ids.values()
+            ).values_list('database__dbname', 'count'))
+        for database, count in self._cached.items():
+            component = self._components[database]
+            self.counts[component] += count
+            self._remaining[component].discard(database)
+        # Database, node and XQuery of the databases to count
+        self.queries: List[Tuple[str, str, str]] = [
+            (database, basex.get_node(database),
+             generate_xquery_count(database, xpath))
+            for database in sorted(self._components)
+            if database not in self._cached
+        ]
+        per_server = settings.BASEX_SEARCH_QUERIES_PER_NODE
+        self._limits = {node: per_server * len(basex.get_servers(node))
+                        for node in set(node for _, node, _ in self.queries)}
+
+    def _get_line(self, component: str) -> str:
+        line = {
+            'component': component,
+            'count': self.counts[component],
+            'completed': not self._remaining[component],
+        }
+        if component in self.errors:
+            line['error'] = 'BaseX error'
+        return json.dumps(line) + '\n'
+
+    def get_cached_lines(self) -> List[str]:
+        """Return the lines of the components of which some databases have
+        been counted before, or that have no databases to count"""
+        reported = set(self._components[database]
+                       for database in self._cached)
+        return [self._get_line(component) for component in self.counts
+                if component in reported or not self._remaining[component]]
+
+    def add_count(self, database: str, count: int) -> str:
+        """Cache the count of a database and return the line of its
+        component"""
+        DatabaseCount.objects.update_or_create(
+            xpath=self.xpath, database_id=self._database_ids[database],
+            defaults={'count': count}
+        )
+        component = self._components[database]
+        self.counts[component] += count
+        self._remaining[component].discard(database)
+        return self._get_line(component)
+
+    def add_error(self, database: str, error: str) -> str:
+        logger.error('Error counting database {}: {}'.format(database, error))
+        component = self._components[database]
+        self.errors[component] = 'Cannot count database {}: {}' \
+            .format(database, error)
+        self._remaining[component].discard(database)
+        return self._get_line(component)
+
+    def get_total_line(self) -> str:
+        return json.dumps({
+            'total': sum(self.counts.values()),
+            'completed': not self.errors,
+        }) + '\n'
+
+    def _count_database(self, database: str, node: str, xquery: str,
+                        semaphore: threading.BoundedSemaphore) \
+            -> Tuple[str, Optional[int], Optional[str]]:
+        """Count a database and return its name with the count or the
+        error. This method is run in a separate thread, so it should not
+        access the Django database."""
+        try:
+            with semaphore:
+                return database, int(basex.perform_query(xquery,
+                                                         node=node)), None
+        except (OSError, ValueError) as err:
+            return database, None, str(err)
+
+    def iter_lines(self) -> Iterator[str]:
+        """Count the databases that have not been counted before and yield
+        the lines of their components as soon as they are counted"""
+        yield from self.get_cached_lines()
+        semaphores = {node: threading.BoundedSemaphore(limit)
+                      for node, limit in self._limits.items()}
+        executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(self._limits.values())))
+        try:
+            futures = [
+                executor.submit(self._count_database, database, node,
+                                xquery, semaphores[node])
+                for database, node, xquery in self.queries
+            ]
+            for future in as_completed(futures):
+                database, count, error = future.result()
+                if error is None:
+                    yield self.add_count(database, count)
+                else:
+                    yield self.add_error(database, error)
+        finally:
+            # Stop counting if the client has gone
+            executor.shutdown(wait=True, cancel_futures=True)
+        yield self.get_total_line()
+
+    async def _acount_database(self, database: str, node: str, xquery: str,
+                               semaphore: asyncio.Semaphore) \
+            -> Tuple[str, Optional[int], Optional[str]]:
+        try:
+            async with semaphore:
+                return database, int(await async_basex.perform_query(
+                    xquery, node=node)), None
+        except (OSError, ValueError) as err:
+            return database, None, str(err)
+
+    async def aiter_lines(self) -> AsyncIterator[str]:
+        """Asynchronous version of iter_lines"""
+        for line in self.get_cached_lines():
+            yield line
+        semaphores = {node: asyncio.Semaphore(limit)
+                      for node, limit in self._limits.items()}
+        tasks = [
+            asyncio.ensure_future(self._acount_database(
+                database, node, xquery, semaphores[node]))
+            for database, node, xquery in self.queries
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                database, count, error = await task
+                if error is None:
+                    yield await sync_to_async(self.add_count)(database,
+                                                              count)
+                else:
+                    yield self.add_error(database, error)
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield self.get_total_line()
@@ -0,0 +1,334 @@
+"""Export of all results of a search, without the limits of the search
+views (settings.MAXIMUM_RESULTS and MAXIMUM_RESULTS_PER_COMPONENT). The
+matches of a component are read from its cache file if the search of the
+component has been completed without leaving out any matches, and
+directly from BaseX otherwise. Matches are read and formatted one at a
+time, so that exports of any size take constant memory. Exports of large
+components are written to a file by a background task (see
+SearchExport) instead of being streamed to the client."""
+from django.db.models import Sum
+from django.utils import timezone
+
+import csv
+import json
+import logging
+import os
+import re
+from itertools import islice
+from typing import (AsyncIterator, Iterable, Iterator, List, NamedTuple,
+                    Optional, Tuple)
+
+from asgiref.sync import sync_to_async
+
+from services.basex import basex
+from services.basex_async import async_basex
+from treebanks.models import Component
+from . import cache
+from .basex_search import (check_xpath, generate_xquery_for_variables,
+                           generate_xquery_search,
+                           generate_xquery_matching_trees,
+                           parse_search_match)
+from .models import ComponentSearchResult, SearchExport, SearchQuery
+
+logger = logging.getLogger(__name__)
+
+# Content type and file extension per format
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'tsv': ('text/tab-separated-values', 'tsv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+    'xml': ('application/xml', 'xml'),
+}
+# Fields of the results written to CSV, TSV and JSON Lines exports
+FIELDS = ['component', 'database', 'sentid', 'sentence', 'ids', 'begins',
+          'xml_sentences', 'meta', 'variables']
+# Number of cached matches read at once by the asynchronous export
+CACHE_BATCH_SIZE = 100
+# Number of bytes sent at once when downloading an export file
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def check_export(xpath: str, variables: list, format_: str) -> None:
+    """Raise ValueError if an export cannot be performed, so that this
+    is known before anything is streamed or scheduled"""
+    if format_ not in FORMATS:
+        raise ValueError('Unknown export format: {}'.format(format_))
+    if not check_xpath(xpath):
+        raise ValueError('Malformed XPath given')
+    generate_xquery_for_variables(variables)
+
+
+class _Echo:
+    """File-like object of which write() returns the written value, to
+    get the lines of a csv.writer"""
+    def write(self, value: str) -> str:
+        return value
+
+
+class ComponentSource(NamedTuple):
+    component: str
+    # Cache file with all matches of the component, if any
+    cache_path: Optional[str]
+    # Databases and XQueries to get the items from BaseX otherwise
+    queries: List[tuple]
+
+
+class ResultExport:
+    """Export of the results of an XPath in components, in one of FORMATS.
+    Which components are read from the cache and which from BaseX is
+    determined on creation, so that the lines can be generated without
+    accessing the Django database (e.g. asynchronously)."""
+
+    def __init__(self, xpath: str, variables: list, format_: str,
+                 components: Iterable[Component]):
+        check_export(xpath, variables, format_)
+        self.xpath = xpath
+        self.variables = variables
+        self.format = format_
+        self.content_type, self.extension = FORMATS[format_]
+        self.number_of_results = 0
+        # Variables are computed like for the search view
+        self._query = SearchQuery(xpath=xpath, variables=variables)
+        self._writer = csv.writer(
+            _Echo(), delimiter='\t' if format_ == 'tsv' else ',')
+        self.sources = [self._get_source(component)
+                        for component in components]
+
+    def _get_source(self, component: Component) -> ComponentSource:
+        databases = sorted(component.get_databases())
+        if self.format == 'xml':
+            # Trees are not cached
+            return ComponentSource(component.slug, None, [
+                (database,
+                 generate_xquery_matching_trees(database, self.xpath))
+                for database in databases
+            ])
+        result_obj = ComponentSearchResult.objects.filter(
+            xpath=self.xpath, component=component, variables=self.variables,
+            search_completed__isnull=False, errors=''
+        ).first()
+        if result_obj is not None and result_obj.is_valid():
+            path = result_obj._get_cache_path()
+            record = cache.read_complete_record(path)
+            # Only use the cache if no matches have been left out because
+            # of settings.MAXIMUM_RESULTS_PER_COMPONENT
+            if record is not None and record['matches'] == \
+                    record['results'] == result_obj.number_of_results:
+                return ComponentSource(component.slug, str(path), [])
+        return ComponentSource(component.slug, None, [
+            (database, generate_xquery_search(database, self.xpath))
+            for database in databases
+        ])
+
+    @property
+    def filename(self) -> str:
+        return 'gretel-export.{}'.format(self.extension)
+
+    def get_header(self) -> str:
+        """Return what precedes the results, which may be empty"""
+        if self.format == 'xml':
+            return '<?xml version="1.0" encoding="UTF-8"?>\n<treebank>\n'
+        if self.format == 'jsonl':
+            return ''
+        return self._writer.writerow(FIELDS)
+
+    def get_footer(self) -> str:
+        """Return what follows the results, which may be empty"""
+        if self.format == 'xml':
+            return '</treebank>\n'
+        return ''
+
+    def get_line(self, component: str, number: int, item: str) -> str:
+        """Return the line for the item returned by BaseX or read from
+        the cache, which is the number-th of the component"""
+        self.number_of_results += 1
+        if self.format == 'xml':
+            return item + '\n'
+        result = parse_search_match(item, component, number)
+        if self.variables:
+            self._query.augment_with_variables([result])
+        result_dict = result.as_dict()
+        if self.format == 'jsonl':
+            return json.dumps({field: result_dict[field]
+                               for field in FIELDS}) + '\n'
+        return self._writer.writerow([result_dict[field]
+                                      for field in FIELDS])
+
+    def _iter_items(self, source: ComponentSource) -> Iterator[str]:
+        if source.cache_path is not None:
+            yield from cache.iter_matches(source.cache_path)
+            return
+        for database, xquery in source.queries:
+            for _, item in basex.perform_query_iter(xquery,
+                                                    database=database):
+                yield item
+
+    def iter_lines(self) -> Iterator[str]:
+        if self.get_header():
+            yield self.get_header()
+        for source in self.sources:
+            items = self._iter_items(source)
+            for number, item in enumerate(items, start=1):
+                yield self.get_line(source.component, number, item)
+        if self.get_footer():
+            yield self.get_footer()
+
+    async def _aiter_items(self,
+                           source: ComponentSource) -> AsyncIterator[str]:
+        if source.cache_path is not None:
+            matches = cache.iter_matches(source.cache_path)
+            read_batch = sync_to_async(
+                lambda: list(islice(matches, CACHE_BATCH_SIZE)))
+            batch = await read_batch()
+            while batch:
+                for match in batch:
+                    yield match
+                batch = await read_batch()
+            return
+        for database, xquery in source.queries:
+            async for _, item in async_basex.perform_query_iter(
+                    xquery, database=database):
+                yield item
+
+    async def aiter_lines(self) -> AsyncIterator[str]:
+        """Asynchronous version of iter_lines"""
+        if self.get_header():
+            yield self.get_header()
+        for source in self.sources:
+            number = 0
+            async for item in self._aiter_items(source):
+                number += 1
+                yield self.get_line(source.component, number, item)
+        if self.get_footer():
+            yield self.get_footer()
+
+
+def get_database_size(components: Iterable[Component]) -> int:
+    """Return the total size in KiB of the databases of components"""
+    return Component.objects.filter(pk__in=[c.pk for c in components]) \
+        .aggregate(size=Sum('databases__size'))['size'] or 0
+
+
+def write_export(export: SearchExport) -> None:
+    """Write all results of an export to its file. The file is written
+    under a temporary name and renamed when completed, so that a
+    completed export file can be downloaded while it exists."""
+    result_export = ResultExport(export.xpath, export.variables,
+                                 export.format, export.components.all())
+    partial_path = export.get_partial_path()
+    try:
+        with open(partial_path, 'w', encoding='utf-8', newline='') as f:
+            for line in result_export.iter_lines():
+                f.write(line)
+        os.replace(partial_path, export.get_path())
+    except (OSError, UnicodeDecodeError, ValueError) as err:
+        logger.error('Export {} failed: {}'.format(export.id, err))
+        partial_path.unlink(missing_ok=True)
+        export.errors = str(err)
+    else:
+        export.size = export.get_path().stat().st_size
+    export.number_of_results = result_export.number_of_results
+    export.finished = timezone.now()
+    export.save(update_fields=['number_of_results', 'size', 'errors',
+                               'finished'])
+
+
+def parse_range(header: Optional[str],
+                size: int) -> Optional[Tuple[int, int]]:
+    """Return the first and last byte requested by the Range header of a
+    request for a file of size bytes, or None if the whole file should be
+    sent. Only a single byte range is supported; other ranges are
+    ignored, as allowed by RFC 7233. Raise ValueError if the range cannot
+    be satisfied."""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # The last bytes of the file
+        if int(last) == 0 or size == 0:
+            raise ValueError('Requested range not satisfiable')
+        return max(0, size - int(last)), size - 1
+    last = size - 1 if last == '' else min(int(last), size - 1)
+    if int(first) > last:
+        if int(first) >= size:
+            raise ValueError('Requested range not satisfiable')
+        return None
+    return int(first), last
+
+
+class ExportDownload(NamedTuple):
+    """(Part of) the file of a completed SearchExport to be sent"""
+    path: str
+    filename: str
+    content_type: str
+    etag: str
+    size: int
+    range: Optional[Tuple[int, int]]
+
+    @property
+    def status(self) -> int:
+        return 200 if self.range is None else 206
+
+    def get_headers(self) -> dict:
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'Content-Disposition':
+                'attachment; filename="{}"'.format(self.filename),
+            'ETag': self.etag,
+        }
+        if self.range is None:
+            headers['Content-Length'] = str(self.size)
+        else:
+            first, last = self.range
+            headers['Content-Length'] = str(last - first + 1)
+            headers['Content-Range'] = 'bytes {}-{}/{}'.format(
+                first, last, self.size)
+        return headers
+
+    def _get_span(self) -> Tuple[int, int]:
+        if self.range is None:
+            return 0, self.size
+        first, last = self.range
+        return first, last - first + 1
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        start, remaining = self._get_span()
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            while remaining > 0:
+                chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    async def aiter_chunks(self) -> AsyncIterator[bytes]:
+        chunks = self.iter_chunks()
+        read_chunk = sync_to_async(lambda: next(chunks, None))
+        chunk = await read_chunk()
+        while chunk is not None:
+            yield chunk
+            chunk = await read_chunk()
+
+
+def get_export_download(search_export: SearchExport,
+                        headers) -> ExportDownload:
+    """Return the download of a completed export, honouring the Range
+    and If-Range request headers. Raise ValueError if the requested range
+    cannot be satisfied."""
+    etag = '"{}"'.format(search_export.id)
+    range_header = headers.get('Range')
+    if_range = headers.get('If-Range')
+    if if_range is not None and if_range != etag:
+        # The client has a different file, so it should get all of it
+        range_header = None
+    content_type, extension = FORMATS[search_export.format]
+    return ExportDownload(
+        path=str(search_export.get_path()),
+        filename='gretel-export.{}'.format(extension),
+        content_type=content_type,
+        etag=etag,
+        size=search_export.size,
+        range=parse_range(range_header, search_export.size)
+    )
@@ -1,18 +1,61 @@
 from django.core.management.base import BaseCommand, CommandError
 from search.models import ComponentSearchResult, SearchError
+from search.tasks import schedule_warm_up
+from treebanks.models import BaseXDB
 
 
 class Command(BaseCommand):
-    help = 'Delete all component search results to avoid problems ' \
-           'concerning compatibility with older GrETEL versions ' \
-           'after an upgrade'
+    help = 'Delete the component search results that were cached in an ' \
+           'older format or computed from BaseX databases that have ' \
+           'changed since, e.g. after an upgrade'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='delete all component search results'
+        )
+        parser.add_argument(
+            '--refresh', action='store_true',
+            help='first read the size and Alpino version of all databases '
+                 'from BaseX, to detect databases that were changed '
+                 'outside GrETEL'
+        )
+        parser.add_argument(
+            '--no-warm-up', action='store_false', dest='warm_up',
+            help='do not schedule precomputation of popular searches'
+        )
+
+    def refresh(self):
+        for database in BaseXDB.objects.all():
+            try:
+                size = database.get_db_size()
+                alpino_version = database.get_alpino_version()
+            except (OSError, ValueError) as err:
+                self.stdout.write(self.style.WARNING(
+                    'Cannot read database {}: {}'.format(database, err)
+                ))
+                continue
+            if (size, alpino_version) != \
+                    (database.size, database.alpino_version):
+                database.size = size
+                database.alpino_version = alpino_version
+                # Saving invalidates the results of the component
+                database.save()
+                self.stdout.write('Database {} has changed'.format(database))
 
     def handle(self, *args, **kwargs):
         try:
-            count = ComponentSearchResult.empty_cache()
+            if kwargs['all']:
+                count = ComponentSearchResult.empty_cache()
+            else:
+                if kwargs['refresh']:
+                    self.refresh()
+                count = ComponentSearchResult.invalidate_cache()
         except SearchError as err:
             raise CommandError(str(err))
         self.stdout.write(self.style.SUCCESS(
             '{} cached component search results deleted'
             .format(count)
         ))
+        if kwargs['warm_up']:
+            schedule_warm_up()
@@ -1,13 +1,24 @@
 from django.core.management.base import BaseCommand, CommandError
-from search.models import ComponentSearchResult, SearchError
+from search.models import ComponentSearchResult, DatabaseCount, SearchError
+from search.tasks import schedule_warm_up
 
 
 class Command(BaseCommand):
     help = 'Delete component search results that have the earliest ' \
-           'last use date to make space'
+           'last use date to make space, and database counts that were ' \
+           'made more than COUNT_CACHE_MAX_AGE seconds ago'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-warm-up', action='store_false', dest='warm_up',
+            help='do not schedule precomputation of popular searches'
+        )
 
     def handle(self, *args, **kwargs):
+        DatabaseCount.purge()
         try:
-            ComponentSearchResult.purge_cache()
+            count = ComponentSearchResult.purge_cache()
         except SearchError as err:
             raise CommandError(str(err))
+        if count and kwargs['warm_up']:
+            schedule_warm_up()
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from search.models import SearchExport
+
+
+class Command(BaseCommand):
+    help = 'Delete exports of search results that were created more ' \
+           'than EXPORT_MAX_AGE seconds ago, including their files'
+
+    def handle(self, *args, **kwargs):
+        count = SearchExport.purge()
+        self.stdout.write(self.style.SUCCESS(
+            '{} expired exports deleted'.format(count)
+        ))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from datetime import timedelta
+
+from search.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = 'Show the XPath shapes (XPaths without literals) of the slow ' \
+           'queries that took most time, to find out which kinds of ' \
+           'queries should be optimized'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='only use slow queries of the last DAYS '
+                                 'days')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='number of shapes to show')
+        parser.add_argument('--order-by', default='total',
+                            choices=['total', 'maximum', 'count'],
+                            help='order by total duration, maximum '
+                                 'duration or number of slow queries')
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1:
+            raise CommandError('--limit should be at least 1')
+        queries = SlowQuery.objects.all()
+        if options['days'] is not None:
+            queries = queries.filter(
+                created__gte=timezone.now() - timedelta(days=options['days'])
+            )
+        shapes = queries.values('shape').annotate(
+            count=Count('id'),
+            total=Sum('duration'),
+            maximum=Max('duration'),
+            average=Avg('duration'),
+            databases=Count('database', distinct=True),
+            xpaths=Count('xpath', distinct=True),
+        ).order_by('-' + options['order_by'])[:options['limit']]
+        if not shapes:
+            self.stdout.write(self.style.WARNING('No slow queries logged.'))
+            return
+        self.stdout.write('{:>6} {:>10} {:>9} {:>9} {:>9} {:>6}  {}'.format(
+            'count', 'total (s)', 'max (s)', 'avg (s)', 'databases',
+            'xpaths', 'shape'
+        ))
+        for shape in shapes:
+            self.stdout.write(
+                '{count:>6} {total:>10.1f} {maximum:>9.1f} {average:>9.1f} '
+                '{databases:>9} {xpaths:>6}  {shape}'.format(**shape)
+            )
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from search.tasks import warm_up_cache
+from search.warmup import get_popular_searches, warm_up
+from treebanks.models import Treebank
+
+
+class Command(BaseCommand):
+    help = 'Precompute the results of popular searches that are not ' \
+           'cached, e.g. after deploying a new version'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--treebank', default=None,
+                            help='combine popular XPaths with the '
+                                 'components of this treebank')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='maximum number of component searches '
+                                 '(default: WARMUP_MAXIMUM_SEARCHES)')
+        parser.add_argument('--list', action='store_true',
+                            help='only show the searches that would be '
+                                 'performed')
+        parser.add_argument('--now', action='store_true',
+                            help='search in this process instead of '
+                                 'scheduling background tasks')
+
+    def handle(self, *args, **options):
+        components = None
+        if options['treebank'] is not None:
+            try:
+                components = Treebank.objects.get(
+                    slug=options['treebank']).components.all()
+            except Treebank.DoesNotExist:
+                raise CommandError('Treebank {} does not exist'
+                                   .format(options['treebank']))
+        if not options['list'] and not options['now']:
+            if options['limit'] is not None:
+                raise CommandError('--limit can only be used together with '
+                                   '--list or --now')
+            component_ids = None if components is None \
+                else [component.pk for component in components]
+            try:
+                warm_up_cache.delay(component_ids)
+            except warm_up_cache.OperationalError as err:
+                raise CommandError('Cannot schedule warm-up: {}. Use --now '
+                                   'to search in this process.'.format(err))
+            self.stdout.write(self.style.SUCCESS('Warm-up scheduled'))
+            return
+        searches = get_popular_searches(components, options['limit'])
+        if not searches:
+            self.stdout.write(self.style.WARNING(
+                'No popular searches to warm up.'))
+            return
+        for search in searches:
+            self.stdout.write('{:>6} {:>10}  {}'.format(
+                search.count, search.component_id, search.xpath))
+            if options['now']:
+                warm_up(search)
+        if options['now']:
+            self.stdout.write(self.style.SUCCESS(
+                'Warmed up {} searches'.format(len(searches))))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0005_remove_componentsearchresult_results_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='timings',
+            field=models.JSONField(default=dict, editable=False, help_text='Time in seconds spent per phase and per database during the last search'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0005_remove_component_contains_metadata_and_more'),
+        ('search', '0006_componentsearchresult_timings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('xpath', models.TextField()),
+                ('shape', models.TextField(db_index=True, editable=False, help_text='XPath without literals, to group similar XPaths')),
+                ('database', models.CharField(max_length=255)),
+                ('duration', models.FloatField(help_text='Duration in seconds')),
+                ('number_of_results', models.PositiveIntegerField()),
+                ('query_plan', models.TextField(blank=True, help_text='Query plan of the search XQuery as optimized by BaseX')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('component', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='treebanks.component')),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+    ]
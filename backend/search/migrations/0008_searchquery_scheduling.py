@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0007_slowquery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='searchquery',
+            name='finished',
+            field=models.DateTimeField(editable=False, help_text='Time at which the worker finished the search', null=True),
+        ),
+        migrations.AddField(
+            model_name='searchquery',
+            name='owner',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='User or session that started the query, used to limit the number of concurrent searches per user', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='searchquery',
+            name='queued',
+            field=models.DateTimeField(editable=False, help_text='Time at which the search was added to the queue', null=True),
+        ),
+        migrations.AddField(
+            model_name='searchquery',
+            name='started',
+            field=models.DateTimeField(editable=False, help_text='Time at which a worker started the search', null=True),
+        ),
+    ]
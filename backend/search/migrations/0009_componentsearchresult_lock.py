@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0008_searchquery_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='locked_by',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='locked_until',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+    ]
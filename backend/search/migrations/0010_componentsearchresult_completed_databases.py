@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0009_componentsearchresult_lock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='completed_databases',
+            field=models.JSONField(default=list, editable=False, help_text='Checkpoints of the databases that have been searched, used to resume an interrupted search: name, number of results and size of the cache file after the results of the database'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0010_componentsearchresult_completed_databases'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='cache_version',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='componentsearchresult',
+            name='database_versions',
+            field=models.JSONField(default=dict, editable=False, help_text='Size and Alpino version of every database at the time of the search'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:38
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0009_sentencelocation'),
+        ('search', '0011_componentsearchresult_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchExport',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('xpath', models.TextField()),
+                ('variables', models.JSONField(blank=True, default=list)),
+                ('format', models.CharField(choices=[('csv', 'CSV'), ('tsv', 'TSV'), ('jsonl', 'JSON Lines'), ('xml', 'Alpino XML')], max_length=8)),
+                ('owner', models.CharField(blank=True, db_index=True, editable=False, help_text='User or session that requested the export', max_length=100)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(editable=False, help_text='Time at which the export file was completed', null=True)),
+                ('number_of_results', models.PositiveIntegerField(editable=False, null=True)),
+                ('size', models.PositiveBigIntegerField(editable=False, help_text='Size of the export file in bytes', null=True)),
+                ('errors', models.TextField(default='', editable=False)),
+                ('components', models.ManyToManyField(to='treebanks.component')),
+            ],
+        ),
+    ]
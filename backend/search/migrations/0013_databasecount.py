@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0009_sentencelocation'),
+        ('search', '0012_searchexport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatabaseCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('xpath', models.TextField()),
+                ('count', models.PositiveBigIntegerField()),
+                ('counted', models.DateTimeField(auto_now=True)),
+                ('database', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='treebanks.basexdb')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='databasecount',
+            constraint=models.UniqueConstraint(fields=('xpath', 'database'), name='databasecount_uniqueness'),
+        ),
+    ]
@@ -1,25 +1,43 @@
 from django.db import models
 from django.utils import timezone
-from django.db.models import F, Sum
+from django.db.models import F, Q, Sum
 from django.conf import settings
-from django.db.models.signals import pre_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import closing
 from copy import deepcopy
+from itertools import islice
 import logging
 import os
 import pathlib
 import re
+import threading
+import time
+import uuid
+import zlib
 from datetime import timedelta
-from typing import List, Tuple, Iterable, Optional, Set
+from typing import Deque, Dict, List, Tuple, Iterable, Optional, Set
 from lxml import etree
 
-from treebanks.models import Component
+from treebanks.models import BaseXDB, Component, SentenceLocation
 from services.basex import basex
+from services.metrics import metrics
+from . import cache
 from .basex_search import (generate_xquery_search,
                            parse_search_result,
-                           generate_xquery_count)
+                           generate_xquery_count,
+                           generate_xquery_plan,
+                           generate_xquery_context,
+                           parse_context_result,
+                           tag_xquery,
+                           xpath_shape)
+from .timing import PhaseTimer, log_timings
+from .tree_cache import tree_cache
 from .types import ResultSet, Result, ResultSetFilter
+from .watchdog import SearchWatchdog, ABANDONED, TIMED_OUT
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +46,58 @@ class SearchError(RuntimeError):
     pass
 
 
+class SlowQuery(models.Model):
+    """A search of one BaseX database that took longer than
+    settings.SLOW_QUERY_THRESHOLD seconds."""
+    xpath = models.TextField()
+    shape = models.TextField(
+        db_index=True, editable=False,
+        help_text='XPath without literals, to group similar XPaths'
+    )
+    component = models.ForeignKey(Component, null=True,
+                                  on_delete=models.SET_NULL)
+    database = models.CharField(max_length=255)
+    duration = models.FloatField(help_text='Duration in seconds')
+    number_of_results = models.PositiveIntegerField()
+    query_plan = models.TextField(
+        blank=True,
+        help_text='Query plan of the search XQuery as optimized by BaseX'
+    )
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return '"{}…" on {} ({:.1f} s)'.format(self.xpath[:10],
+                                               self.database, self.duration)
+
+    @classmethod
+    def record(cls, xpath: str, component: Optional[Component],
+               database: str, duration: float,
+               number_of_results: int) -> Optional['SlowQuery']:
+        """Save a SlowQuery if duration exceeds the threshold, including
+        the query plan retrieved from BaseX. Return the object if it
+        was saved."""
+        threshold = settings.SLOW_QUERY_THRESHOLD
+        if threshold is None or duration < threshold:
+            return None
+        try:
+            query_plan = basex.perform_query(generate_xquery_plan(
+                generate_xquery_search(database, xpath)
+            ), database=database)
+        except (OSError, UnicodeDecodeError, ValueError) as err:
+            logger.warning('Could not get query plan: {}'.format(err))
+            query_plan = ''
+        logger.warning('Slow query on database {} ({:.1f} s): {}'
+                       .format(database, duration, xpath))
+        return cls.objects.create(
+            xpath=xpath, shape=xpath_shape(xpath), component=component,
+            database=database, duration=duration,
+            number_of_results=number_of_results, query_plan=query_plan
+        )
+
+
 class ComponentSearchResult(models.Model):
     xpath = models.TextField()
     component = models.ForeignKey(Component, on_delete=models.CASCADE)
@@ -44,6 +114,29 @@ class ComponentSearchResult(models.Model):
         help_text='Total size in KiB of databases for which the search has '
                   'been completed'
     )
+    timings = models.JSONField(
+        default=dict, editable=False,
+        help_text='Time in seconds spent per phase and per database during '
+                  'the last search'
+    )
+    completed_databases = models.JSONField(
+        default=list, editable=False,
+        help_text='Checkpoints of the databases that have been searched, '
+                  'used to resume an interrupted search: name, number of '
+                  'results and size of the cache file after the results '
+                  'of the database'
+    )
+    # Format of the cache file and databases from which the results were
+    # computed, used to invalidate results selectively
+    cache_version = models.PositiveIntegerField(null=True, editable=False)
+    database_versions = models.JSONField(
+        default=dict, editable=False,
+        help_text='Size and Alpino version of every database at the time '
+                  'of the search'
+    )
+    # Lock that makes sure that only one process searches the component
+    locked_by = models.CharField(max_length=32, blank=True, editable=False)
+    locked_until = models.DateTimeField(null=True, editable=False)
 
     class Meta:
         constraints = [
@@ -55,29 +148,74 @@ class ComponentSearchResult(models.Model):
         return '"{}…" for {}'.format(self.xpath[:10], self.component)
 
     def _get_cache_path(self) -> pathlib.Path:
-        """Get the Path of the caching file corresponding to this ComponentSearchResult."""
+        """Get the Path of the caching file corresponding to this ComponentSearchResult.
+        This file only exists if the search has been completed."""
         settings.CACHING_DIR.mkdir(exist_ok=True, parents=True)
         return settings.CACHING_DIR / str(self.id)
 
-    def check_results(self) -> bool:
-        try:
-            self.get_results()
-            return True
-        except Exception:
-            logger.exception('Failed reading results of ComponentSearchQuery: %d', self.pk)
-
-        return False
+    def _get_partial_cache_path(self) -> pathlib.Path:
+        """Get the Path of the caching file to which results are written
+        while searching"""
+        settings.CACHING_DIR.mkdir(exist_ok=True, parents=True)
+        return settings.CACHING_DIR / '{}.partial'.format(self.id)
 
-    def get_results(self) -> ResultSet:
-        """Return results as a dict"""
-        results = self._get_cache_path().read_text()
-        self.last_accessed = timezone.now()
-        # This method may be called from multiple processes while the query is still
-        # running. If we save the entire model, we will overwrite the progress
-        # that other processes may have saved (e.g. search_completed) in case our copy
-        # of the model was not refreshed in the meantime.
-        self.save(update_fields=['last_accessed'])
-        return parse_search_result(results, self.component.slug)
+    def check_results(self) -> bool:
+        """Check if the cached results can be read, without reading them
+        entirely: a completed search should have a cache file with a
+        matching complete record."""
+        if self.search_completed is None:
+            path = self._get_partial_cache_path()
+            return not path.exists() or cache.has_header(path)
+        record = cache.read_complete_record(self._get_cache_path())
+        if record is None or \
+                record.get('results') != self.number_of_results:
+            logger.error('Failed reading results of ComponentSearchQuery: %d',
+                         self.pk)
+            return False
+        return True
+
+    def _read_cache(self) -> str:
+        """Return the contents of the cache file, or of the partial cache
+        file if the search has not been completed"""
+        # The partial file may be renamed while we are trying to read it,
+        # in which case the final file exists
+        for path in (self._get_cache_path(), self._get_partial_cache_path(),
+                     self._get_cache_path()):
+            try:
+                # Results may be read while they are being written, so the
+                # last character may not be written completely
+                return path.read_text(encoding='utf-8', errors='replace')
+            except FileNotFoundError:
+                continue
+        return ''
+
+    def get_results(self, update_last_accessed: bool = True,
+                    timer: Optional[PhaseTimer] = None) -> ResultSet:
+        """Return results as a dict. If update_last_accessed is False,
+        the caller is responsible for updating the last accessed date.
+        If a timer is given, the time spent reading and parsing the cache
+        is added to it. If the cache file is corrupt or has an older
+        format, the results are invalidated (so that the component is
+        searched again) and no results are returned."""
+        if timer is None:
+            timer = PhaseTimer()
+        with timer.phase('cache_read'):
+            try:
+                results, _, _ = cache.parse(self._read_cache())
+            except cache.CacheError as err:
+                logger.error('Cannot read results of ComponentSearchResult '
+                             '{}: {}'.format(self.pk, err))
+                self.invalidate()
+                return []
+        if update_last_accessed:
+            self.last_accessed = timezone.now()
+            # This method may be called from multiple processes while the query is still
+            # running. If we save the entire model, we will overwrite the progress
+            # that other processes may have saved (e.g. search_completed) in case our copy
+            # of the model was not refreshed in the meantime.
+            self.save(update_fields=['last_accessed'])
+        with timer.phase('parse'):
+            return parse_search_result(results, self.component.slug)
 
     def get_completed_part(self) -> Optional[int]:
         if self.check_results():
@@ -89,109 +227,428 @@ class ComponentSearchResult(models.Model):
         start_of_nth_match = matches[number].span()[0]
         return results[:start_of_nth_match]
 
-    def _was_query_cancelled(self, query_id):
-        """Check if a SearchQuery object was cancelled. We get this
-        immediately from the database, because this operation has to
-        be frequently repeated."""
-        return SearchQuery.objects.values_list(
-            'cancelled', flat=True
-        ).get(id=query_id)
-
-    def perform_search(self, query_id=None):
+    def _fetch_database(self, database: str, node: str, maximum_to_add: int,
+                        watchdog: SearchWatchdog) -> dict:
+        """Search one database and return a dict with at most
+        maximum_to_add matches, the total number of results (which are
+        counted separately if there are more) and the time spent per
+        phase. If searching fails, the error is returned instead. This
+        method is run in a separate thread for every BaseX node, so it
+        should not access the Django database."""
+        timer = PhaseTimer()
+        start = time.perf_counter()
+        fetched = {'matches': [], 'results': 0, 'error': None,
+                   'timed_out': False, 'timer': timer}
+        tag = None
+        try:
+            if watchdog.stopped:
+                raise SearchError('Search was stopped')
+            did_break = False
+            if maximum_to_add > 0:
+                tag = watchdog.new_tag()
+                query = tag_xquery(generate_xquery_search(database, self.xpath),
+                                   tag)
+                with watchdog.running(tag, node):
+                    result = basex.perform_query_iter(query, node=node)
+                    for _, entry in timer.iterate(result, 'basex', 'transfer'):
+                        if len(fetched['matches']) >= maximum_to_add:
+                            # no need to read the rest of the results,
+                            # but we do need to run a separate count query
+                            # if we want an accurate count
+                            did_break = True
+                            break
+                        fetched['matches'].append(entry)
+                    if did_break:
+                        # Close the generator now, so that the BaseX session
+                        # is closed while the watchdog can still stop it
+                        result.close()
+            if maximum_to_add <= 0 or did_break:
+                # The maximum number of results per component has been
+                # reached. From now on only count the number of results,
+                # which is somewhat faster
+                tag = watchdog.new_tag()
+                fetched['results'] = self._count_database(database, node, tag,
+                                                          timer, watchdog)
+            else:
+                fetched['results'] = len(fetched['matches'])
+        except (OSError, UnicodeDecodeError, ValueError, SearchError) as err:
+            fetched['matches'] = []
+            fetched['error'] = err
+            fetched['timed_out'] = tag is not None and watchdog.timed_out(tag)
+        fetched['duration'] = round(time.perf_counter() - start, 6)
+        return fetched
+
+    def _count_database(self, database: str, node: str, tag: str,
+                        timer: PhaseTimer, watchdog: SearchWatchdog) -> int:
+        query = tag_xquery(generate_xquery_count(database, self.xpath), tag)
+        with watchdog.running(tag, node), timer.phase('count'):
+            return int(basex.perform_query(query, node=node))
+
+    def _fetch_databases(self, databases: List[str],
+                         watchdog: SearchWatchdog):
+        """Search the given databases and yield their names with the
+        result of _fetch_database, in order. Databases on different BaseX
+        nodes are searched in parallel, with at most
+        settings.BASEX_SEARCH_QUERIES_PER_NODE queries per server of a
+        node. The databases that are searched ahead are limited, to limit
+        the number of matches kept in memory."""
+        nodes = {database: basex.get_node(database) for database in databases}
+        per_server = settings.BASEX_SEARCH_QUERIES_PER_NODE
+        limits = {node: per_server * len(basex.get_servers(node))
+                  for node in set(nodes.values())}
+        semaphores = {node: threading.BoundedSemaphore(limit)
+                      for node, limit in limits.items()}
+        workers = max(1, sum(limits.values()))
+
+        def fetch(database: str, maximum_to_add: int) -> dict:
+            with semaphores[nodes[database]]:
+                return self._fetch_database(database, nodes[database],
+                                            maximum_to_add, watchdog)
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            queue: Deque[Tuple[str, Future]] = deque()
+            remaining = iter(databases)
+            while True:
+                # The results of databases that are being searched are
+                # not known yet, so the maximum number of matches is based
+                # on the databases that have been processed
+                maximum_to_add = settings.MAXIMUM_RESULTS_PER_COMPONENT - \
+                    self.number_of_results
+                for database in islice(remaining, 2 * workers - len(queue)):
+                    queue.append((database, executor.submit(
+                        fetch, database, maximum_to_add)))
+                if not queue:
+                    return
+                database, future = queue.popleft()
+                yield database, future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _acquire_lock(self, token: str) -> bool:
+        """Try to lock this object for searching and return True if
+        successful. The lock expires after settings.SEARCH_LOCK_TIMEOUT
+        seconds unless it is renewed."""
+        now = timezone.now()
+        locked_until = now + timedelta(seconds=settings.SEARCH_LOCK_TIMEOUT)
+        acquired = ComponentSearchResult.objects.filter(pk=self.pk).filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+        ).update(locked_by=token, locked_until=locked_until)
+        if acquired:
+            self.locked_by = token
+            self.locked_until = locked_until
+        return bool(acquired)
+
+    def _renew_lock(self, token: str) -> None:
+        locked_until = timezone.now() + \
+            timedelta(seconds=settings.SEARCH_LOCK_TIMEOUT)
+        # Also change the attribute, because the object is saved during
+        # the search
+        self.locked_until = locked_until
+        ComponentSearchResult.objects.filter(pk=self.pk, locked_by=token) \
+            .update(locked_until=locked_until)
+
+    def _release_lock(self, token: str) -> None:
+        self.locked_by = ''
+        self.locked_until = None
+        ComponentSearchResult.objects.filter(pk=self.pk, locked_by=token) \
+            .update(locked_by='', locked_until=None)
+
+    def perform_search(self, query_id=None,
+                       watchdog: Optional[SearchWatchdog] = None) -> bool:
         """Perform full component search and regularly update database
         with the progress so far. Saves the object if it has no value
         for its id. Most errors are written to the model's errors
         attribute, but a SearchError is raised if checks at the beginning
-        are failing."""
+        are failing. The time spent per phase and per database is stored
+        in the timings attribute.
+
+        Only one process at a time searches a component. If another
+        process is already searching, nothing is done and False is
+        returned; the results of the other process can be read while it
+        is searching. Otherwise True is returned.
+
+        The running BaseX query is stopped if the search takes too long
+        or if the SearchQuery with id query_id is cancelled or abandoned;
+        see SearchWatchdog. A watchdog that is already running may be
+        passed to share it with other searches."""
         if not self.id:
             # Save, because we need the id for the caching file
             self.save()
-        # Get BaseX databases belonging to component
-        databases_with_size = self.component.get_databases()
-        # Initialize variables
-        self.results = ''
-        self.errors = ''
-        self.completed_part = 0
-        self.number_of_results = 0
-        # Open cache file
+        token = uuid.uuid4().hex
+        if not self._acquire_lock(token):
+            return False
+        own_watchdog = watchdog is None
+        if watchdog is None:
+            watchdog = SearchWatchdog(query_id)
+            watchdog.start()
+        try:
+            with watchdog.heartbeat(lambda: self._renew_lock(token),
+                                    settings.SEARCH_LOCK_TIMEOUT / 3):
+                self._perform_search(watchdog)
+        finally:
+            self._release_lock(token)
+            if own_watchdog:
+                watchdog.finish()
+        return True
+
+    def _get_checkpoints(self, database_versions: dict) -> List[dict]:
+        """Return the checkpoints of an interrupted search that can be
+        resumed, or an empty list if the search has to start from the
+        beginning"""
+        if self.search_completed is not None or not self.completed_databases:
+            return []
+        if self.cache_version != cache.VERSION or \
+                self.database_versions != database_versions:
+            # Databases have been changed in the meantime
+            return []
         try:
-            resultsfile = self._get_cache_path().open(mode='w')
+            cache_size = self._get_partial_cache_path().stat().st_size
+        except OSError:
+            return []
+        if cache_size < self.completed_databases[-1]['offset']:
+            return []
+        return list(self.completed_databases)
+
+    def _open_cache_file(self, checkpoints: List[dict]):
+        """Open the partial cache file for appending. If the search is
+        resumed, results written after the last checkpoint are removed.
+        Otherwise the file is started with a header and previous results
+        are deleted."""
+        path = self._get_partial_cache_path()
+        try:
+            if checkpoints:
+                os.truncate(path, checkpoints[-1]['offset'])
+            else:
+                self._get_cache_path().unlink(missing_ok=True)
+                path.write_text(cache.HEADER, encoding='utf-8')
+            return path.open(mode='a', encoding='utf-8')
         except OSError:
             raise SearchError('Could not open caching file')
+
+    def _perform_search(self, watchdog: SearchWatchdog):
+        # Get BaseX databases belonging to component
+        database_versions = self.component.get_database_versions()
+        databases_with_size = {database: version['size'] for database, version
+                               in database_versions.items()}
+        # Read the progress, which may have been changed by another process
+        # before the lock was acquired
+        self.refresh_from_db(fields=['search_completed', 'completed_part',
+                                     'number_of_results', 'errors',
+                                     'completed_databases', 'cache_version',
+                                     'database_versions'])
+        checkpoints = self._get_checkpoints(database_versions)
+        if checkpoints:
+            logger.info('Resuming search of ComponentSearchResult {} after '
+                        '{} of {} databases'.format(self.id, len(checkpoints),
+                                                    len(databases_with_size)))
+        else:
+            # Initialize variables
+            self.search_completed = None
+            self.errors = ''
+            self.completed_part = 0
+            self.number_of_results = 0
+            self.cache_version = cache.VERSION
+            self.database_versions = database_versions
+            self.completed_databases = []
+            # Results that were completed before (but have become invalid)
+            # are replaced, so let other processes know before the cache
+            # file is deleted
+            self.save(update_fields=[
+                'search_completed', 'errors', 'completed_part',
+                'number_of_results', 'cache_version', 'database_versions',
+                'completed_databases'
+            ])
+        self.completed_databases = list(checkpoints)
+        completed = {checkpoint['database'] for checkpoint in checkpoints}
+        # Offset in bytes of the end of the last database in the cache file
+        offset = checkpoints[-1]['offset'] if checkpoints \
+            else len(cache.HEADER.encode())
+        matches_in_file = sum(checkpoint['matches']
+                              for checkpoint in checkpoints)
+        self.results = ''
+        timer = PhaseTimer()
+        database_timings = []
+        search_start = time.perf_counter()
+        # Open cache file
+        resultsfile = self._open_cache_file(checkpoints)
         try:
-            with resultsfile:
-                cancelled = False
-                did_break = False
+            fetched_databases = self._fetch_databases(
+                [database for database in databases_with_size
+                 if database not in completed], watchdog
+            )
+            with resultsfile, closing(fetched_databases):
                 # Go through all BaseX databases
-                for database in databases_with_size:
+                for database, fetched in fetched_databases:
                     size = databases_with_size[database]
-                    # Check how many results we can still add to the cache file,
-                    # respecting the maximum number of results per component
-                    maximum_to_add = \
-                        settings.MAXIMUM_RESULTS_PER_COMPONENT - \
-                        self.number_of_results
-                    if maximum_to_add > 0:
-                        # We can still add, so perform a search on this database
-                        try:
-                            query = generate_xquery_search(
-                                database, self.xpath
-                            )
-                            result = basex.perform_query_iter(query)
-                        except (OSError, UnicodeDecodeError, ValueError) as err:
+                    timer.merge(fetched['timer'])
+                    database_timing = {'database': database, 'results': 0,
+                                       'bytes': 0,
+                                       'duration': fetched['duration']}
+                    # Matches written to the cache file
+                    written, length, checksum = 0, 0, 0
+                    if fetched['error'] is not None:
+                        if watchdog.stopped:
+                            # The query was stopped by the watchdog
+                            break
+                        if fetched['timed_out']:
+                            self.errors += 'Searching database {} took ' \
+                                'more than {} seconds\n'.format(
+                                    database,
+                                    settings.SEARCH_DATABASE_TIMEOUT)
+                        else:
                             self.errors += 'Error searching database {}: ' \
-                                .format(database) + str(err) + '\n'
-                            result = []  # No break, keep going
-
-                        results_for_database = 0
-                        for _, entry in result:
-                            if results_for_database > maximum_to_add:
-                                # no need to read the rest of the results,
-                                # but we do need to run a separate count query if we
-                                # want an accurate count
-                                did_break = True
-                                break
-                            results_for_database += 1
-                            resultsfile.write(entry)
-
-                        if not did_break:
-                            self.number_of_results += results_for_database
-
-                    if maximum_to_add <= 0 or did_break:
-                        # The maximum number of results per component has been
-                        # reached. From now on only count the number of results,
-                        # which is somewhat faster
-                        query = generate_xquery_count(database, self.xpath)
-                        try:
-                            count = int(basex.perform_query(query))
-                        except (OSError, UnicodeDecodeError, ValueError) as err:
-                            self.errors += 'Error searching database {}: ' \
-                                .format(database) + str(err) + '\n'
-                            count = 0
-                        self.number_of_results += count
+                                .format(database) + str(fetched['error']) + \
+                                '\n'
+                    else:
+                        # Check how many results we can still add to the
+                        # cache file, respecting the maximum number of
+                        # results per component
+                        maximum_to_add = \
+                            settings.MAXIMUM_RESULTS_PER_COMPONENT - \
+                            self.number_of_results
+                        matches = fetched['matches'][:max(0, maximum_to_add)]
+                        with timer.phase('cache_write'):
+                            data = ''.join(matches)
+                            encoded = data.encode()
+                            written = len(matches)
+                            length = len(encoded)
+                            checksum = zlib.crc32(encoded)
+                            resultsfile.write(data)
+                        self.number_of_results += fetched['results']
+                        database_timing['results'] = fetched['results']
+                        database_timing['bytes'] = length
+                    database_timings.append(database_timing)
+                    SlowQuery.record(self.xpath, self.component, database,
+                                     database_timing['duration'],
+                                     database_timing['results'])
                     self.completed_part += size
-                    self.save()
-                    if query_id is not None and self._was_query_cancelled(query_id):
-                        cancelled = True
+                    with timer.phase('progress_save'):
+                        record = cache.database_record(database, written,
+                                                       length, checksum)
+                        resultsfile.write(record)
+                        offset += length + len(record.encode())
+                        matches_in_file += written
+                        # Make sure the results are on disk before the
+                        # checkpoint is saved
+                        resultsfile.flush()
+                        os.fsync(resultsfile.fileno())
+                        self.completed_databases.append({
+                            'database': database,
+                            'results': database_timing['results'],
+                            'matches': written,
+                            'offset': offset,
+                        })
+                        self.save()
+                    if watchdog.stopped:
                         break
-            self.cache_size = self._get_cache_path().stat().st_size
-            if not cancelled:
+                if not watchdog.stopped:
+                    resultsfile.write(cache.complete_record(
+                        matches_in_file, self.number_of_results,
+                        len(self.completed_databases)
+                    ))
+                    resultsfile.flush()
+                    os.fsync(resultsfile.fileno())
+            if watchdog.stopped:
+                # Remove the results of the database that was being
+                # searched when the search was stopped
+                os.truncate(self._get_partial_cache_path(), offset)
+                self.cache_size = offset
+                if watchdog.reason == TIMED_OUT:
+                    self.errors += 'Search took more than {} seconds\n' \
+                        .format(settings.SEARCH_QUERY_TIMEOUT)
+            else:
+                # Publish the results at once, so that the cache file is
+                # always complete
+                os.replace(self._get_partial_cache_path(),
+                           self._get_cache_path())
+                self.cache_size = self._get_cache_path().stat().st_size
                 self.search_completed = timezone.now()
         except Exception as err:
             self.errors += f'Error searching: ${err}\n'
         self.last_accessed = timezone.now()
+        self.timings = {
+            'total': round(time.perf_counter() - search_start, 6),
+            'phases': timer.as_dict(),
+            'databases': database_timings,
+            'resumed_after': len(checkpoints),
+        }
         self.save()
-
-    def init_cache_file(self):
-        self._get_cache_path().touch()
+        metrics.observe('gretel_search_duration_seconds',
+                        self.timings['total'])
+        metrics.observe_phases(timer.phases)
+        log_timings(logger, 'Search timings for ComponentSearchResult {}'
+                    .format(self.id),
+                    dict(self.timings, component=str(self.component),
+                         xpath=self.xpath))
 
     def delete_cache_file(self):
-        """Delete the cache file belonging to this ComponentSearchResult.
+        """Delete the cache files belonging to this ComponentSearchResult.
         This method is called automatically on delete."""
-        cache_path = self._get_cache_path()
-        cache_path.unlink(missing_ok=True)
+        self._get_cache_path().unlink(missing_ok=True)
+        self._get_partial_cache_path().unlink(missing_ok=True)
         logger.info('Deleted cache for ComponentSearchResult with ID {}.'
                     .format(self.id))
 
+    def is_valid(self, database_versions: Optional[dict] = None) -> bool:
+        """Return False if the results were cached in an older format or
+        computed from databases that have been changed, added or removed
+        since. database_versions may be given to avoid fetching the
+        databases of the component."""
+        if self.completed_part is None:
+            # Search has not started yet
+            return True
+        if database_versions is None:
+            database_versions = self.component.get_database_versions()
+        return self.cache_version == cache.VERSION and \
+            self.database_versions == database_versions
+
+    def invalidate(self) -> bool:
+        """Delete the cached results, so that the component is searched
+        again when the results are requested. Nothing is done if another
+        process is searching the component; return True if the results
+        were deleted."""
+        token = uuid.uuid4().hex
+        if not self._acquire_lock(token):
+            return False
+        try:
+            self.delete_cache_file()
+            self.search_completed = None
+            self.completed_part = None
+            self.number_of_results = None
+            self.cache_size = None
+            self.errors = ''
+            self.completed_databases = []
+            self.cache_version = None
+            self.database_versions = {}
+            self.save(update_fields=[
+                'search_completed', 'completed_part', 'number_of_results',
+                'cache_size', 'errors', 'completed_databases',
+                'cache_version', 'database_versions'
+            ])
+        finally:
+            self._release_lock(token)
+        return True
+
+    @classmethod
+    def invalidate_cache(cls, components: Optional[Iterable] = None) -> int:
+        '''Delete the cached results that are no longer valid (see
+        is_valid), optionally only of the given components. Return the
+        number of invalidated CSR objects.'''
+        results = cls.objects.filter(completed_part__isnull=False) \
+            .select_related('component') \
+            .prefetch_related('component__databases')
+        if components is not None:
+            results = results.filter(component__in=components)
+        count = 0
+        for result in results:
+            if not result.is_valid() and result.invalidate():
+                count += 1
+        if count:
+            logger.info('Invalidated {} component search results.'
+                        .format(count))
+        return count
+
     @classmethod
     def empty_cache(cls) -> int:
         '''Empty search result cache by deleting all CSR objects.
@@ -205,20 +662,23 @@ class ComponentSearchResult(models.Model):
         return count
 
     @classmethod
-    def purge_cache(cls):
+    def purge_cache(cls) -> int:
+        '''Delete the least recently used component search results until
+        the cache is smaller than its maximum size. Return the number of
+        deleted objects.'''
         yesterday = timezone.now() - timedelta(days=1)
         # Get total cache size
         total_size = \
             cls.objects.aggregate(Sum('cache_size'))['cache_size__sum']
         if total_size is None:
             # This happens if all CSRs have no filled in cache size
-            return
+            return 0
         # Calculate how much data we should delete
         maximum_size = settings.MAXIMUM_CACHE_SIZE * 1024 * 1024
         to_delete = total_size - maximum_size
         if to_delete <= 0:
             logger.info('Size of component search result cache is ok.')
-            return
+            return 0
         # Get CSRs starting with lowest last accessed date
         number_deleted = 0
         for csr in cls.objects.order_by('last_accessed'):
@@ -232,6 +692,9 @@ class ComponentSearchResult(models.Model):
             to_delete -= csr.cache_size
             csr.delete()
             number_deleted += 1
+            metrics.increment('gretel_cache_evictions_total')
+            metrics.increment('gretel_cache_evicted_bytes_total',
+                              csr.cache_size)
             if to_delete <= 0:
                 break
         if to_delete <= 0:
@@ -242,17 +705,54 @@ class ComponentSearchResult(models.Model):
             logger.warning('Deleted {} component search results to make '
                            'space in cache, but cache is still larger than '
                            'maximum size.'.format(number_deleted))
+        return number_deleted
 
 
-@receiver(post_save, sender=ComponentSearchResult)
-def component_search_result_create_callback(sender, instance, using, **kwargs):
-    instance.init_cache_file()
-
 @receiver(pre_delete, sender=ComponentSearchResult)
 def delete_basex_db_callback(sender, instance, using, **kwargs):
     instance.delete_cache_file()
 
 
+@receiver(post_save, sender=BaseXDB)
+@receiver(post_delete, sender=BaseXDB)
+def basexdb_changed_callback(sender, instance, using, **kwargs):
+    # Results of the component and trees of the database are invalid if
+    # the database was added, replaced or removed
+    tree_cache.invalidate(instance.dbname)
+    if not kwargs.get('raw', False):
+        ComponentSearchResult.invalidate_cache([instance.component_id])
+        DatabaseCount.objects.filter(database_id=instance.pk).delete()
+
+
+class DatabaseCount(models.Model):
+    """Exact number of occurrences of an XPath in a BaseX database, cached
+    by the count views (see the count module)"""
+    xpath = models.TextField()
+    database = models.ForeignKey(BaseXDB, on_delete=models.CASCADE)
+    count = models.PositiveBigIntegerField()
+    counted = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['xpath', 'database'],
+                                    name='databasecount_uniqueness')
+        ]
+
+    def __str__(self):
+        return '"{}…" in {}'.format(self.xpath[:10], self.database)
+
+    @classmethod
+    def purge(cls) -> int:
+        '''Delete counts made more than settings.COUNT_CACHE_MAX_AGE
+        seconds ago. Return the number of deleted counts.'''
+        counted_before = timezone.now() - \
+            timedelta(seconds=settings.COUNT_CACHE_MAX_AGE)
+        count, _ = cls.objects.filter(counted__lt=counted_before).delete()
+        if count:
+            logger.info('Deleted {} expired database counts.'.format(count))
+        return count
+
+
 class SearchQuery(models.Model):
     # User-defined fields
     components = models.ManyToManyField(Component)
@@ -269,14 +769,35 @@ class SearchQuery(models.Model):
         help_text='True if the query was cancelled by the user'
     )
     last_accessed = models.DateTimeField(null=True, editable=False)
+    # Fields used for scheduling the search
+    owner = models.CharField(
+        max_length=100, blank=True, db_index=True, editable=False,
+        help_text='User or session that started the query, used to limit '
+                  'the number of concurrent searches per user'
+    )
+    queued = models.DateTimeField(
+        null=True, editable=False,
+        help_text='Time at which the search was added to the queue'
+    )
+    started = models.DateTimeField(
+        null=True, editable=False,
+        help_text='Time at which a worker started the search'
+    )
+    finished = models.DateTimeField(
+        null=True, editable=False,
+        help_text='Time at which the worker finished the search'
+    )
 
     # makes it possible to register extra filters (callback functions)
     # to further process the raw XPath results from BaseX
     filters: List[ResultSetFilter]
+    # time spent per phase during the last call of get_results()
+    timings: Dict[str, float]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.filters = []
+        self.timings = {}
 
     def initialize(self) -> None:
         """Initialize search query after entering XPath and list of
@@ -288,21 +809,43 @@ class SearchQuery(models.Model):
             raise RuntimeError(
                 'SearchQuery should be saved before calling initialize()'
             )
-        results = []
-        for component in self.components.all():
-            result, created = ComponentSearchResult.objects.get_or_create(
-                xpath=self.xpath,
-                component=component,
-                variables=self.variables
-            )
-            if component.total_database_size is not None:
-                self.total_database_size += component.total_database_size
-            results.append(result)
+        components = list(
+            self.components.annotate(database_size=Sum('databases__size'))
+        )
+        self.total_database_size = sum(
+            component.database_size or 0 for component in components
+        )
+        existing = ComponentSearchResult.objects.filter(
+            xpath=self.xpath,
+            component__in=components,
+            variables=self.variables
+        )
+        existing_components = set(existing.values_list('component_id',
+                                                       flat=True))
+        metrics.increment('gretel_cache_requests_total',
+                          len(existing_components), result='hit')
+        metrics.increment('gretel_cache_requests_total',
+                          len(components) - len(existing_components),
+                          result='miss')
+        new_results = [
+            ComponentSearchResult(xpath=self.xpath, component=component,
+                                  variables=self.variables)
+            for component in components
+            if component.pk not in existing_components
+        ]
+        if new_results:
+            # Conflicts may arise if another query with the same XPath is
+            # initialized at the same time.
+            ComponentSearchResult.objects.bulk_create(new_results,
+                                                      ignore_conflicts=True)
+        results = list(existing)
         self.results.add(*results)
         self.save()
 
     def _component_results(self) -> Iterable[ComponentSearchResult]:
-        return self.results.all().order_by('component')
+        return self.results.all().order_by('component') \
+            .select_related('component') \
+            .prefetch_related('component__databases')
 
     def _count_results(self, result: ComponentSearchResult) -> Optional[int]:
         if not self.filters:
@@ -310,7 +853,7 @@ class SearchQuery(models.Model):
             return result.number_of_results
 
         # slow path, iterate over all results and run filters
-        matches = result.get_results()
+        matches = result.get_results(update_last_accessed=False)
         for filter_ in self.filters:
             matches = filter_(matches)
         return len(list(matches))
@@ -320,7 +863,10 @@ class SearchQuery(models.Model):
         Object should have been initialized with initialize() method but search does not have to be started yet
         with perform_search() method. Return a tuple of the result as
         a list of dictionaries and the percentage of search completion.
-        This method saves the object to update last accessed time."""
+        The last accessed date of the component results is updated, but
+        not that of the query itself (see touch()). The time spent per
+        phase is stored in the timings attribute."""
+        timer = PhaseTimer()
         completed_part = 0
         all_matches: List[Result] = []
         counts = []
@@ -329,15 +875,18 @@ class SearchQuery(models.Model):
         # 1. First we collect matches, and for that we would like to stop once
         # the desired amount of matches is reached.
 
-        for result_obj in self._component_results():
-            matches = result_obj.get_results()
-            # exclude matches that were already returned
-            if exclude is not None:
-                matches = [m for m in matches if m.id not in exclude]
+        result_objs = list(self._component_results())
+        for result_obj in result_objs:
+            matches = result_obj.get_results(update_last_accessed=False,
+                                             timer=timer)
+            with timer.phase('filters'):
+                # exclude matches that were already returned
+                if exclude is not None:
+                    matches = [m for m in matches if m.id not in exclude]
 
-            for filter_ in self.filters:
-                matches = filter_(matches)
-            all_matches.extend(matches)
+                for filter_ in self.filters:
+                    matches = filter_(matches)
+                all_matches.extend(matches)
 
             if max_results is not None and len(all_matches) > max_results:
                 break
@@ -345,18 +894,19 @@ class SearchQuery(models.Model):
         # 2. Here we collect statistics, and for that we would
         # like to loop over the complete results set.
 
-        for result_obj in self._component_results():
-            # Count completed part (for all results)
-            part = result_obj.get_completed_part()
-            if part is not None:
-                completed_part += part
-                percentage = part / max(1, result_obj.component.total_database_size * 100)
-                counts.append({
-                    'component': result_obj.component.slug,
-                    'number_of_results': self._count_results(result_obj),
-                    'completed': result_obj.search_completed is not None,
-                    'percentage': percentage,
-                })
+        with timer.phase('statistics'):
+            for result_obj in result_objs:
+                # Count completed part (for all results)
+                part = result_obj.get_completed_part()
+                if part is not None:
+                    completed_part += part
+                    percentage = part / max(1, result_obj.component.total_database_size * 100)
+                    counts.append({
+                        'component': result_obj.component.slug,
+                        'number_of_results': self._count_results(result_obj),
+                        'completed': result_obj.search_completed is not None,
+                        'percentage': percentage,
+                    })
 
         if self.total_database_size != 0 and self.total_database_size is not None:
             search_percentage = int(
@@ -369,13 +919,38 @@ class SearchQuery(models.Model):
         if max_results is not None:
             all_matches = all_matches[0:max_results]
 
-        self.last_accessed = timezone.now()
-        self.save()
-        all_matches = list(self.augment_with_variables(all_matches))
+        with timer.phase('save'):
+            # Update last accessed date of all component results at once
+            self.results.update(last_accessed=timezone.now())
+        with timer.phase('variables'):
+            all_matches = list(self.augment_with_variables(all_matches))
+        self.timings = timer.as_dict()
+        metrics.observe_phases(timer.phases)
         return (all_matches, search_percentage, counts)
 
+    def touch(self) -> None:
+        """Update the last accessed date, which tells the worker performing
+        the search that the client is still polling"""
+        self.last_accessed = timezone.now()
+        # Only save this field, because the worker updates others
+        self.save(update_fields=['last_accessed'])
+
+    def is_abandoned(self) -> bool:
+        """Return True if the query has not been polled for
+        settings.SEARCH_ABANDON_TIMEOUT seconds, in which case its search
+        is stopped"""
+        return settings.SEARCH_ABANDON_TIMEOUT is not None and \
+            self.last_accessed is not None and \
+            timezone.now() - self.last_accessed > \
+            timedelta(seconds=settings.SEARCH_ABANDON_TIMEOUT)
+
     def perform_search(self) -> None:
-        """Perform search and regularly update on progress"""
+        """Perform search and regularly update on progress. The search is
+        stopped within seconds if the query is cancelled, if it was not
+        polled for settings.SEARCH_ABANDON_TIMEOUT seconds (in which case
+        it is resumed when the client polls again) or if it takes longer
+        than settings.SEARCH_QUERY_TIMEOUT seconds (in which case it is
+        marked as cancelled)."""
         # Get result objects for this query, but only those that have not
         # completed yet, and starting with those that have not started yet
         # (because those for which search has already started may finish
@@ -388,36 +963,78 @@ class SearchQuery(models.Model):
                                                        'component__slug')
 
         result_objs = list(result_objs_query)
-        # append results that should be complete but can't be read
-        result_objs += [r for r in self.results.filter(search_completed__isnull=False) if not r.check_results()]
+        # append results that should be complete but can't be read or were
+        # computed from databases that have changed
+        result_objs += [
+            r for r in self.results.filter(search_completed__isnull=False)
+            .select_related('component')
+            .prefetch_related('component__databases')
+            if not r.check_results() or not r.is_valid()
+        ]
 
         # loop through the linked ComponentSearchResults.
         # for each component, we have to either run the query (perform_search)
         # or read the results that were already collected (get_results)
-        for result_obj in result_objs:
-            result_obj.refresh_from_db()
-            # if search has been completed, we expect to be able to read the results
-            if result_obj.search_completed and not result_obj.errors:
-                # kinda roundabout way to make sure the results are readable before skipping it
-                # make sure the results are accessible, because reading the cache might fail
-                if result_obj.check_results():
-                    # results are readable, skip the rest of the loop
-                    continue
-            try:
-                result_obj.perform_search(self.id)
-            except SearchError:
-                logger.error('Failed executing query for ComponentSearchResult (%d)', result_obj.pk)
-                raise
-
-            # Check if search has been cancelled in the meantime
-            self.refresh_from_db(fields=['cancelled'])
-            if self.cancelled:
-                # skip the rest of the components
-                break
+        watchdog = SearchWatchdog(self.id)
+        watchdog.start()
+        try:
+            # Components that are being searched by another process. The
+            # results of that process are read while it is searching, so
+            # we only have to wait until it is finished (or take over if
+            # it stops before the search has been completed). Note that
+            # waiting occupies this worker for the duration of the other
+            # search, although it only checks the other search every
+            # SEARCH_LOCK_POLL_INTERVAL seconds.
+            pending = []
+            for result_obj in result_objs:
+                result_obj.refresh_from_db()
+                # if search has been completed, we expect to be able to read the results
+                if result_obj.search_completed and not result_obj.errors:
+                    # kinda roundabout way to make sure the results are readable before skipping it
+                    # make sure the results are accessible, because reading the cache might fail
+                    if result_obj.check_results() and result_obj.is_valid():
+                        # results are readable, skip the rest of the loop
+                        continue
+                if not self._perform_component_search(result_obj, watchdog):
+                    pending.append(result_obj)
+
+                if watchdog.stopped:
+                    # skip the rest of the components
+                    break
+            while pending and not watchdog.stopped:
+                time.sleep(settings.SEARCH_LOCK_POLL_INTERVAL)
+                still_pending = []
+                for result_obj in pending:
+                    result_obj.refresh_from_db()
+                    if result_obj.search_completed is not None:
+                        continue
+                    if not self._perform_component_search(result_obj,
+                                                          watchdog):
+                        still_pending.append(result_obj)
+                    if watchdog.stopped:
+                        break
+                pending = still_pending
+        finally:
+            watchdog.finish()
+        if watchdog.reason in (ABANDONED, TIMED_OUT):
+            logger.info('Stopped search query {} because it was {}'
+                        .format(self.id, watchdog.reason))
+        if watchdog.reason == TIMED_OUT:
+            # Let clients that come back know that the search has stopped
+            SearchQuery.objects.filter(id=self.id).update(cancelled=True)
+
+    def _perform_component_search(self, result_obj: ComponentSearchResult,
+                                  watchdog: SearchWatchdog) -> bool:
+        try:
+            return result_obj.perform_search(self.id, watchdog)
+        except SearchError:
+            logger.error('Failed executing query for ComponentSearchResult (%d)', result_obj.pk)
+            raise
 
     def get_errors(self) -> str:
         errs = ''
-        result_objs = self.results.order_by('component')
+        result_objs = self.results.order_by('component') \
+            .select_related('component__treebank')
         for result_obj in result_objs:
             if result_obj.errors:
                 errs += 'Errors in searching component {}: ' \
@@ -426,30 +1043,33 @@ class SearchQuery(models.Model):
         return errs
 
     def perform_count(self) -> dict:
-        """Perform a full count without using any cached results or saving
-        anything and return a dict of all components (using their slugs
-        as keys) and the counts. This is mainly meant for debug purposes
-        to check if no results are accidentally skipped when using the
-        views. The XQuery code is equal to that of GrETEL 4. No need to
-        call initialize() first."""
-        counts = {}
+        """Perform a full count without using any cached results and
+        return a dict of all components (using their slugs as keys) and
+        the counts. This is mainly meant for debug purposes to check if
+        no results are accidentally skipped when using the views. The
+        databases are counted concurrently, like by the count views. No
+        need to call initialize() first."""
+        # Imported here to avoid a circular import
+        from .count import CountRequest
         try:
-            for component in self.components.all():
-                component_count = 0
-                dbs = component.get_databases().keys()
-                for db in dbs:
-                    xquery = generate_xquery_count(db, self.xpath)
-                    component_count += int(basex.perform_query(xquery))
-                counts[component.slug] = component_count
-        except (OSError, ValueError) as err:
-            # Propagate errors because of bad XPath or BaseX problems
+            count_request = CountRequest(
+                self.xpath, self.components.prefetch_related('databases'),
+                use_cache=False
+            )
+            for _ in count_request.iter_lines():
+                pass
+        except ValueError as err:
+            # Propagate errors because of bad XPath
             raise SearchError(str(err))
-        return counts
+        if count_request.errors:
+            # Propagate errors because of BaseX problems
+            raise SearchError('; '.join(count_request.errors.values()))
+        return count_request.counts
 
     def cancel_search(self) -> None:
         """Mark search as cancelled and save object"""
         self.cancelled = True
-        self.save()
+        self.save(update_fields=['cancelled'])
 
     def augment_with_variables(self, matches: ResultSet) -> ResultSet:
         # register missing xpath lower-case() function for lxml
@@ -489,28 +1109,110 @@ class SearchQuery(models.Model):
 
     def augment_with_context(self, matches: ResultSet) -> ResultSet:
         """Fetch preceding and following sentences for matches in the result set"""
-        strip_match = re.compile(r'\+match=\d+$')
+        pres = SentenceLocation.get_pres(
+            (match._match.database, match.context_id) for match in matches)
         for match in matches:
-            sentid = strip_match.sub('', match._match.sentid)
-
             # TODO: there's probably a more efficient way to fetch everything in a single query
             # instead of one query per match
-
-            query = '''
-            let $tree := db:open("''' + match._match.database + '''")/treebank/alpino_ds[
-            @id="''' + sentid + '''"
-            ]
-            let $prevs := $tree/preceding-sibling::alpino_ds[1]/sentence
-            let $nexts := $tree/following-sibling::alpino_ds[1]/sentence
-            return
-            <match>{data($prevs)}||{data($nexts)}</match>
-            '''
-            result = basex.perform_query(query)
-            prevs, nexts = result.split('||')
-            prevs = prevs.replace('<match>', '')
-            nexts = nexts.replace('</match>', '')
-            match.add_context(prevs, nexts)
+            query = generate_xquery_context(
+                match._match.database, match.context_id,
+                pres.get((match._match.database, match.context_id)))
+            result = basex.perform_query(query,
+                                         database=match._match.database)
+            match.add_context(*parse_context_result(result))
         return matches
 
     def add_filter(self, filter_: ResultSetFilter):
         self.filters.append(filter_)
+
+
+class SearchExport(models.Model):
+    """Export of all results of a search that is written to a file in the
+    background, because it is too large to be streamed directly (see the
+    export module)"""
+    FORMAT_CHOICES = [
+        ('csv', 'CSV'),
+        ('tsv', 'TSV'),
+        ('jsonl', 'JSON Lines'),
+        ('xml', 'Alpino XML'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                          editable=False)
+    components = models.ManyToManyField(Component)
+    xpath = models.TextField()
+    variables = models.JSONField(blank=True, default=list)
+    format = models.CharField(max_length=8, choices=FORMAT_CHOICES)
+    owner = models.CharField(
+        max_length=100, blank=True, db_index=True, editable=False,
+        help_text='User or session that requested the export'
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(
+        null=True, editable=False,
+        help_text='Time at which the export file was completed'
+    )
+    number_of_results = models.PositiveIntegerField(null=True,
+                                                    editable=False)
+    size = models.PositiveBigIntegerField(
+        null=True, editable=False,
+        help_text='Size of the export file in bytes')
+    errors = models.TextField(default='', editable=False)
+
+    def __str__(self):
+        return '{} export of "{}…"'.format(self.format, self.xpath[:10])
+
+    def get_path(self) -> pathlib.Path:
+        """Get the Path of the export file, which only exists if the
+        export has been completed"""
+        settings.EXPORT_DIR.mkdir(exist_ok=True, parents=True)
+        return settings.EXPORT_DIR / '{}.{}'.format(self.id, self.format)
+
+    def get_partial_path(self) -> pathlib.Path:
+        """Get the Path of the file to which the export is written"""
+        settings.EXPORT_DIR.mkdir(exist_ok=True, parents=True)
+        return settings.EXPORT_DIR / '{}.{}.partial'.format(self.id,
+                                                            self.format)
+
+    def get_status(self) -> dict:
+        if self.finished is None:
+            try:
+                size = self.get_partial_path().stat().st_size
+            except FileNotFoundError:
+                size = 0
+        else:
+            size = self.size
+        return {
+            'export_id': str(self.id),
+            'format': self.format,
+            'finished': self.finished is not None,
+            'number_of_results': self.number_of_results,
+            'size': size,
+            'errors': self.errors,
+        }
+
+    def delete_file(self):
+        """Delete the files belonging to this export. This method is
+        called automatically on delete."""
+        self.get_path().unlink(missing_ok=True)
+        self.get_partial_path().unlink(missing_ok=True)
+
+    @classmethod
+    def purge(cls) -> int:
+        '''Delete exports created more than settings.EXPORT_MAX_AGE
+        seconds ago. Return the number of deleted exports.'''
+        created_before = timezone.now() - \
+            timedelta(seconds=settings.EXPORT_MAX_AGE)
+        count = 0
+        # Delete one by one to make sure the files are deleted as well
+        for export in cls.objects.filter(created__lt=created_before):
+            export.delete()
+            count += 1
+        if count:
+            logger.info('Deleted {} expired exports.'.format(count))
+        return count
+
+
+@receiver(pre_delete, sender=SearchExport)
+def delete_export_callback(sender, instance, using, **kwargs):
+    instance.delete_file()
@@ -1,8 +1,169 @@
+from django.conf import settings
+from django.utils import timezone
+
 from celery import shared_task
-from .models import SearchQuery
+from datetime import timedelta
+import logging
+from typing import Iterable, Optional
+
+from services.metrics import metrics
+from treebanks.models import Component
+from .models import SearchQuery, SearchError, SearchExport
+from . import export, warmup
+
+# Warm-up searches have a lower priority than all searches of users (see
+# search_priority)
+WARMUP_PRIORITY = 9
+
+logger = logging.getLogger(__name__)
+
+
+def search_priority(total_database_size: Optional[int]) -> int:
+    '''Return the Celery priority (0 is the highest) of a search on
+    databases with the given total size in KiB, so that searches that are
+    expected to be cheap do not have to wait for expensive ones'''
+    size = total_database_size or 0
+    return min(9, sum(1 for threshold in settings.SEARCH_PRIORITY_THRESHOLDS
+                      if size > threshold))
+
+
+def schedule_search(query: SearchQuery) -> None:
+    '''Add the search of an initialized query to the search queue. If
+    there is no connection with the message broker, the search is run
+    synchronously.'''
+    query.queued = timezone.now()
+    query.save(update_fields=['queued'])
+    try:
+        run_search_query.apply_async(
+            (query.pk,), priority=search_priority(query.total_database_size)
+        )
+    except run_search_query.OperationalError:
+        # No connection with message broker - run synchronously
+        run_search_query.apply((query.pk,))
+
+
+def is_admitted(query: SearchQuery) -> bool:
+    '''Return True if the owner of the query does not have the maximum
+    number of searches running already. Searches that have not been
+    polled recently are not counted, because they will be stopped.'''
+    limit = settings.SEARCH_MAX_CONCURRENT_PER_OWNER
+    if not query.owner or limit is None:
+        return True
+    running = SearchQuery.objects.filter(
+        owner=query.owner, started__isnull=False, finished__isnull=True,
+        cancelled=False
+    ).exclude(id=query.id)
+    if settings.SEARCH_ABANDON_TIMEOUT is not None:
+        running = running.filter(last_accessed__gte=timezone.now() - timedelta(
+            seconds=settings.SEARCH_ABANDON_TIMEOUT
+        ))
+    return running.count() < limit
+
+
+@shared_task(bind=True, max_retries=None)
+def run_search_query(self, query_id: int):
+    query = SearchQuery.objects.get(id=query_id)
+    if query.cancelled:
+        return
+    # Without a message broker the search runs synchronously and cannot
+    # be postponed
+    if not self.request.is_eager and not is_admitted(query):
+        # Try again later, so that the worker can be used for searches
+        # of others in the meantime
+        raise self.retry(countdown=settings.SEARCH_ADMISSION_RETRY_DELAY,
+                         priority=search_priority(query.total_database_size))
+    query.started = timezone.now()
+    query.save(update_fields=['started'])
+    if query.queued is not None:
+        wait = (query.started - query.queued).total_seconds()
+        metrics.observe('gretel_queue_wait_seconds', wait, queue='search')
+        logger.info('Search query {} waited {:.1f} s in the queue'
+                    .format(query.id, wait))
+    try:
+        query.perform_search()
+    finally:
+        query.finished = timezone.now()
+        query.save(update_fields=['finished'])
 
 
 @shared_task
-def run_search_query(query_id: int):
+def run_count_query(query_id: int) -> dict:
+    '''Perform a full count of a query (see SearchQuery.perform_count)
+    and log the results'''
     query = SearchQuery.objects.get(id=query_id)
-    query.perform_search()
+    try:
+        counts = query.perform_count()
+    except SearchError as err:
+        logger.error('Could not complete count of query {}: {}'
+                     .format(query_id, err))
+        raise
+    logger.info('Results for query number {}: {} (total: {})'
+                .format(query_id, counts, sum(counts.values())))
+    return counts
+
+
+def schedule_export(search_export: SearchExport) -> None:
+    '''Add writing the file of an export to the search queue, with the
+    lowest priority of searches on databases of the same size. If there
+    is no connection with the message broker, the export is written
+    synchronously.'''
+    total_database_size = export.get_database_size(
+        search_export.components.all())
+    try:
+        run_export.apply_async(
+            (str(search_export.pk),),
+            priority=search_priority(total_database_size)
+        )
+    except run_export.OperationalError:
+        # No connection with message broker - run synchronously
+        run_export.apply((str(search_export.pk),))
+
+
+@shared_task
+def run_export(export_id: str) -> None:
+    search_export = SearchExport.objects.get(pk=export_id)
+    export.write_export(search_export)
+    logger.info('Exported {} results of export {}'
+                .format(search_export.number_of_results, export_id))
+
+
+def schedule_warm_up(components: Optional[Iterable[Component]] = None) -> None:
+    '''Schedule the precomputation of popular searches (see the warmup
+    module), optionally only on the given components. Nothing is done if
+    there is no connection with the message broker, because warming up
+    is not worth blocking the caller for.'''
+    if not settings.WARMUP_ENABLED:
+        return
+    component_ids = None if components is None \
+        else [component.pk for component in components]
+    try:
+        warm_up_cache.apply_async((component_ids,), priority=WARMUP_PRIORITY)
+    except warm_up_cache.OperationalError as err:
+        logger.warning('Cannot schedule cache warm-up: {}'.format(err))
+
+
+@shared_task
+def warm_up_cache(component_ids: Optional[list] = None) -> int:
+    '''Schedule a low-priority search for every popular search of which
+    the results are not cached. Searches that have not started within
+    settings.WARMUP_MAXIMUM_DURATION seconds are discarded. Return the
+    number of scheduled searches.'''
+    components = None if component_ids is None \
+        else Component.objects.filter(pk__in=component_ids)
+    searches = warmup.get_popular_searches(components)
+    for search in searches:
+        warm_up_search.apply_async(
+            search, priority=WARMUP_PRIORITY,
+            expires=settings.WARMUP_MAXIMUM_DURATION
+        )
+    logger.info('Scheduled {} searches to warm up the cache'
+                .format(len(searches)))
+    return len(searches)
+
+
+@shared_task
+def warm_up_search(xpath: str, variables: list, component_id: int,
+                   count: int) -> bool:
+    return warmup.warm_up(
+        warmup.WarmUpSearch(xpath, variables, component_id, count)
+    )
@@ -1,15 +1,25 @@
-from django.test import TestCase
+from django.test import TestCase, AsyncRequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.conf import settings
 from django.core.management import call_command
 from django.utils import timezone
 
+from asgiref.sync import sync_to_async
+from datetime import timedelta
+
 import lxml.etree as etree
+from io import StringIO
+import csv
+import json
 import tempfile
 import pathlib
 import os
 import shutil
+import time
+import zlib
 
-from treebanks.models import Treebank
+from treebanks.models import Treebank, Component, BaseXDB, SentenceLocation
 from services.basex import basex
 
 from .basex_search import (check_db_name, check_xpath, generate_xquery_search,
@@ -17,8 +27,26 @@ from .basex_search import (check_db_name, check_xpath, generate_xquery_search,
                            generate_xquery_for_variables,
                            check_xquery_variable_name,
                            parse_metadata_count_result,
-                           generate_xquery_showtree)
-from .models import ComponentSearchResult, SearchQuery
+                           generate_xquery_showtree,
+                           generate_xquery_showtrees,
+                           generate_xquery_context,
+                           parse_context_result,
+                           generate_xquery_statistics,
+                           parse_statistics_result,
+                           xpath_shape,
+                           tag_xquery,
+                           generate_xquery_stop)
+from . import cache
+from . import async_views
+from .export import ResultExport, parse_range, write_export
+from .models import (ComponentSearchResult, SearchQuery, SlowQuery,
+                     SearchExport, DatabaseCount)
+from .timing import PhaseTimer
+from .views import get_tree_request
+from .tree_cache import TreeCache, tree_cache
+from .tasks import search_priority, is_admitted
+from .warmup import get_popular_searches, has_cache_space, warm_up
+from .watchdog import SearchWatchdog, CANCELLED, ABANDONED, TIMED_OUT
 
 test_treebank = None
 
@@ -132,6 +160,38 @@ class BaseXSearchTestCase(TestCase):
             self.DB_NAME_CHECK, self.SENT_ID_CHECK + '"'
         )
 
+    def test_xquery_showtree_pre(self):
+        query = generate_xquery_showtree(self.DB_NAME_CHECK,
+                                         self.SENT_ID_CHECK, 42)
+        self.assertIn('db:open-pre("{}", 42)'.format(self.DB_NAME_CHECK),
+                      query)
+        # The sentence is still looked up by id if the pre value is wrong
+        self.assertIn(generate_xquery_showtree(self.DB_NAME_CHECK,
+                                               self.SENT_ID_CHECK), query)
+
+    def test_xquery_showtrees(self):
+        generate_xquery_showtrees(self.DB_NAME_CHECK, [self.SENT_ID_CHECK])
+        query = generate_xquery_showtrees(self.DB_NAME_CHECK, ['a', 'b'],
+                                          {'a': 42})
+        self.assertIn('db:open-pre("{}", 42)'.format(self.DB_NAME_CHECK),
+                      query)
+        self.assertIn('@id = ("b")', query)
+        self.assertRaises(
+            ValueError, generate_xquery_showtrees,
+            self.DB_NAME_CHECK, [self.SENT_ID_CHECK, self.SENT_ID_CHECK + '"']
+        )
+
+    def test_xquery_context(self):
+        generate_xquery_context(self.DB_NAME_CHECK, self.SENT_ID_CHECK)
+        self.assertRaises(
+            ValueError, generate_xquery_context,
+            self.DB_NAME_CHECK, self.SENT_ID_CHECK + '"'
+        )
+        self.assertEqual(
+            parse_context_result('<match>Eerste zin.||</match>'),
+            ('Eerste zin.', '')
+        )
+
     def test_parse_search_result(self):
         input_str = '<match>id||sentence||ids||begins||' \
             'xml_sentences||meta||vars||db</match><match>id2||sentence2' \
@@ -153,6 +213,20 @@ class BaseXSearchTestCase(TestCase):
         self.assertEqual([], parse_search_result('', 'component'))
         self.assertEqual([], parse_search_result('\n ', 'component'))
 
+    def test_statistics(self):
+        generate_xquery_statistics(self.DB_NAME_CHECK)
+        self.assertRaises(
+            ValueError, generate_xquery_statistics, self.DB_NAME_CHECK + '"'
+        )
+        statistics = parse_statistics_result(
+            '<statistics size="20480" words="25" sentences="3" '
+            'version="1.6"/>'
+        )
+        self.assertEqual(statistics, {'size': 20, 'words': 25,
+                                      'sentences': 3, 'version': '1.6'})
+        with self.assertRaises(ValueError):
+            parse_statistics_result('<statistics/>')
+
     def test_parse_metadata_count_result(self):
         TEST_XML = """
 <metadata>
@@ -187,6 +261,886 @@ class BaseXSearchTestCase(TestCase):
             parse_metadata_count_result('<something></something>')
 
 
+class SlowQueryTestCase(TestCase):
+    def test_xpath_shape(self):
+        self.assertEqual(
+            xpath_shape('//node[@lemma="boek" and\n  @begin = 3]'),
+            xpath_shape("//node[@lemma='fiets' and @begin = 10]")
+        )
+        self.assertNotEqual(xpath_shape('//node[@lemma="boek"]'),
+                            xpath_shape('//node[@word="boek"]'))
+
+    def test_record(self):
+        with self.settings(SLOW_QUERY_THRESHOLD=10):
+            self.assertIsNone(SlowQuery.record(XPATH1, None, 'DB', 9.9, 5))
+            slow_query = SlowQuery.record(XPATH1, None, 'DB', 10.5, 5)
+        self.assertEqual(slow_query.shape, xpath_shape(XPATH1))
+        with self.settings(SLOW_QUERY_THRESHOLD=None):
+            self.assertIsNone(SlowQuery.record(XPATH1, None, 'DB', 99, 5))
+
+    def test_slow_queries_command(self):
+        for duration in (12, 20):
+            SlowQuery.objects.create(xpath=XPATH1, shape=xpath_shape(XPATH1),
+                                     database='DB', duration=duration,
+                                     number_of_results=1)
+        out = StringIO()
+        call_command('slow_queries', stdout=out)
+        self.assertIn('32.0', out.getvalue())
+        self.assertIn(xpath_shape(XPATH1), out.getvalue())
+
+
+class RecordingWatchdog(SearchWatchdog):
+    """Watchdog that records the tags of the queries it stops"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stopped_tags = []
+
+    def _stop_query(self, tag, node):
+        self.stopped_tags.append(tag)
+
+
+class SearchWatchdogTestCase(TestCase):
+    def setUp(self):
+        self.query = SearchQuery(xpath=XPATH1,
+                                 last_accessed=timezone.now())
+        self.query.save()
+
+    def test_tags(self):
+        tag = SearchWatchdog.new_tag()
+        self.assertTrue(tag_xquery('count(//node)', tag).startswith(
+            '(: {} :)'.format(tag)))
+        # The stop query should not contain the tag itself
+        self.assertNotIn(tag, generate_xquery_stop(tag))
+        with self.assertRaises(ValueError):
+            tag_xquery('count(//node)', ':) 1 (:')
+
+    def test_cancelled(self):
+        watchdog = RecordingWatchdog(self.query.id)
+        tag = watchdog.new_tag()
+        with watchdog.running(tag):
+            watchdog.check()
+            self.assertFalse(watchdog.stopped)
+            self.query.cancel_search()
+            watchdog.check()
+        self.assertEqual(watchdog.reason, CANCELLED)
+        self.assertEqual(watchdog.stopped_tags, [tag])
+        # Nothing to stop if no query is running
+        watchdog.check()
+        self.assertEqual(watchdog.stopped_tags, [tag])
+
+    def test_abandoned(self):
+        self.query.last_accessed = timezone.now() - timedelta(seconds=60)
+        self.query.save()
+        watchdog = RecordingWatchdog(self.query.id)
+        with self.settings(SEARCH_ABANDON_TIMEOUT=30):
+            watchdog.check()
+        self.assertEqual(watchdog.reason, ABANDONED)
+
+    def test_polling_touches_query(self):
+        self.query.last_accessed = timezone.now() - timedelta(seconds=60)
+        self.query.save()
+        with self.settings(SEARCH_ABANDON_TIMEOUT=30):
+            self.assertTrue(self.query.is_abandoned())
+            response = self.client.post(
+                '/search/search/',
+                {'xpath': XPATH1, 'treebank': 'unknown', 'components': [],
+                 'query_id': self.query.id},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.query.refresh_from_db()
+            self.assertFalse(self.query.is_abandoned())
+        self.assertFalse(self.query.cancelled)
+
+    def test_timeouts(self):
+        watchdog = RecordingWatchdog(self.query.id)
+        tag = watchdog.new_tag()
+        with self.settings(SEARCH_DATABASE_TIMEOUT=0):
+            with watchdog.running(tag):
+                watchdog.check()
+        self.assertTrue(watchdog.timed_out(tag))
+        self.assertFalse(watchdog.stopped)
+        self.assertEqual(watchdog.stopped_tags, [tag])
+        with self.settings(SEARCH_QUERY_TIMEOUT=0):
+            watchdog.check()
+        self.assertEqual(watchdog.reason, TIMED_OUT)
+
+    def test_thread(self):
+        watchdog = SearchWatchdog()
+        with self.settings(SEARCH_WATCHDOG_INTERVAL=0.01):
+            watchdog.start()
+            watchdog.finish()
+        self.assertFalse(watchdog.is_alive())
+
+    def test_cancel_query_view(self):
+        response = self.client.post(
+            '/search/cancel/',
+            {'xpath': XPATH1, 'query_id': self.query.id},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.query.refresh_from_db()
+        self.assertTrue(self.query.cancelled)
+        response = self.client.post(
+            '/search/cancel/', {'query_id': self.query.id},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class SearchLockTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='locktest', title='Lock')
+        self.component = Component.objects.create(
+            slug='comp', title='comp', nr_sentences=0, nr_words=0,
+            treebank=treebank
+        )
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.csr = ComponentSearchResult(xpath=XPATH1,
+                                         component=self.component)
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            self.csr.save()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_lock(self):
+        self.assertTrue(self.csr._acquire_lock('first'))
+        other = ComponentSearchResult.objects.get(pk=self.csr.pk)
+        self.assertFalse(other._acquire_lock('second'))
+        # Searching does nothing while another process holds the lock
+        self.assertFalse(other.perform_search())
+        self.assertIsNone(other.search_completed)
+        other._release_lock('second')  # Not the owner, so no effect
+        self.assertFalse(other._acquire_lock('second'))
+        self.csr._release_lock('first')
+        self.assertTrue(other._acquire_lock('second'))
+
+    def test_checkpoints(self):
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            self.csr._get_partial_cache_path().write_text('<match>a</match>')
+            self.csr.completed_databases = [
+                {'database': 'DB1', 'results': 1, 'matches': 1, 'offset': 16}
+            ]
+            versions = {'DB1': {'size': 1, 'alpino_version': ''},
+                        'DB2': {'size': 1, 'alpino_version': ''}}
+            self.csr.cache_version = cache.VERSION
+            self.csr.database_versions = versions
+            self.assertEqual(self.csr._get_checkpoints(versions),
+                             self.csr.completed_databases)
+            # Cannot resume if databases changed or the file is too short
+            self.assertEqual(self.csr._get_checkpoints(
+                dict(versions, DB2={'size': 2, 'alpino_version': ''})), [])
+            self.csr.completed_databases[0]['offset'] = 17
+            self.assertEqual(self.csr._get_checkpoints(versions), [])
+
+    def test_expired_lock(self):
+        with self.settings(SEARCH_LOCK_TIMEOUT=-1):
+            self.assertTrue(self.csr._acquire_lock('first'))
+            self.assertTrue(self.csr._acquire_lock('second'))
+
+    def test_search_again(self):
+        BaseXDB.objects.create(dbname='LOCKTEST', size=1,
+                               component=self.component)
+        watchdog = SearchWatchdog()
+        watchdog.reason = CANCELLED
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            # Results that are no longer valid, because the database has
+            # been added after searching
+            ComponentSearchResult.objects.filter(pk=self.csr.pk).update(
+                search_completed=timezone.now(), completed_part=0,
+                number_of_results=0, cache_version=cache.VERSION)
+            self.csr._get_cache_path().write_text(
+                cache.HEADER + cache.complete_record(0, 0, 0))
+            self.assertTrue(self.csr.perform_search(watchdog=watchdog))
+            self.csr.refresh_from_db()
+            self.assertFalse(self.csr._get_cache_path().exists())
+            # The search has been stopped, so it has not been completed
+            self.assertIsNone(self.csr.search_completed)
+
+    def test_wait_for_other_search(self):
+        self.assertTrue(self.csr._acquire_lock('other'))
+        query = SearchQuery(xpath=XPATH1)
+        query.save()
+        query.components.add(self.component)
+        query.initialize()
+        start = time.monotonic()
+        with self.settings(SEARCH_QUERY_TIMEOUT=0.2,
+                           SEARCH_WATCHDOG_INTERVAL=0.05,
+                           SEARCH_LOCK_POLL_INTERVAL=0.05):
+            # Waits until the query times out, because the other process
+            # does not finish
+            query.perform_search()
+        self.assertLess(time.monotonic() - start, 5)
+        self.csr.refresh_from_db()
+        self.assertEqual(self.csr.locked_by, 'other')
+        self.assertIsNone(self.csr.search_completed)
+
+
+class SchedulingTestCase(TestCase):
+    def test_search_priority(self):
+        with self.settings(SEARCH_PRIORITY_THRESHOLDS=[10, 100]):
+            self.assertEqual(search_priority(None), 0)
+            self.assertEqual(search_priority(10), 0)
+            self.assertEqual(search_priority(50), 1)
+            self.assertEqual(search_priority(1000), 2)
+
+    def test_is_admitted(self):
+        def create_query(owner, **kwargs):
+            query = SearchQuery(xpath=XPATH1, owner=owner,
+                                last_accessed=timezone.now(), **kwargs)
+            query.save()
+            return query
+
+        running = create_query('session:a', started=timezone.now())
+        create_query('session:a', started=timezone.now(),
+                     finished=timezone.now())
+        create_query('session:b', started=timezone.now())
+        new = create_query('session:a')
+        with self.settings(SEARCH_MAX_CONCURRENT_PER_OWNER=1):
+            self.assertFalse(is_admitted(new))
+            # Queries that are not polled anymore do not count
+            running.last_accessed = timezone.now() - timedelta(hours=1)
+            running.save()
+            self.assertTrue(is_admitted(new))
+        with self.settings(SEARCH_MAX_CONCURRENT_PER_OWNER=None):
+            self.assertTrue(is_admitted(new))
+        self.assertTrue(is_admitted(create_query('')))
+
+
+class InvalidationTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='invalidate', title='Inv')
+        self.components = [
+            Component.objects.create(slug='comp{}'.format(i), title='comp',
+                                     nr_sentences=0, nr_words=0,
+                                     treebank=treebank)
+            for i in range(2)
+        ]
+        self.databases = [
+            BaseXDB.objects.create(dbname='INVALIDATE_{}'.format(i), size=10,
+                                   alpino_version='1', component=component)
+            for i, component in enumerate(self.components)
+        ]
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.results = []
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            for component in self.components:
+                csr = ComponentSearchResult.objects.create(
+                    xpath=XPATH1, component=component,
+                    search_completed=timezone.now(), completed_part=10,
+                    number_of_results=0, cache_version=cache.VERSION,
+                    database_versions=component.get_database_versions()
+                )
+                csr._get_cache_path().write_text(
+                    cache.HEADER + cache.complete_record(0, 0, 1))
+                self.results.append(csr)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_is_valid(self):
+        csr = self.results[0]
+        self.assertTrue(csr.is_valid())
+        csr.cache_version = cache.VERSION - 1
+        self.assertFalse(csr.is_valid())
+        # Results of searches that have not started are always valid
+        self.assertTrue(ComponentSearchResult(
+            xpath=XPATH1, component=self.components[0]).is_valid())
+
+    def test_database_changed(self):
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            self.assertEqual(ComponentSearchResult.invalidate_cache(), 0)
+            # Replacing a database only invalidates results of its component
+            self.databases[0].alpino_version = '2'
+            self.databases[0].save()
+            changed, unchanged = [
+                ComponentSearchResult.objects.get(pk=csr.pk)
+                for csr in self.results
+            ]
+            self.assertIsNone(changed.search_completed)
+            self.assertFalse(changed._get_cache_path().exists())
+            self.assertIsNotNone(unchanged.search_completed)
+            self.assertTrue(unchanged.check_results())
+            self.databases[1].delete()
+            self.assertIsNone(ComponentSearchResult.objects.get(
+                pk=unchanged.pk).search_completed)
+
+    def test_unreadable_cache_file(self):
+        match = '<match>s1||Een zin.||1||0||<node id="1"/>||||||' \
+            'INVALIDATE_0</match>'
+        encoded = match.encode()
+        corrupt = cache.HEADER + match + \
+            cache.database_record('INVALIDATE_0', 1, len(encoded),
+                                  zlib.crc32(encoded) + 1) + \
+            cache.complete_record(1, 1, 1)
+        # Cache file of an older version, without a header
+        legacy = match
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            for content in (corrupt, legacy):
+                csr = ComponentSearchResult.objects.get(pk=self.results[0].pk)
+                csr._get_cache_path().write_text(content)
+                ComponentSearchResult.objects.filter(pk=csr.pk).update(
+                    search_completed=timezone.now(), number_of_results=1)
+                csr.refresh_from_db()
+                self.assertEqual(list(csr.get_results()), [])
+                csr.refresh_from_db()
+                # The component will be searched again
+                self.assertIsNone(csr.search_completed)
+                self.assertFalse(csr._get_cache_path().exists())
+
+    def test_locked(self):
+        self.assertTrue(self.results[0]._acquire_lock('other'))
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            ComponentSearchResult.objects.filter(pk=self.results[0].pk) \
+                .update(cache_version=None)
+            self.assertEqual(ComponentSearchResult.invalidate_cache(), 0)
+            self.assertTrue(self.results[0]._get_cache_path().exists())
+
+
+class WarmUpTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='warmup', title='warmup')
+        self.components = [
+            Component.objects.create(slug='comp{}'.format(i), title='comp',
+                                     nr_sentences=0, nr_words=0,
+                                     treebank=treebank)
+            for i in range(3)
+        ]
+        # XPATH1 is searched three times on the first component and twice
+        # on the second one, '//node' once
+        for component, xpath, times in [(0, XPATH1, 3), (1, XPATH1, 2),
+                                        (1, '//node', 1)]:
+            for _ in range(times):
+                query = SearchQuery(xpath=xpath, last_accessed=timezone.now())
+                query.save()
+                query.components.add(self.components[component])
+
+    def test_popular_searches(self):
+        searches = get_popular_searches()
+        self.assertEqual([(search.component_id, search.count)
+                          for search in searches],
+                         [(self.components[0].pk, 3),
+                          (self.components[1].pk, 2)])
+        self.assertEqual(len(get_popular_searches(limit=1)), 1)
+        # Cached results are left out
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                self.settings(CACHING_DIR=pathlib.Path(cache_dir)):
+            csr = ComponentSearchResult.objects.create(
+                xpath=XPATH1, component=self.components[0],
+                search_completed=timezone.now(), number_of_results=0)
+            csr._get_cache_path().write_text(
+                cache.HEADER + cache.complete_record(0, 0, 0))
+            self.assertEqual(len(get_popular_searches()), 1)
+
+    def test_popular_searches_for_components(self):
+        searches = get_popular_searches([self.components[2]])
+        self.assertEqual([(search.xpath, search.component_id)
+                          for search in searches],
+                         [(XPATH1, self.components[2].pk)])
+
+    def test_cache_space(self):
+        ComponentSearchResult.objects.create(
+            xpath=XPATH1, component=self.components[0],
+            cache_size=1024 * 1024)
+        with self.settings(MAXIMUM_CACHE_SIZE=4,
+                           WARMUP_MAXIMUM_CACHE_FRACTION=0.5):
+            self.assertTrue(has_cache_space())
+        with self.settings(MAXIMUM_CACHE_SIZE=2,
+                           WARMUP_MAXIMUM_CACHE_FRACTION=0.5):
+            self.assertFalse(has_cache_space())
+            self.assertFalse(warm_up(get_popular_searches()[0]))
+
+
+class TreeCacheTestCase(TestCase):
+    def test_lru(self):
+        cache = TreeCache()
+        tree = 'x' * 400 * 1024
+        with self.settings(TREE_CACHE_SIZE=1):
+            cache.set('DB', '1', 'r1', tree)
+            cache.set('DB', '2', 'r1', tree)
+            self.assertEqual(cache.get('DB', '1', 'r1'), tree)
+            # The least recently used tree is evicted
+            cache.set('DB', '3', 'r1', tree)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get('DB', '2', 'r1'))
+            self.assertEqual(cache.get('DB', '1', 'r1'), tree)
+            self.assertEqual(cache.size, 2 * len(tree))
+
+    def test_revision(self):
+        cache = TreeCache()
+        cache.set('DB', '1', 'r1', '<alpino_ds/>')
+        cache.set('OTHER', '1', 'r1', '<alpino_ds/>')
+        self.assertIsNone(cache.get('DB', '1', 'r2'))
+        self.assertEqual(len(cache), 1)
+        cache.invalidate('OTHER')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.size, 0)
+
+
+class TreeViewTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='trees', title='Trees')
+        component = Component.objects.create(
+            slug='comp', title='comp', nr_sentences=1, nr_words=1,
+            treebank=treebank
+        )
+        self.database = BaseXDB.objects.create(
+            dbname='TREES_DB', size=1, component=component)
+        self.url = '/search/tree/?database=TREES_DB&sentence_id=s1'
+        tree_cache.clear()
+        # Cache the tree, so that BaseX is not needed
+        tree_cache.set('TREES_DB', 's1', self.database.updated.isoformat(),
+                       '<alpino_ds id="s1"/>')
+
+    def tearDown(self):
+        tree_cache.clear()
+
+    def test_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'tree': '<alpino_ds id="s1"/>'})
+        self.assertIn('public', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.post(
+            '/search/tree/', {'database': 'TREES_DB', 'sentence_id': 's1'},
+            content_type='application/json'
+        )
+        self.assertEqual(response['ETag'], etag)
+
+    async def test_async_etag(self):
+        request = AsyncRequestFactory().get(self.url)
+        response = await async_views.tree_view(request)
+        self.assertEqual(response.status_code, 200)
+        request = AsyncRequestFactory().get(
+            self.url, headers={'If-None-Match': response['ETag']})
+        response = await async_views.tree_view(request)
+        self.assertEqual(response.status_code, 304)
+
+    def _post_trees(self, trees):
+        return self.client.post('/search/trees/', {'trees': trees},
+                                content_type='application/json')
+
+    def test_trees(self):
+        trees = [{'database': 'TREES_DB', 'sentence_id': 's1'},
+                 {'database': 'UNKNOWN_DB', 'sentence_id': 's1'},
+                 {'database': 'TREES_DB', 'sentence_id': 's1'}]
+        response = self._post_trees(trees)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in
+                 b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['index'] for line in lines], [0, 2, 1])
+        self.assertEqual(lines[0]['tree'], '<alpino_ds id="s1"/>')
+        # UNKNOWN_DB does not exist in BaseX (or BaseX is not running)
+        self.assertIn('error', lines[2])
+
+    async def test_async_trees(self):
+        request = AsyncRequestFactory().post(
+            '/', {'trees': [{'database': 'TREES_DB', 'sentence_id': 's1'}]},
+            content_type='application/json'
+        )
+        response = await async_views.trees_view(request)
+        lines = [json.loads(line) async for line
+                 in response.streaming_content]
+        self.assertEqual(lines, [{'index': 0,
+                                  'tree': '<alpino_ds id="s1"/>'}])
+
+    def test_trees_invalid(self):
+        response = self._post_trees([{'database': 'TREES_DB'}])
+        self.assertEqual(response.status_code, 400)
+        response = self._post_trees(
+            [{'database': 'TREES"DB', 'sentence_id': 's1'}])
+        self.assertEqual(response.status_code, 400)
+        with self.settings(MAXIMUM_TREES_BATCH=1):
+            response = self._post_trees(
+                [{'database': 'TREES_DB', 'sentence_id': 's1'}] * 2)
+        self.assertEqual(response.status_code, 400)
+
+    def test_sentence_location(self):
+        data = {'database': 'TREES_DB', 'sentence_id': 's1'}
+        self.assertNotIn('db:open-pre', get_tree_request(data).xquery)
+        SentenceLocation.objects.create(database=self.database,
+                                        sentence_id='s1', pre=3)
+        self.assertIn('db:open-pre("TREES_DB", 3)',
+                      get_tree_request(data).xquery)
+
+    def test_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        # Uploading the database again changes its revision
+        self.database.save()
+        self.assertEqual(len(tree_cache), 0)
+        tree_cache.set('TREES_DB', 's1', self.database.updated.isoformat(),
+                       '<alpino_ds id="s1"/>')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CountTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='count', title='Count')
+        self.databases = []
+        for slug in ['comp1', 'comp2']:
+            component = Component.objects.create(
+                slug=slug, title=slug, nr_sentences=1, nr_words=1,
+                treebank=treebank
+            )
+            for number in range(2):
+                self.databases.append(BaseXDB.objects.create(
+                    dbname='COUNT_{}_{}'.format(slug, number), size=1,
+                    component=component
+                ))
+        # Cache all counts, so that BaseX is not needed
+        for number, database in enumerate(self.databases):
+            DatabaseCount.objects.create(xpath='//node', database=database,
+                                         count=number)
+        self.data = {'xpath': '//node', 'treebank': 'count',
+                     'components': ['comp1', 'comp2']}
+
+    def _post(self, data):
+        return self.client.post('/search/count/', data,
+                                content_type='application/json')
+
+    def test_cached(self):
+        response = self._post(self.data)
+        self.assertEqual(response.status_code, 200)
+        lines = [json.loads(line) for line in
+                 b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(lines, [
+            {'component': 'comp1', 'count': 1, 'completed': True},
+            {'component': 'comp2', 'count': 5, 'completed': True},
+            {'total': 6, 'completed': True},
+        ])
+
+    def test_not_cached(self):
+        # The count of a changed database is no longer valid
+        self.databases[0].save()
+        self.assertEqual(DatabaseCount.objects.count(), 3)
+        # The database does not exist in BaseX (or BaseX is not running)
+        self.databases[0].dbname = 'COUNT_UNKNOWN'
+        self.databases[0].save()
+        lines = [json.loads(line) for line in b''.join(
+            self._post(self.data).streaming_content).splitlines()]
+        self.assertEqual(lines[0], {'component': 'comp1', 'count': 1,
+                                    'completed': False})
+        self.assertIn({'component': 'comp1', 'count': 1, 'completed': True,
+                       'error': 'BaseX error'}, lines)
+        self.assertEqual(lines[-1], {'total': 6, 'completed': False})
+
+    def test_purge(self):
+        DatabaseCount.objects.filter(database=self.databases[0]).update(
+            counted=timezone.now() - timedelta(
+                seconds=settings.COUNT_CACHE_MAX_AGE + 1))
+        call_command('purge_cache', '--no-warm-up', stdout=StringIO())
+        self.assertEqual(DatabaseCount.objects.count(), 3)
+        self.assertFalse(DatabaseCount.objects.filter(
+            database=self.databases[0]).exists())
+
+    def test_invalid(self):
+        response = self._post(dict(self.data, components=['comp3']))
+        self.assertEqual(response.status_code, 400)
+        response = self._post(dict(self.data, xpath='//node['))
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async(self):
+        request = AsyncRequestFactory().post(
+            '/', self.data, content_type='application/json')
+        response = await async_views.count_view(request)
+        lines = [json.loads(line) async for line
+                 in response.streaming_content]
+        self.assertEqual(lines[-1], {'total': 6, 'completed': True})
+
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        path = pathlib.Path(self.temp_dir.name)
+        self.settings_override = self.settings(
+            CACHING_DIR=path / 'cache', EXPORT_DIR=path / 'exports')
+        self.settings_override.enable()
+        treebank = Treebank.objects.create(slug='export', title='Export')
+        self.component = Component.objects.create(
+            slug='comp', title='comp', nr_sentences=2, nr_words=6,
+            treebank=treebank
+        )
+        BaseXDB.objects.create(dbname='EXPORT_DB', size=1,
+                               component=self.component)
+        self.matches = [
+            '<match>s1||Een zin.||1||0||<node id="1"/>||||||EXPORT_DB'
+            '</match>',
+            '<match>s2||Zin, met "komma".||1||0||<node id="1"/>||||||'
+            'EXPORT_DB</match>',
+        ]
+        # Cache all matches, so that BaseX is not needed
+        self.result_obj = ComponentSearchResult.objects.create(
+            xpath='//node', component=self.component,
+            search_completed=timezone.now(), number_of_results=2,
+            completed_part=1, cache_version=cache.VERSION,
+            database_versions=self.component.get_database_versions()
+        )
+        matches = ''.join(self.matches)
+        encoded = matches.encode()
+        self.result_obj._get_cache_path().write_text(
+            cache.HEADER + matches +
+            cache.database_record('EXPORT_DB', 2, len(encoded),
+                                  zlib.crc32(encoded)) +
+            cache.complete_record(2, 2, 1),
+            encoding='utf-8'
+        )
+        self.data = {'xpath': '//node', 'treebank': 'export',
+                     'components': ['comp']}
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.temp_dir.cleanup()
+
+    def test_export(self):
+        lines = ResultExport('//node', [], 'csv',
+                             [self.component]).iter_lines()
+        rows = list(csv.reader(StringIO(''.join(lines))))
+        self.assertEqual(rows[0][:3], ['component', 'database', 'sentid'])
+        self.assertEqual([row[2] for row in rows[1:]],
+                         ['s1+match=1', 's2+match=2'])
+        self.assertEqual(rows[2][3], 'Zin, met "komma".')
+        lines = ResultExport('//node', [], 'tsv',
+                             [self.component]).iter_lines()
+        self.assertEqual(''.join(lines).splitlines()[1].split('\t')[:4],
+                         ['comp', 'EXPORT_DB', 's1+match=1', 'Een zin.'])
+
+    def test_partial_cache(self):
+        # Results that were only counted are not in the cache
+        self.result_obj.number_of_results = 3
+        self.result_obj.save()
+        result_export = ResultExport('//node', [], 'jsonl', [self.component])
+        self.assertIsNone(result_export.sources[0].cache_path)
+        self.assertEqual(len(result_export.sources[0].queries), 1)
+
+    def test_export_view(self):
+        response = self.client.post('/search/export/',
+                                    dict(self.data, format='jsonl'),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('gretel-export.jsonl',
+                      response['Content-Disposition'])
+        lines = [json.loads(line) for line in
+                 b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([line['sentence'] for line in lines],
+                         ['Een zin.', 'Zin, met "komma".'])
+        response = self.client.post('/search/export/',
+                                    dict(self.data, format='pdf'),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_async_export_view(self):
+        request = AsyncRequestFactory().post(
+            '/', dict(self.data, format='jsonl'),
+            content_type='application/json'
+        )
+        response = await async_views.export_view(request)
+        content = b''.join([chunk async for chunk
+                            in response.streaming_content])
+        self.assertEqual(len(content.splitlines()), 2)
+
+    def test_parse_range(self):
+        self.assertIsNone(parse_range(None, 10))
+        self.assertIsNone(parse_range('bytes=1-2,4-5', 10))
+        self.assertEqual(parse_range('bytes=2-', 10), (2, 9))
+        self.assertEqual(parse_range('bytes=2-4', 10), (2, 4))
+        self.assertEqual(parse_range('bytes=2-20', 10), (2, 9))
+        self.assertEqual(parse_range('bytes=-3', 10), (7, 9))
+        with self.assertRaises(ValueError):
+            parse_range('bytes=10-', 10)
+
+    def test_download(self):
+        search_export = SearchExport.objects.create(xpath='//node',
+                                                    format='jsonl')
+        search_export.components.add(self.component)
+        url = '/search/export/{}/download/'.format(search_export.id)
+        self.assertEqual(self.client.get(url).status_code, 409)
+        write_export(search_export)
+        status = self.client.get(
+            '/search/export/{}/'.format(search_export.id)).json()
+        self.assertTrue(status['finished'])
+        self.assertEqual(status['number_of_results'], 2)
+        content = search_export.get_path().read_bytes()
+        self.assertEqual(status['size'], len(content))
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        # Resume the download
+        response = self.client.get(url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[10:])
+        self.assertEqual(response['Content-Range'],
+                         'bytes 10-{}/{}'.format(len(content) - 1,
+                                                 len(content)))
+        response = self.client.get(url, HTTP_RANGE='bytes=10-',
+                                   HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            url, HTTP_RANGE='bytes={}-'.format(len(content)))
+        self.assertEqual(response.status_code, 416)
+
+        # Expired exports are deleted with their files
+        SearchExport.objects.update(
+            created=timezone.now() - timedelta(days=30))
+        self.assertEqual(SearchExport.purge(), 1)
+        self.assertFalse(search_export.get_path().exists())
+
+    async def test_async_download(self):
+        search_export = await SearchExport.objects.acreate(xpath='//node',
+                                                           format='csv')
+        await search_export.components.aadd(self.component)
+        await sync_to_async(write_export)(search_export)
+        request = AsyncRequestFactory().get(
+            '/', headers={'Range': 'bytes=-5'})
+        response = await async_views.export_download_view(
+            request, export_id=search_export.id)
+        self.assertEqual(response.status_code, 206)
+        content = b''.join([chunk async for chunk
+                            in response.streaming_content])
+        self.assertEqual(content, search_export.get_path().read_bytes()[-5:])
+
+
+class AsyncViewsTestCase(TestCase):
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+
+    def post(self, data):
+        return self.factory.post('/', data, content_type='application/json')
+
+    async def test_tree_view(self):
+        response = await async_views.tree_view(self.post({'database': 'DB'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'sentence_id', response.content)
+        response = await async_views.tree_view(
+            self.post({'database': 'DB"', 'sentence_id': '1'}))
+        self.assertEqual(response.status_code, 400)
+        response = await async_views.tree_view(self.factory.put('/'))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_metadata_count_view(self):
+        response = await async_views.metadata_count_view(self.post({
+            'xpath': '//node', 'treebank': 'unknown', 'components': ['c']
+        }))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Component c not found', response.content)
+        # No databases to count
+        response = await async_views.metadata_count_view(self.post({
+            'xpath': '//node', 'treebank': 'unknown', 'components': []
+        }))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'{}')
+
+    async def test_search_view(self):
+        response = await async_views.search_view(self.post({
+            'xpath': '//node', 'treebank': 'unknown', 'components': ['c']
+        }))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(b'Not all requested components', response.content)
+
+
+class PhaseTimerTestCase(TestCase):
+    def test_iterate(self):
+        timer = PhaseTimer()
+        items = list(timer.iterate(iter([1, 2, 3]), 'first', 'rest'))
+        self.assertEqual(items, [1, 2, 3])
+        self.assertEqual(set(timer.as_dict()), {'first', 'rest'})
+        with timer.phase('first'):
+            pass
+        self.assertGreaterEqual(timer.as_dict()['first'], 0)
+
+
+class CacheTestCase(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.cache_dir.name) / 'cache'
+        self.matches = ['<match>é</match>', '<match>b</match>']
+        content = cache.HEADER
+        for database, match in zip(['DB1', 'DB2'], self.matches):
+            encoded = match.encode()
+            content += match + cache.database_record(
+                database, 1, len(encoded), zlib.crc32(encoded))
+        self.partial = content
+        self.content = content + cache.complete_record(2, 3, 2)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_parse(self):
+        matches, databases, complete = cache.parse(self.content)
+        self.assertEqual(matches, ''.join(self.matches))
+        self.assertEqual([record['name'] for record in databases],
+                         ['DB1', 'DB2'])
+        self.assertEqual(complete,
+                         {'matches': 2, 'results': 3, 'databases': 2})
+        # An incomplete match of a database that is being searched is
+        # left out
+        matches, databases, complete = cache.parse(
+            self.partial + '<match>c</match><match>d')
+        self.assertEqual(matches, ''.join(self.matches) + '<match>c</match>')
+        self.assertIsNone(complete)
+        self.assertEqual(cache.parse(''), ('', [], None))
+
+    def test_corrupt(self):
+        with self.assertRaises(cache.CacheError):
+            cache.parse(self.content.replace('<match>b', '<match>c'))
+        with self.assertRaises(cache.CacheError):
+            cache.parse(self.content.replace('databases="2"',
+                                             'databases="3"'))
+        with self.assertRaises(cache.CacheError):
+            cache.parse('<match>a</match>')
+
+    def test_read_complete_record(self):
+        self.assertIsNone(cache.read_complete_record(self.path))
+        self.path.write_text(self.partial, encoding='utf-8')
+        self.assertTrue(cache.has_header(self.path))
+        self.assertIsNone(cache.read_complete_record(self.path))
+        self.path.write_text(self.content, encoding='utf-8')
+        self.assertEqual(cache.read_complete_record(self.path)['results'], 3)
+
+    def test_iter_matches(self):
+        self.path.write_text(self.content, encoding='utf-8')
+        self.assertEqual(list(cache.iter_matches(self.path)), self.matches)
+        # Matches and records may be split over several chunks
+        chunk_size = cache.READ_CHUNK_SIZE
+        try:
+            cache.READ_CHUNK_SIZE = 3
+            self.assertEqual(list(cache.iter_matches(self.path)),
+                             self.matches)
+        finally:
+            cache.READ_CHUNK_SIZE = chunk_size
+
+
+class SentenceLocationTestCase(TestCase):
+    def test_locations(self):
+        if not test_treebank:
+            return self.skipTest('requires an uploaded test treebank')
+        database = BaseXDB.objects.filter(
+            component__treebank=test_treebank).first()
+        # Locations are stored when uploading
+        locations = database.sentence_locations.all()
+        self.assertEqual(len(locations),
+                         int(basex.perform_query(
+                             'count(db:open("{}")/treebank/alpino_ds)'
+                             .format(database.dbname), database.dbname)))
+        location = locations[len(locations) // 2]
+        by_id = basex.perform_query(generate_xquery_showtree(
+            database.dbname, location.sentence_id))
+        self.assertEqual(basex.perform_query(generate_xquery_showtree(
+            database.dbname, location.sentence_id, location.pre)), by_id)
+        # A wrong location is ignored
+        self.assertEqual(basex.perform_query(generate_xquery_showtree(
+            database.dbname, location.sentence_id, location.pre + 1)), by_id)
+        self.assertEqual(basex.perform_query(generate_xquery_showtree(
+            database.dbname, location.sentence_id, 10 ** 12)), by_id)
+        self.assertEqual(database.build_sentence_index(), len(locations))
+
+
 class ComponentSearchResultTestCase(TestCase):
     def test_perform_search(self):
         if not basex.test_connection():
@@ -208,8 +1162,39 @@ class ComponentSearchResultTestCase(TestCase):
             self.assertEqual(csr.errors, '')
             # Actual number of results should be correct
             self.assertEqual(len(csr.get_results()), csr.number_of_results)
+            # Timings are recorded for every database
+            self.assertEqual(len(csr.timings['databases']),
+                             component.databases.count())
             csr.delete()  # Delete because CSR auto-saves
 
+    def test_resume_search(self):
+        if not basex.test_connection():
+            return self.skipTest('requires running BaseX server')
+        if not test_treebank:
+            return self.skipTest('requires an uploaded test treebank')
+        with self.settings(CACHING_DIR=test_cache_path):
+            component = test_treebank.components.get(slug='troonrede19')
+            csr = ComponentSearchResult(xpath=XPATH1, component=component)
+            csr.perform_search()
+            cache = csr._get_cache_path().read_text()
+            self.assertEqual(len(csr.completed_databases),
+                             component.databases.count())
+            # Simulate a crash during the search of the second database
+            csr.search_completed = None
+            csr.completed_databases = csr.completed_databases[:1]
+            csr.number_of_results = csr.completed_databases[0]['results']
+            csr.save()
+            csr._get_cache_path().rename(csr._get_partial_cache_path())
+            with csr._get_partial_cache_path().open('a') as f:
+                f.write('<match>incomplete')
+            csr.perform_search()
+            self.assertEqual(csr.timings['resumed_after'], 1)
+            self.assertEqual(len(csr.timings['databases']),
+                             component.databases.count() - 1)
+            self.assertEqual(csr._get_cache_path().read_text(), cache)
+            self.assertEqual(csr.number_of_results, 4)
+            csr.delete()
+
 
 class SearchQueryTestCase(TestCase):
     def setUp(self):
@@ -357,3 +1342,54 @@ class SearchQueryTestCase(TestCase):
             results = list(sq.get_results()[0])
             # the test here is that nothing throws
             self.assertEqual(len(results), 0)
+
+
+class QueryCountTestCase(TestCase):
+    """Check that the number of SQL queries does not depend on the number
+    of components. This does not need BaseX."""
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.treebank = Treebank.objects.create(slug='querycount',
+                                                title='Query count')
+        # Not more than 50 components, because SQLite splits bulk inserts
+        # of many rows into batches
+        for i in range(50):
+            component = Component.objects.create(
+                slug='comp{}'.format(i), title='comp{}'.format(i),
+                nr_sentences=0, nr_words=0, treebank=self.treebank
+            )
+            BaseXDB.objects.create(dbname='QUERYCOUNT_{}'.format(i),
+                                   size=10, component=component)
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def _count_queries(self, number_of_components):
+        """Return the number of queries for SearchQuery.initialize() and
+        get_results() and the metadata count view"""
+        components = self.treebank.components.order_by('slug')[
+            :number_of_components]
+        with self.settings(CACHING_DIR=pathlib.Path(self.cache_dir.name)):
+            sq = SearchQuery(xpath=XPATH1)
+            sq.save()
+            sq.components.add(*components)
+            with CaptureQueriesContext(connection) as initialize_queries:
+                sq.initialize()
+            self.assertEqual(sq.total_database_size,
+                             10 * number_of_components)
+            self.assertEqual(sq.results.count(), number_of_components)
+            with CaptureQueriesContext(connection) as results_queries:
+                sq.get_results()
+        with CaptureQueriesContext(connection) as metadata_queries:
+            response = self.client.post(
+                '/search/metadata-count/',
+                {'xpath': XPATH1, 'treebank': 'querycount',
+                 'components': [c.slug for c in components]},
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        return (len(initialize_queries), len(results_queries),
+                len(metadata_queries))
+
+    def test_query_counts(self):
+        self.assertEqual(self._count_queries(2), self._count_queries(50))
@@ -0,0 +1,64 @@
+"""Helpers to measure how much time is spent in the phases of a search."""
+
+from collections import defaultdict
+from contextlib import contextmanager
+import json
+import logging
+import time
+from typing import Dict, Iterable, Iterator, TypeVar
+
+T = TypeVar('T')
+
+
+class PhaseTimer:
+    """Accumulates the wall clock time spent in named phases."""
+    def __init__(self):
+        self.phases: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - start
+
+    def add(self, name: str, seconds: float) -> None:
+        self.phases[name] += seconds
+
+    def merge(self, other: 'PhaseTimer') -> None:
+        """Add the time spent in the phases of other, e.g. of a timer
+        that was used in another thread"""
+        for name, seconds in other.phases.items():
+            self.phases[name] += seconds
+
+    def iterate(self, iterable: Iterable[T], first_phase: str,
+                phase: str) -> Iterator[T]:
+        """Iterate over iterable, adding the time spent waiting for the
+        first item to first_phase and the time spent waiting for the other
+        items to phase. For BaseX results, this roughly separates query
+        evaluation from transfer of the results."""
+        iterator = iter(iterable)
+        name = first_phase
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.phases[name] += time.perf_counter() - start
+                return
+            self.phases[name] += time.perf_counter() - start
+            name = phase
+            yield item
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(seconds, 6)
+                for name, seconds in self.phases.items()}
+
+
+def log_timings(logger: logging.Logger, message: str, record: dict) -> None:
+    """Emit a log record with the timings both in the message (as JSON)
+    and as the search_timings attribute of the record, for handlers that
+    process structured data."""
+    logger.info('%s: %s', message, json.dumps(record),
+                extra={'search_timings': record})
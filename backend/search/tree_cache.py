@@ -0,0 +1,80 @@
+"""Cache of sentence trees shown by the tree views. Trees do not change
+once a database has been uploaded, so they are kept in memory per
+process, keyed by database and sentence id, and the least recently used
+trees are evicted when the cache becomes larger than
+settings.TREE_CACHE_SIZE. Every tree is stored with the revision of its
+database (see BaseXDB.updated), so that trees of a database that was
+uploaded again by another process are not used."""
+from django.conf import settings
+
+from collections import OrderedDict
+import threading
+from typing import Optional, Tuple
+
+from services.metrics import metrics
+
+
+class TreeCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (database, sentence id): (revision, tree), least recently used
+        # first
+        self._trees: 'OrderedDict[Tuple[str, str], Tuple[str, str]]' = \
+            OrderedDict()
+        self._size = 0
+
+    @property
+    def size(self) -> int:
+        """Total length of the cached trees"""
+        return self._size
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def get(self, database: str, sentence_id: str,
+            revision: str) -> Optional[str]:
+        """Return the cached tree, or None if it is not cached for this
+        revision of the database"""
+        key = (database, sentence_id)
+        with self._lock:
+            cached = self._trees.get(key)
+            if cached is not None and cached[0] != revision:
+                self._remove(key)
+                cached = None
+            if cached is not None:
+                self._trees.move_to_end(key)
+        metrics.increment('gretel_tree_cache_requests_total',
+                          result='miss' if cached is None else 'hit')
+        return None if cached is None else cached[1]
+
+    def set(self, database: str, sentence_id: str, revision: str,
+            tree: str) -> None:
+        maximum_size = settings.TREE_CACHE_SIZE * 1024 * 1024
+        if len(tree) > maximum_size:
+            return
+        key = (database, sentence_id)
+        with self._lock:
+            if key in self._trees:
+                self._remove(key)
+            self._trees[key] = (revision, tree)
+            self._size += len(tree)
+            while self._size > maximum_size:
+                self._remove(next(iter(self._trees)))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        _, tree = self._trees.pop(key)
+        self._size -= len(tree)
+
+    def invalidate(self, database: str) -> None:
+        """Remove the trees of a database"""
+        with self._lock:
+            for key in [key for key in self._trees if key[0] == database]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._trees.clear()
+            self._size = 0
+
+
+tree_cache = TreeCache()
@@ -1,3 +1,4 @@
+import re
 from dataclasses import dataclass
 from typing import Iterable, Optional, Callable
 
@@ -75,6 +76,12 @@ class Result:
     def id(self) -> str:
         return self._match.sentid
 
+    @property
+    def context_id(self) -> str:
+        """Id of the sentence in the treebank, without the number of the
+        match within the sentence"""
+        return re.sub(r'\+match=\d+$', '', self._match.sentid)
+
     def __eq__(self, other):
         # used for testing purposes
         return self._match == other._match
@@ -1,9 +1,24 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import search_view, tree_view, metadata_count_view
+from .views import (search_view, cancel_query_view, tree_view, trees_view,
+                    metadata_count_view, count_view, export_view,
+                    export_status_view, export_download_view)
+
+if settings.ASYNC_VIEWS:
+    from .async_views import (  # noqa: F811
+        search_view, tree_view, trees_view, metadata_count_view,
+        count_view, export_view, export_download_view
+    )
 
 urlpatterns = [
     path('search/', search_view),
+    path('cancel/', cancel_query_view),
     path('tree/', tree_view),
+    path('trees/', trees_view),
     path('metadata-count/', metadata_count_view),
+    path('count/', count_view),
+    path('export/', export_view),
+    path('export/<uuid:export_id>/', export_status_view),
+    path('export/<uuid:export_id>/download/', export_download_view),
 ]
@@ -1,5 +1,8 @@
 from collections import Counter
 from functools import partial
+import hashlib
+import json
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 from rest_framework.response import Response
 from rest_framework.decorators import (
@@ -10,17 +13,28 @@ from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
 from rest_framework.authentication import BasicAuthentication
 from rest_framework import status
 from django.conf import settings
+from django.db.models import OuterRef, Subquery
 from django.db.utils import IntegrityError
-
-from treebanks.models import Component, BaseXDB, Treebank
-from .models import SearchQuery
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import parse_etags
+
+from treebanks.models import Component, BaseXDB, SentenceLocation, Treebank
+from .count import CountRequest
+from .export import (ResultExport, check_export, get_database_size,
+                     get_export_download)
+from .models import SearchQuery, SearchExport
 from .basex_search import (
-    generate_xquery_showtree, generate_xquery_metadata_count,
+    generate_xquery_showtree, generate_xquery_showtrees,
+    generate_xquery_metadata_count,
     parse_metadata_count_result
 )
-from .tasks import run_search_query
+from .tasks import schedule_search, schedule_export
+from .timing import PhaseTimer, log_timings
+from .tree_cache import tree_cache
 from .types import ResultSet
 from services.basex import basex
+from services.metrics import metrics
 
 from sastadev.treebankfunctions import indextransform
 from mwe_query.canonicalform import expandfull
@@ -48,10 +62,8 @@ def _create_component_on_the_fly(component_slug: str, _treebank: str) -> None:
     dbname = component_slug[len('GRETEL-UPLOAD-'):]
     basex_db = BaseXDB(dbname)
     try:
-        basex_db.size = basex_db.get_db_size()
-        nr_sentences = basex_db.get_number_of_sentences()
-        nr_words = basex_db.get_number_of_words()
-    except OSError:
+        statistics = basex_db.get_statistics()
+    except (OSError, ValueError):
         log.error('Tried to create component for BaseX database {} '
                   'for gretel-upload compatibility, but BaseX '
                   'database does not exist.'.format(dbname))
@@ -59,9 +71,10 @@ def _create_component_on_the_fly(component_slug: str, _treebank: str) -> None:
         # will see that not all components exist
         return
     treebank, _ = Treebank.objects.get_or_create(slug=_treebank)
+    basex_db.size = statistics['size']
     component = Component(slug=component_slug, title=component_slug,
-                          nr_sentences=nr_sentences,
-                          nr_words=nr_words)
+                          nr_sentences=statistics['sentences'],
+                          nr_words=statistics['words'])
     component.treebank = treebank
     component.save()
     basex_db.component = component
@@ -101,6 +114,16 @@ def _get_or_create_components(component_slugs, treebank):
                                     treebank__slug=treebank)
 
 
+def _get_owner(request) -> str:
+    """Return an identification of the user or, for anonymous users,
+    the session that performs a request"""
+    if request.user.is_authenticated:
+        return 'user:{}'.format(request.user.pk)
+    if not request.session.session_key:
+        request.session.save()
+    return 'session:{}'.format(request.session.session_key)
+
+
 def filter_expand(results: ResultSet) -> ResultSet:
     for result in results:
         try:
@@ -124,23 +147,16 @@ def filter_exclude(xpath: str, results: ResultSet) -> ResultSet:
             yield result
 
 
-@api_view(['POST'])
-@authentication_classes([BasicAuthentication])  # No CSRF verification for now
-@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
-@parser_classes([JSONParser])
-def search_view(request):
-    data = request.data
-    try:
-        xpath = data['xpath']
-        treebank = data['treebank']
-        component_slugs = data['components']
-    except KeyError as err:
-        return Response(
-            {'error': '{} is missing'.format(err)},
-            status=status.HTTP_400_BAD_REQUEST
-        )
+def get_search_results(request, data) \
+        -> Tuple[SearchQuery, ResultSet, float, list]:
+    """Start or continue the search of a search request and return the
+    search query with its results so far, the percentage of completion
+    and the counts per component. Raise KeyError if a required parameter
+    is missing and ValueError if the request is not valid."""
+    xpath = data['xpath']
+    treebank = data['treebank']
+    component_slugs = data['components']
     query_id = data.get('query_id', None)
-    start_from = data.get('start_from', 0)
     is_analysis = data.get('is_analysis', False)
     variables = data.get('variables', [])
     behaviour = data.get('behaviour', {})
@@ -171,20 +187,22 @@ def search_view(request):
             # TODO: also check if the component list is correct
             query = SearchQuery.objects.get(pk=query_id)
         except SearchQuery.DoesNotExist:
-            return Response(
-                {'error': 'Cannot find given query_id'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            raise ValueError('Cannot find given query_id')
+        # A search that was stopped because the client stopped polling is
+        # resumed (see below)
+        resume = query.is_abandoned()
+        # Let the worker know right away that the client is still polling,
+        # because getting the results (and their context) may take a while
+        query.touch()
     else:
         new_query = True
         component_objects = _get_or_create_components(component_slugs,
                                                       treebank)
         if component_objects.count() != len(component_slugs):
-            return Response(
-                {'error': 'Not all requested components could be found.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        query = SearchQuery(xpath=xpath, variables=variables)
+            raise ValueError('Not all requested components could be found.')
+        query = SearchQuery(xpath=xpath, variables=variables,
+                            owner=_get_owner(request),
+                            last_accessed=timezone.now())
         query.save()
         query.components.add(*component_objects)
         query.initialize()
@@ -199,11 +217,7 @@ def search_view(request):
         query.add_filter(partial(filter_exclude, exclusion_xpath))
 
     if new_query:
-        try:
-            run_search_query.delay(query.pk)
-        except run_search_query.OperationalError:
-            # No connection with message broker - run synchronously
-            run_search_query.apply((query.pk,))
+        schedule_search(query)
 
     # Get results so far, if any.
     # We store the ids of returned results in the request session,
@@ -212,16 +226,29 @@ def search_view(request):
     returned = set(request.session.get(session_key, []))
     maximum_results = max(0, maximum_results - len(returned))
     results, percentage, counts = query.get_results(maximum_results, exclude=returned)
+    if not new_query and resume and query.finished is not None and \
+            not query.cancelled and percentage < 100:
+        # Components that have been searched completely are skipped
+        schedule_search(query)
     returned |= set(r.id for r in results)
     request.session[session_key] = list(returned)
+    return query, results, percentage, counts
 
-    if data.get('retrieveContext'):
-        results = query.augment_with_context(results)
 
+def get_search_response(query: SearchQuery, results: ResultSet,
+                        percentage: float, counts: list, timer: PhaseTimer,
+                        api_view: bool = False) -> dict:
+    """Return the response to a search request. If api_view is True,
+    only part of the results is returned"""
     # serialize results
-    results = [result.as_dict() for result in results]
-
-    if request.accepted_renderer.format == 'api':
+    with timer.phase('serialization'):
+        results = [result.as_dict() for result in results]
+    metrics.observe_phases(timer.phases)
+    log_timings(log, 'Search view timings for query {}'.format(query.id),
+                dict(query.timings, **timer.as_dict(),
+                     number_of_results=len(results)))
+
+    if api_view:
         # If using the API view, only show part of the results, because
         # the HTML rendering of Django Rest Framework turns out to be
         # very slow
@@ -237,8 +264,38 @@ def search_view(request):
         response['errors'] = query.get_errors()
     if query.cancelled is True:
         response['cancelled'] = True
+    return response
 
-    return Response(response)
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication])  # No CSRF verification for now
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+@parser_classes([JSONParser])
+def search_view(request):
+    data = request.data
+    try:
+        query, results, percentage, counts = \
+            get_search_results(request, data)
+    except KeyError as err:
+        return Response(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as err:
+        return Response(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    timer = PhaseTimer()
+    if data.get('retrieveContext'):
+        with timer.phase('context'):
+            results = query.augment_with_context(results)
+
+    return Response(get_search_response(
+        query, results, percentage, counts, timer,
+        request.accepted_renderer.format == 'api'
+    ))
 
 
 @api_view(['POST'])
@@ -259,63 +316,267 @@ def cancel_query_view(request):
     try:
         # We also require the right XPath to avoid the possibility of
         # tampering with queries of other users.
-        # TODO: also check if the component list is correct
         query = SearchQuery.objects.get(xpath=xpath, pk=query_id)
     except SearchQuery.DoesNotExist:
         return Response(
             {'error': 'Cannot find given query_id'},
             status=status.HTTP_400_BAD_REQUEST
         )
+    # The worker performing the search stops the running BaseX query
+    # within SEARCH_WATCHDOG_INTERVAL seconds
     query.cancel_search()
-
-
-@api_view(['POST'])
+    return Response({'query_id': query.id, 'cancelled': True})
+
+
+class TreeRequest(NamedTuple):
+    database: str
+    sentence_id: str
+    xquery: str
+    # Revision of the database (see BaseXDB.updated), or None if the
+    # database is unknown and the tree cannot be cached
+    revision: Optional[str]
+    # False if the tree may only be cached by the browser of the user
+    public: bool
+
+    @property
+    def etag(self) -> Optional[str]:
+        if self.revision is None:
+            return None
+        return '"{}"'.format(hashlib.sha1('\0'.join(
+            [self.database, self.sentence_id, self.revision]
+        ).encode('utf-8')).hexdigest())
+
+    def get_headers(self) -> dict:
+        if self.revision is None:
+            return {}
+        return {
+            'ETag': self.etag,
+            'Cache-Control': '{}, max-age={}'.format(
+                'public' if self.public else 'private',
+                settings.TREE_MAX_AGE
+            ),
+        }
+
+    def is_not_modified(self, request) -> bool:
+        """Return True if the client already has this tree"""
+        if self.revision is None:
+            return False
+        etags = parse_etags(request.headers.get('If-None-Match', ''))
+        return self.etag in etags or '*' in etags
+
+    def get_cached(self) -> Optional[str]:
+        if self.revision is None:
+            return None
+        return tree_cache.get(self.database, self.sentence_id,
+                              self.revision)
+
+    def cache(self, tree: str) -> None:
+        # Empty results (unknown sentences) are not cached
+        if self.revision is not None and tree:
+            tree_cache.set(self.database, self.sentence_id, self.revision,
+                           tree)
+
+
+def get_tree_request(data) -> TreeRequest:
+    """Return the database, sentence, XQuery and caching information of
+    a tree request. Raise KeyError if a required parameter is missing and
+    ValueError if the request is not valid."""
+    database = data['database']
+    sentence_id = data['sentence_id']
+    # Check the database and sentence id before using them
+    generate_xquery_showtree(database, sentence_id)
+    revision = BaseXDB.objects.filter(dbname=database).annotate(
+        pre=Subquery(SentenceLocation.objects.filter(
+            database=OuterRef('pk'), sentence_id=sentence_id
+        ).values('pre')[:1])
+    ).values_list(
+        'updated', 'component__treebank__treebankupload__public', 'pre'
+    ).first()
+    if revision is None:
+        return TreeRequest(database, sentence_id,
+                           generate_xquery_showtree(database, sentence_id),
+                           None, False)
+    updated, public, pre = revision
+    # Treebanks that were not uploaded by users are public
+    return TreeRequest(database, sentence_id,
+                       generate_xquery_showtree(database, sentence_id, pre),
+                       updated.isoformat(), public is not False)
+
+
+@api_view(['GET', 'POST'])
 @authentication_classes([BasicAuthentication])  # No CSRF verification for now
 @renderer_classes([JSONRenderer, BrowsableAPIRenderer])
 @parser_classes([JSONParser])
 def tree_view(request):
-    data = request.data
+    # Trees can also be requested using GET, so that they can be cached
+    # by browsers and proxies
+    data = request.query_params if request.method == 'GET' else request.data
     try:
-        database = data['database']
-        sentence_id = data['sentence_id']
+        tree_request = get_tree_request(data)
     except KeyError as err:
         return Response(
             {'error': '{} is missing'.format(err)},
             status=status.HTTP_400_BAD_REQUEST
         )
-    try:
-        xquery = generate_xquery_showtree(database, sentence_id)
     except ValueError as err:
         return Response(
             {'error': str(err)},
             status=status.HTTP_400_BAD_REQUEST
         )
-    try:
-        result = basex.perform_query(xquery)
-    except OSError as err:
-        return Response(
-            {'error': str(err)},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+    headers = tree_request.get_headers()
+    if tree_request.is_not_modified(request):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    result = tree_request.get_cached()
+    if result is None:
+        try:
+            result = basex.perform_query(tree_request.xquery,
+                                         database=tree_request.database)
+        except OSError as err:
+            return Response(
+                {'error': str(err)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        tree_request.cache(result)
+    return Response({'tree': result}, headers=headers)
+
+
+class TreesRequest:
+    """Request for the trees of several sentences. Trees that are not
+    cached are fetched using one query per database. Every tree is
+    returned as a JSON line containing the index of the sentence in the
+    request and either the tree or an error."""
+
+    def __init__(self, data):
+        """Raise KeyError if a required parameter is missing and
+        ValueError if the request is not valid"""
+        trees = data['trees']
+        if not isinstance(trees, list) or not all(
+                isinstance(tree, dict) and
+                isinstance(tree.get('database'), str) and
+                isinstance(tree.get('sentence_id'), str)
+                for tree in trees):
+            raise ValueError('trees should be a list of objects with a '
+                             'database and a sentence_id')
+        if len(trees) > settings.MAXIMUM_TREES_BATCH:
+            raise ValueError('At most {} trees can be retrieved at once'
+                             .format(settings.MAXIMUM_TREES_BATCH))
+        # Indices of the requested trees that were not returned yet, per
+        # database and sentence id
+        self.indices: Dict[str, Dict[str, List[int]]] = {}
+        for index, tree in enumerate(trees):
+            self.indices.setdefault(tree['database'], {}) \
+                .setdefault(tree['sentence_id'], []).append(index)
+        for database, sentence_ids in self.indices.items():
+            # Check the database and sentence ids
+            generate_xquery_showtrees(database, list(sentence_ids))
+        self.pres = SentenceLocation.get_pres(
+            (database, sentence_id)
+            for database, sentence_ids in self.indices.items()
+            for sentence_id in sentence_ids
         )
-    return Response({'tree': result})
+        self.revisions = {
+            dbname: updated.isoformat() for dbname, updated in
+            BaseXDB.objects.filter(dbname__in=self.indices)
+            .values_list('dbname', 'updated')
+        }
+
+    def get_cached_lines(self) -> List[str]:
+        lines = []
+        for database, revision in self.revisions.items():
+            for sentence_id in list(self.indices[database]):
+                tree = tree_cache.get(database, sentence_id, revision)
+                if tree is not None:
+                    lines += self.get_lines(database, sentence_id, tree,
+                                            cache=False)
+        return lines
+
+    def get_queries(self) -> List[Tuple[str, str]]:
+        """Return the databases and queries of the trees that were not
+        returned yet"""
+        return [(database, generate_xquery_showtrees(
+                    database, list(sentence_ids),
+                    {sentence_id: self.pres[(database, sentence_id)]
+                     for sentence_id in sentence_ids
+                     if (database, sentence_id) in self.pres}
+                 ))
+                for database, sentence_ids in self.indices.items()
+                if sentence_ids]
+
+    def get_lines(self, database: str, sentence_id: str, tree: str,
+                  cache: bool = True) -> List[str]:
+        """Return the lines of a tree that was fetched"""
+        if cache and database in self.revisions:
+            tree_cache.set(database, sentence_id, self.revisions[database],
+                           tree)
+        return [json.dumps({'index': index, 'tree': tree}) + '\n'
+                for index in self.indices[database].pop(sentence_id, [])]
+
+    def get_missing_lines(self, database: str, error: str) -> List[str]:
+        """Return the lines of the trees of database that were not
+        found"""
+        sentence_ids = self.indices[database]
+        lines = [json.dumps({'index': index, 'error': error}) + '\n'
+                 for indices in sentence_ids.values() for index in indices]
+        sentence_ids.clear()
+        return lines
+
+
+def _fetch_trees(trees_request: TreesRequest) -> Iterator[str]:
+    yield from trees_request.get_cached_lines()
+    for database, xquery in trees_request.get_queries():
+        try:
+            items = basex.perform_query_iter(xquery, database=database)
+            # Every tree is preceded by its sentence id
+            for (_, sentence_id), (_, tree) in zip(items, items):
+                yield from trees_request.get_lines(database, sentence_id,
+                                                   tree)
+        except OSError as err:
+            log.error('Error in trees view: {}'.format(err))
+            yield from trees_request.get_missing_lines(database,
+                                                       'BaseX error')
+        else:
+            yield from trees_request.get_missing_lines(database,
+                                                       'Sentence not found')
 
 
 @api_view(['POST'])
 @authentication_classes([BasicAuthentication])  # No CSRF verification for now
 @renderer_classes([JSONRenderer, BrowsableAPIRenderer])
 @parser_classes([JSONParser])
-def metadata_count_view(request):
-    data = request.data
+def trees_view(request):
+    '''Return the trees of a list of sentences, given as objects with a
+    database and sentence_id. The trees are streamed back as JSON lines
+    containing the index of the sentence in the list and either tree or
+    error, grouped by database.'''
     try:
-        xpath = data['xpath']
-        treebank = data['treebank']
-        components = data['components']
+        trees_request = TreesRequest(request.data)
     except KeyError as err:
         return Response(
             {'error': '{} is missing'.format(err)},
             status=status.HTTP_400_BAD_REQUEST
         )
-    xml_pieces = []
+    except ValueError as err:
+        return Response(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return StreamingHttpResponse(_fetch_trees(trees_request),
+                                 content_type='application/x-ndjson')
+
+
+def get_metadata_count_queries(data) -> List[Tuple[str, str]]:
+    """Return the databases and XQueries of a metadata count request.
+    Raise KeyError if a required parameter is missing and ValueError if
+    the request is not valid."""
+    xpath = data['xpath']
+    treebank = data['treebank']
+    components = data['components']
+    component_objs = Component.objects.filter(
+        slug__in=components, treebank__slug=treebank
+    ).select_related('treebank').prefetch_related('databases')
+    component_objs = {component.slug: component
+                      for component in component_objs}
+    queries = []
     for component_slug in components:
         if component_slug.startswith('GRETEL-UPLOAD-'):
             # Directly access database - we cannot create
@@ -325,30 +586,227 @@ def metadata_count_view(request):
             # condition.
             dbs = [component_slug[len('GRETEL-UPLOAD-'):]]
         else:
-            component = Component.objects.get(
-                slug=component_slug, treebank__slug=treebank
-            )
+            component = component_objs.get(component_slug)
+            if component is None:
+                raise ValueError(
+                    'Component {} not found'.format(component_slug))
             if not component.treebank.metadata:
                 continue
             dbs = component.get_databases().keys()
         for db in dbs:
-            xquery = generate_xquery_metadata_count(db, xpath)
-            try:
-                xml_count_for_db = basex.perform_query(xquery)
-            except OSError as err:
-                return Response(
-                    {'error': 'BaseX search error'},
-                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                )
-                log.error('Error in metadata count view: {}'
-                          .format(err))
-            if xml_count_for_db == '<metadata/>':
-                continue
-            xml_pieces.append(
-                xml_count_for_db
-                .replace('<metadata>', '')
-                .replace('</metadata>', '')
-            )
+            queries.append((db, generate_xquery_metadata_count(db, xpath)))
+    return queries
+
+
+def combine_metadata_counts(xml_counts: List[str]) -> dict:
+    """Combine the results of metadata count queries of several
+    databases and return the counts"""
+    xml_pieces = []
+    for xml_count_for_db in xml_counts:
+        if xml_count_for_db == '<metadata/>':
+            continue
+        xml_pieces.append(
+            xml_count_for_db
+            .replace('<metadata>', '')
+            .replace('</metadata>', '')
+        )
     xml = '<metadata>' + ''.join(xml_pieces) + '</metadata>'
-    counts = parse_metadata_count_result(xml)
-    return Response(counts)
+    return parse_metadata_count_result(xml)
+
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication])  # No CSRF verification for now
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+@parser_classes([JSONParser])
+def metadata_count_view(request):
+    try:
+        queries = get_metadata_count_queries(request.data)
+    except KeyError as err:
+        return Response(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as err:
+        return Response(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    xml_counts = []
+    for db, xquery in queries:
+        try:
+            xml_counts.append(basex.perform_query(xquery, database=db))
+        except OSError as err:
+            log.error('Error in metadata count view: {}'
+                      .format(err))
+            return Response(
+                {'error': 'BaseX search error'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+    return Response(combine_metadata_counts(xml_counts))
+
+
+def get_count_request(data) -> CountRequest:
+    """Return the count of a count request. Raise KeyError if a required
+    parameter is missing and ValueError if the request is not valid."""
+    xpath = data['xpath']
+    treebank = data['treebank']
+    component_slugs = data['components']
+    components = {
+        component.slug: component
+        for component in Component.objects.filter(
+            slug__in=component_slugs, treebank__slug=treebank
+        ).prefetch_related('databases')
+    }
+    for component_slug in component_slugs:
+        if component_slug not in components:
+            raise ValueError('Component {} not found'.format(component_slug))
+    return CountRequest(xpath, [components[component_slug]
+                                for component_slug in component_slugs])
+
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication])  # No CSRF verification for now
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+@parser_classes([JSONParser])
+def count_view(request):
+    '''Return the exact number of occurrences of an XPath in every
+    component, without retrieving any results. The counts are streamed
+    back as JSON lines with the count of a component so far, sent when
+    one of its databases has been counted, followed by a line with the
+    total.'''
+    try:
+        count_request = get_count_request(request.data)
+    except KeyError as err:
+        return Response(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as err:
+        return Response(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    return StreamingHttpResponse(count_request.iter_lines(),
+                                 content_type='application/x-ndjson')
+
+
+def get_export(request, data) -> Union[ResultExport, SearchExport]:
+    """Return the export of all results of an export request: a
+    ResultExport to be streamed, or a SearchExport that is written to a
+    file in the background if the databases are larger than
+    settings.EXPORT_STREAMING_MAXIMUM_SIZE or if background is requested.
+    Raise KeyError if a required parameter is missing and ValueError if
+    the request is not valid."""
+    xpath = data['xpath']
+    treebank = data['treebank']
+    component_slugs = data['components']
+    variables = data.get('variables', [])
+    format_ = data.get('format', 'csv')
+    check_export(xpath, variables, format_)
+    components = _get_or_create_components(component_slugs, treebank)
+    if components.count() != len(component_slugs):
+        raise ValueError('Not all requested components could be found.')
+    components = list(components.order_by('slug')
+                      .prefetch_related('databases'))
+    if not data.get('background') and get_database_size(components) <= \
+            settings.EXPORT_STREAMING_MAXIMUM_SIZE:
+        return ResultExport(xpath, variables, format_, components)
+    search_export = SearchExport.objects.create(
+        xpath=xpath, variables=variables, format=format_,
+        owner=_get_owner(request)
+    )
+    search_export.components.add(*components)
+    schedule_export(search_export)
+    return search_export
+
+
+def get_export_response(result_export: ResultExport, lines) -> \
+        StreamingHttpResponse:
+    return StreamingHttpResponse(
+        lines, content_type=result_export.content_type,
+        headers={'Content-Disposition': 'attachment; filename="{}"'
+                 .format(result_export.filename)}
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([BasicAuthentication])  # No CSRF verification for now
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+@parser_classes([JSONParser])
+def export_view(request):
+    '''Export all results of a search as csv, tsv, jsonl or xml (the
+    trees of the matching sentences). Exports are streamed directly, or
+    for large exports the status of a file that is written in the
+    background is returned (see export_status_view). If a BaseX error
+    occurs while streaming, the response is cut off.'''
+    try:
+        result_export = get_export(request, request.data)
+    except KeyError as err:
+        return Response(
+            {'error': '{} is missing'.format(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    except ValueError as err:
+        return Response(
+            {'error': str(err)},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if isinstance(result_export, SearchExport):
+        return Response(result_export.get_status(),
+                        status=status.HTTP_202_ACCEPTED)
+    return get_export_response(result_export, result_export.iter_lines())
+
+
+@api_view(['GET'])
+@authentication_classes([BasicAuthentication])
+@renderer_classes([JSONRenderer, BrowsableAPIRenderer])
+def export_status_view(request, export_id):
+    try:
+        search_export = SearchExport.objects.get(pk=export_id)
+    except SearchExport.DoesNotExist:
+        return Response(
+            {'error': 'Cannot find given export_id'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    return Response(search_export.get_status())
+
+
+def get_export_download_response(search_export: Optional[SearchExport],
+                                 headers, iterate) -> HttpResponse:
+    """Return the response to a download request of an export, using
+    iterate(download) to get the contents of the file"""
+    if search_export is None:
+        return JsonResponse(
+            {'error': 'Cannot find given export_id'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if search_export.finished is None or search_export.errors:
+        return JsonResponse(
+            {'error': 'Export has not been completed'},
+            status=status.HTTP_409_CONFLICT
+        )
+    try:
+        download = get_export_download(search_export, headers)
+    except ValueError as err:
+        return JsonResponse(
+            {'error': str(err)},
+            status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={'Content-Range': 'bytes */{}'.format(search_export.size)}
+        )
+    return StreamingHttpResponse(iterate(download),
+                                 status=download.status,
+                                 content_type=download.content_type,
+                                 headers=download.get_headers())
+
+
+@api_view(['GET'])
+@authentication_classes([BasicAuthentication])
+def export_download_view(request, export_id):
+    '''Download the file of a completed export. Interrupted downloads
+    can be resumed by requesting the remaining bytes with a Range
+    header.'''
+    search_export = SearchExport.objects.filter(pk=export_id).first()
+    return get_export_download_response(
+        search_export, request.headers,
+        lambda download: download.iter_chunks()
+    )
@@ -0,0 +1,118 @@
+"""Precomputation of the results of popular searches, so that they are
+cached again after the cache has been emptied or purged, and so that
+popular searches on newly uploaded treebanks are fast from the start.
+Popularity is mined from the history of SearchQuery objects."""
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from datetime import timedelta
+import logging
+from typing import Iterable, List, NamedTuple, Optional
+
+from treebanks.models import Component
+from .models import ComponentSearchResult, SearchQuery
+
+logger = logging.getLogger(__name__)
+
+
+class WarmUpSearch(NamedTuple):
+    xpath: str
+    variables: list
+    component_id: int
+    count: int
+
+
+def _history():
+    since = timezone.now() - \
+        timedelta(days=settings.WARMUP_HISTORY_DAYS)
+    return SearchQuery.objects.filter(last_accessed__gte=since,
+                                      cancelled=False)
+
+
+def get_popular_searches(components: Optional[Iterable[Component]] = None,
+                         limit: Optional[int] = None) -> List[WarmUpSearch]:
+    """Return the searches that were performed at least
+    settings.WARMUP_MINIMUM_COUNT times in the last
+    settings.WARMUP_HISTORY_DAYS days, most popular first. If components
+    are given, the popular XPaths are combined with these components
+    instead, e.g. to predict the searches on a new treebank. Searches of
+    which the results are in the cache already are left out."""
+    if limit is None:
+        limit = settings.WARMUP_MAXIMUM_SEARCHES
+    if components is None:
+        popular = SearchQuery.components.through.objects.filter(
+            searchquery__in=_history()
+        ).values(
+            'searchquery__xpath', 'searchquery__variables', 'component_id'
+        ).annotate(count=Count('searchquery')).filter(
+            count__gte=settings.WARMUP_MINIMUM_COUNT
+        ).order_by('-count')
+        candidates = (WarmUpSearch(row['searchquery__xpath'],
+                                   row['searchquery__variables'],
+                                   row['component_id'], row['count'])
+                      for row in popular.iterator())
+    else:
+        component_ids = [component.pk for component in components]
+        popular = _history().values('xpath', 'variables').annotate(
+            count=Count('id')
+        ).filter(count__gte=settings.WARMUP_MINIMUM_COUNT).order_by('-count')
+        candidates = (WarmUpSearch(row['xpath'], row['variables'],
+                                   component_id, row['count'])
+                      for row in popular.iterator()
+                      for component_id in component_ids)
+    searches = []
+    for search in candidates:
+        if len(searches) >= limit:
+            break
+        if not is_cached(search):
+            searches.append(search)
+    return searches
+
+
+def is_cached(search: WarmUpSearch) -> bool:
+    try:
+        result = ComponentSearchResult.objects.get(
+            xpath=search.xpath, component_id=search.component_id,
+            variables=search.variables
+        )
+    except ComponentSearchResult.DoesNotExist:
+        return False
+    return result.search_completed is not None and not result.errors and \
+        result.check_results()
+
+
+def has_cache_space() -> bool:
+    """Return True if the cache is small enough to add results of a
+    warm-up search, so that warming up does not cause results that were
+    requested by users to be purged"""
+    size = ComponentSearchResult.objects.aggregate(
+        Sum('cache_size'))['cache_size__sum'] or 0
+    return size < settings.MAXIMUM_CACHE_SIZE * 1024 * 1024 * \
+        settings.WARMUP_MAXIMUM_CACHE_FRACTION
+
+
+def warm_up(search: WarmUpSearch) -> bool:
+    """Perform a search if its results are not cached yet and there is
+    enough space in the cache. Return True if the search was performed."""
+    if is_cached(search):
+        return False
+    if not has_cache_space():
+        logger.info('Cache is too large to warm up search of {} on '
+                    'component {}'.format(search.xpath[:50],
+                                          search.component_id))
+        return False
+    try:
+        result, _ = ComponentSearchResult.objects.get_or_create(
+            xpath=search.xpath, component_id=search.component_id,
+            variables=search.variables
+        )
+    except IntegrityError:
+        # The component has been deleted in the meantime
+        return False
+    logger.info('Warming up search of {} on component {} ({} queries)'
+                .format(search.xpath[:50], search.component_id,
+                        search.count))
+    return result.perform_search()
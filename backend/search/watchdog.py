@@ -0,0 +1,167 @@
+"""Stopping of running searches from a separate thread."""
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from services.basex import basex
+from .basex_search import generate_xquery_stop
+
+logger = logging.getLogger(__name__)
+
+CANCELLED = 'cancelled'
+ABANDONED = 'abandoned'
+TIMED_OUT = 'timed out'
+
+
+class SearchWatchdog(threading.Thread):
+    """Thread that regularly checks if a running search should be stopped
+    and if so stops the BaseX query that is running. The search should be
+    stopped entirely if the SearchQuery was cancelled, if it was not polled
+    for settings.SEARCH_ABANDON_TIMEOUT seconds or if it takes longer than
+    settings.SEARCH_QUERY_TIMEOUT seconds; in that case the reason
+    attribute is set. A single BaseX query is stopped if it takes longer
+    than settings.SEARCH_DATABASE_TIMEOUT seconds.
+
+    Queries should be tagged using tag_xquery() with a tag created by
+    new_tag() and run inside the running() context manager. Several
+    queries may run at the same time, e.g. on different BaseX nodes."""
+
+    def __init__(self, query_id: Optional[int] = None):
+        super().__init__(daemon=True)
+        self.query_id = query_id
+        self.reason: Optional[str] = None
+        self._start_time = time.monotonic()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+        # Node and start time of every running query by tag
+        self._running: Dict[str, Tuple[Optional[str], float]] = {}
+        self._timed_out: Set[str] = set()
+        # Functions that are called regularly while the search runs, with
+        # their interval and the last time they were called
+        self._heartbeats: List[list] = []
+
+    @staticmethod
+    def new_tag() -> str:
+        return 'gretel-search-{}'.format(uuid.uuid4().hex)
+
+    @property
+    def stopped(self) -> bool:
+        return self.reason is not None
+
+    def timed_out(self, tag: str) -> bool:
+        """True if the query tagged with tag was stopped because it took
+        longer than SEARCH_DATABASE_TIMEOUT"""
+        with self._lock:
+            return tag in self._timed_out
+
+    @contextmanager
+    def running(self, tag: str, node: Optional[str] = None):
+        """Context manager to use while the query tagged with tag is
+        running on the given BaseX node"""
+        with self._lock:
+            self._running[tag] = (node, time.monotonic())
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._running[tag]
+
+    @contextmanager
+    def heartbeat(self, function: Callable[[], None], interval: float):
+        """Context manager during which function is called (from the
+        watchdog thread) every interval seconds, e.g. to renew a lock"""
+        heartbeat = [function, interval, time.monotonic()]
+        with self._lock:
+            self._heartbeats.append(heartbeat)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._heartbeats.remove(heartbeat)
+
+    def _beat(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = [heartbeat for heartbeat in self._heartbeats
+                   if now - heartbeat[2] >= heartbeat[1]]
+            for heartbeat in due:
+                heartbeat[2] = now
+        for function, _, _ in due:
+            function()
+
+    def _get_reason(self) -> Optional[str]:
+        if settings.SEARCH_QUERY_TIMEOUT is not None and \
+                time.monotonic() - self._start_time > \
+                settings.SEARCH_QUERY_TIMEOUT:
+            return TIMED_OUT
+        if self.query_id is None:
+            return None
+        # Imported here to avoid a circular import
+        from .models import SearchQuery
+        try:
+            cancelled, last_accessed = SearchQuery.objects.values_list(
+                'cancelled', 'last_accessed'
+            ).get(id=self.query_id)
+        except SearchQuery.DoesNotExist:
+            return None
+        if cancelled:
+            return CANCELLED
+        if settings.SEARCH_ABANDON_TIMEOUT is not None and \
+                last_accessed is not None and \
+                timezone.now() - last_accessed > \
+                timedelta(seconds=settings.SEARCH_ABANDON_TIMEOUT):
+            return ABANDONED
+        return None
+
+    def _stop_query(self, tag: str, node: Optional[str]) -> None:
+        try:
+            basex.perform_query_everywhere(generate_xquery_stop(tag), node=node)
+        except (OSError, UnicodeDecodeError, ValueError) as err:
+            logger.warning('Could not stop BaseX query: {}'.format(err))
+
+    def check(self) -> None:
+        """Check if the search or the running query should be stopped
+        and stop the running query if so"""
+        self._beat()
+        if self.reason is None:
+            self.reason = self._get_reason()
+        to_stop = []
+        with self._lock:
+            now = time.monotonic()
+            for tag, (node, started) in self._running.items():
+                if self.reason is None and \
+                        settings.SEARCH_DATABASE_TIMEOUT is not None and \
+                        now - started > settings.SEARCH_DATABASE_TIMEOUT:
+                    self._timed_out.add(tag)
+                if self.reason or tag in self._timed_out:
+                    to_stop.append((tag, node))
+        for tag, node in to_stop:
+            logger.info('Stopping BaseX query {} of search query {}'
+                        .format(tag, self.query_id))
+            self._stop_query(tag, node)
+
+    def run(self):
+        try:
+            while not self._finished.wait(settings.SEARCH_WATCHDOG_INTERVAL):
+                try:
+                    self.check()
+                except Exception:
+                    logger.exception('Error in search watchdog')
+        finally:
+            # Every thread has its own database connection
+            connection.close()
+
+    def finish(self) -> None:
+        """Stop watching and wait for the thread to end"""
+        self._finished.set()
+        if self.is_alive():
+            self.join()
@@ -1,8 +1,15 @@
 from django.conf import settings
 from lxml import etree
 
+import logging
+import threading
+
 from corpus2alpino.annotators.alpino import AlpinoAnnotator
 
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 
 class AlpinoError(RuntimeError):
     pass
@@ -10,42 +17,92 @@ class AlpinoError(RuntimeError):
 
 class AlpinoService:
     client = None
+    # Limits the number of concurrent parses of this process
+    semaphore = None
+    version = None
 
     def initialize(self):
         '''Connect to the Alpino server or the executable. The client
         will be reachable from the client attribute of this class
-        using the interface provided by corpus2alpino.'''
+        using the interface provided by corpus2alpino. The server client
+        opens a new connection for every sentence, so it can be shared by
+        concurrent requests through parse_line(), which limits the number
+        of concurrent parses to settings.ALPINO_MAX_CONCURRENT_PARSES.'''
         if self.client is None:
             try:
                 if settings.ALPINO_HOST and settings.ALPINO_PORT:
                     annotator = AlpinoAnnotator(
                         settings.ALPINO_HOST, settings.ALPINO_PORT
                     )
+                    concurrent_parses = settings.ALPINO_MAX_CONCURRENT_PARSES
                 elif settings.ALPINO_PATH:
                     annotator = AlpinoAnnotator(
                         settings.ALPINO_PATH, []
                     )
+                    # A single process parses one sentence at a time
+                    concurrent_parses = 1
                 else:
                     raise AlpinoError('Alpino has not been configured.')
                 self.client = annotator.client
                 self.annotator = annotator
             except Exception as e:
                 raise AlpinoError(str(e))
+            self.semaphore = threading.BoundedSemaphore(concurrent_parses)
+            self.version = None
+
+    def parse_line(self, sentence: str, sentence_id: str) -> str:
+        '''Parse a sentence, waiting at most
+        settings.ALPINO_PARSE_WAIT_TIMEOUT seconds for other parses to
+        finish. If the server refuses the connection (e.g. because it is
+        restarting) the sentence is sent once more; sentences of which
+        the parse timed out are not retried.'''
+        if self.client is None:
+            raise AlpinoError('Alpino service not initialized')
+        with metrics.time('gretel_alpino_parse_duration_seconds',
+                          'gretel_alpino_errors_total'):
+            with metrics.in_progress('gretel_alpino_parses_waiting'):
+                acquired = self.semaphore.acquire(
+                    timeout=settings.ALPINO_PARSE_WAIT_TIMEOUT)
+            if not acquired:
+                raise AlpinoError('Timed out waiting for other Alpino '
+                                  'parses to finish')
+            try:
+                with metrics.in_progress('gretel_alpino_parses_in_progress'):
+                    return self._parse_line(sentence, sentence_id)
+            finally:
+                self.semaphore.release()
+
+    def _parse_line(self, sentence: str, sentence_id: str) -> str:
+        try:
+            return self.client.parse_line(sentence, sentence_id)
+        except ConnectionRefusedError as e:
+            logger.warning('Alpino refused the connection, retrying: {}'
+                           .format(e))
+        except Exception as e:
+            raise AlpinoError(str(e))
+        try:
+            return self.client.parse_line(sentence, sentence_id)
+        except Exception as e:
+            raise AlpinoError(str(e))
 
     def get_alpino_version(self):
+        '''Return the version of Alpino, which is determined by parsing
+        a sentence the first time'''
         if not self.client:
             raise AlpinoError('Alpino service not initialized')
+        if self.version is not None:
+            return self.version
         try:
-            parsed_sentence = self.client.parse_line('hoi', 'test_line') \
+            parsed_sentence = self.parse_line('hoi', 'test_line') \
                 .encode()  # Encode to bytes because lxml.etree expects that
         except Exception as e:
             raise AlpinoError(str(e))
         try:
             tree = etree.fromstring(parsed_sentence)
-            version = tree.xpath('/alpino_ds/@version')[0]
+            self.version = tree.xpath('/alpino_ds/@version')[0]
         except etree.ParseError as e:
             raise AlpinoError(str(e))
-        return version
+        return self.version
 
 
 alpino = AlpinoService()
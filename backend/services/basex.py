@@ -2,55 +2,258 @@ from BaseXClient import BaseXClient
 
 from django.conf import settings
 
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def _measure(operation):
+    """Return a context manager recording the number, duration and
+    errors of BaseX operations"""
+    metrics.increment('gretel_basex_queries_total', operation=operation)
+    return metrics.time('gretel_basex_query_duration_seconds',
+                        'gretel_basex_errors_total', operation=operation)
+
+
+def _is_connection_error(err: Exception) -> bool:
+    """Return True if err means that the server could not be reached,
+    as opposed to an error reported by BaseX (e.g. a query error), which
+    is raised as an OSError without errno"""
+    return isinstance(err, (ConnectionError, TimeoutError)) or \
+        (isinstance(err, OSError) and err.errno is not None)
+
 
 class BaseXService:
-    def perform_query(self, query):
+    """Access to the BaseX servers (nodes) configured in
+    settings.BASEX_NODES. Queries on a database are sent to the node on
+    which the database is stored (see BaseXDB.node) if the database is
+    given; otherwise the default node is used.
+
+    A node can have read replicas holding the same databases. Queries
+    are sent to the server of the node with the fewest running queries,
+    and retried on another server if a server cannot be reached.
+    Commands and database creation always use the primary server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Node of every database and the time at which it was read
+        self._database_nodes: Dict[str, str] = {}
+        self._database_nodes_read = 0.0
+        # Running and started queries per server, and the time until
+        # which servers that could not be reached are avoided
+        self._active: Dict[str, int] = {}
+        self._started: Dict[str, int] = {}
+        self._unhealthy_until: Dict[str, float] = {}
+
+    @property
+    def nodes(self):
+        """Names of all nodes"""
+        return list(settings.BASEX_NODES)
+
+    def get_node(self, database: Optional[str] = None) -> str:
+        """Return the name of the node on which database is stored"""
+        if database is None or len(settings.BASEX_NODES) == 1:
+            return settings.BASEX_DEFAULT_NODE
+        with self._lock:
+            if time.monotonic() - self._database_nodes_read > \
+                    settings.BASEX_NODE_CACHE_TIMEOUT:
+                # Imported here to avoid a circular import
+                from treebanks.models import BaseXDB
+                self._database_nodes = dict(
+                    BaseXDB.objects.values_list('dbname', 'node')
+                )
+                self._database_nodes_read = time.monotonic()
+            return self._database_nodes.get(database,
+                                            settings.BASEX_DEFAULT_NODE)
+
+    def clear_node_cache(self) -> None:
+        """Make sure that the nodes of databases are read again, e.g.
+        after a database has been added"""
+        with self._lock:
+            self._database_nodes_read = 0.0
+
+    def find_node(self, database: str) -> str:
+        """Return the name of the first node that has a database with
+        the given name, or the default node if no node has it. Used for
+        databases that were created outside GrETEL."""
+        for node in self.nodes:
+            try:
+                exists = self.perform_query(
+                    'db:exists("{}")'.format(database), node=node
+                )
+            except OSError:
+                continue
+            if exists == 'true':
+                return node
+        return settings.BASEX_DEFAULT_NODE
+
+    def _get_node(self, database: Optional[str], node: Optional[str]) -> str:
+        return node if node is not None else self.get_node(database)
+
+    def get_servers(self, node: Optional[str] = None) -> List[str]:
+        """Return the names of the servers of a node: the name of the
+        node for its primary server, followed by '<node>/<n>' for its
+        read replicas"""
+        node = node if node is not None else settings.BASEX_DEFAULT_NODE
+        replicas = settings.BASEX_NODES[node].get('REPLICAS', [])
+        return [node] + ['{}/{}'.format(node, number)
+                         for number in range(1, len(replicas) + 1)]
+
+    def _get_configuration(self, server: str) -> dict:
+        node, _, number = server.partition('/')
+        configuration = settings.BASEX_NODES[node]
+        if not number:
+            return configuration
+        # Replicas use the credentials of the primary unless given
+        return {**configuration,
+                **configuration['REPLICAS'][int(number) - 1]}
+
+    def is_healthy(self, server: str) -> bool:
+        with self._lock:
+            return self._unhealthy_until.get(server, 0.0) <= time.monotonic()
+
+    def _acquire_server(self, node: str, tried: List[str]) -> str:
+        """Choose the server of node to send a query to, i.e. a healthy
+        server that has not been tried yet with the fewest running
+        queries, and count the query as running"""
+        candidates = [server for server in self.get_servers(node)
+                      if server not in tried]
+        with self._lock:
+            now = time.monotonic()
+            server = min(candidates, key=lambda server: (
+                self._unhealthy_until.get(server, 0.0) > now,
+                self._active.get(server, 0),
+                self._started.get(server, 0)
+            ))
+            self._active[server] = self._active.get(server, 0) + 1
+            self._started[server] = self._started.get(server, 0) + 1
+        return server
+
+    def _release_server(self, server: str, error: Optional[Exception]):
+        with self._lock:
+            self._active[server] -= 1
+            if error is None:
+                self._unhealthy_until.pop(server, None)
+                return
+            self._unhealthy_until[server] = \
+                time.monotonic() + settings.BASEX_UNHEALTHY_TIMEOUT
+        logger.warning('BaseX server {} is unavailable: {}'
+                       .format(server, error))
+        metrics.increment('gretel_basex_unavailable_total', server=server)
+
+    def _read(self, node: str, operation, retry=lambda: True):
+        """Run operation(session) on a server of node and yield its
+        results, retrying on the next server if a server cannot be
+        reached and retry() returns True"""
+        tried = []
+        while True:
+            server = self._acquire_server(node, tried)
+            tried.append(server)
+            error = None
+            try:
+                session = self.get_session(server=server)
+                try:
+                    yield from operation(session)
+                finally:
+                    session.close()
+                return
+            except OSError as err:
+                if not _is_connection_error(err):
+                    raise
+                error = err
+                if len(tried) == len(self.get_servers(node)) or \
+                        not retry():
+                    raise
+            finally:
+                self._release_server(server, error)
+
+    def perform_query(self, query, database=None, node=None):
         """Open a session, create a query, execute it, close the session
         and result the result"""
-        session = self.get_session()
-        response = session.query(query).execute()
-        session.close()
+        with _measure('query'):
+            response, = self._read(
+                self._get_node(database, node),
+                lambda session: [session.query(query).execute()]
+            )
         return response
 
-    def perform_query_iter(self, query):
-        session = self.get_session()
-        yield from session.query(query).iter()
-        session.close()
+    def perform_query_iter(self, query, database=None, node=None):
+        # Only retry if no results were returned yet, to prevent
+        # returning results twice
+        received = False
+        with _measure('query_iter'):
+            for item in self._read(self._get_node(database, node),
+                                   lambda session: session.query(query).iter(),
+                                   lambda: not received):
+                received = True
+                yield item
 
-    def execute(self, command):
+    def perform_query_everywhere(self, query, node=None) -> List[str]:
+        """Run a query on every server of a node, e.g. to stop queries
+        that may be running on any of them, and return the results of
+        the servers that could be reached"""
+        responses = []
+        for server in self.get_servers(node):
+            try:
+                with _measure('query'):
+                    session = self.get_session(server=server)
+                    try:
+                        responses.append(session.query(query).execute())
+                    finally:
+                        session.close()
+            except OSError as err:
+                if not _is_connection_error(err):
+                    raise
+                logger.warning('BaseX server {} is unavailable: {}'
+                               .format(server, err))
+        return responses
+
+    def execute(self, command, node=None):
         """Open a session, execute a command, close the session
         and return the result"""
-        session = self.get_session()
-        response = session.execute(command)
-        session.close()
+        with _measure('execute'):
+            session = self.get_session(node)
+            response = session.execute(command)
+            session.close()
         return response
 
-    def create(self, name, content):
+    def create(self, name, content, node=None):
         """Open a session, create a database and close the session"""
-        session = self.get_session()
-        session.create(name, content)
-        session.close()
+        with _measure('create'):
+            session = self.get_session(node)
+            session.create(name, content)
+            session.close()
+        self.clear_node_cache()
 
-    def get_session(self):
+    def get_session(self, node=None, server=None):
+        """Open a session with the primary server of a node, or with the
+        given server (see get_servers())"""
+        configuration = self._get_configuration(
+            server if server is not None else
+            node if node is not None else settings.BASEX_DEFAULT_NODE
+        )
         session = BaseXClient.Session(
-                    settings.BASEX_HOST,
-                    settings.BASEX_PORT,
-                    settings.BASEX_USER,
-                    settings.BASEX_PASSWORD
+                    configuration['HOST'],
+                    configuration['PORT'],
+                    configuration['USER'],
+                    configuration['PASSWORD']
         )
         return session
 
-    def test_connection(self):
-        try:
-            session = BaseXClient.Session(
-                settings.BASEX_HOST,
-                settings.BASEX_PORT,
-                settings.BASEX_USER,
-                settings.BASEX_PASSWORD
-            )
-        except ConnectionError:
-            return False
-        session.close()
+    def test_connection(self, node=None):
+        """Return True if a connection can be made with the primary
+        server of the given node, or of all nodes if no node is given"""
+        for name in [node] if node is not None else self.nodes:
+            try:
+                session = self.get_session(name)
+            except ConnectionError:
+                return False
+            session.close()
         return True
 
 
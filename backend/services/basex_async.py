@@ -0,0 +1,202 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+import asyncio
+import hashlib
+from typing import AsyncIterator, List, Optional, Tuple
+
+from .basex import BaseXService, basex, _is_connection_error, _measure
+
+
+class AsyncSession:
+    """A session with a BaseX server using asyncio streams, implementing
+    the part of the BaseX server protocol used by GrETEL (see
+    https://docs.basex.org/wiki/Server_Protocol). Like BaseXClient, errors
+    reported by BaseX are raised as OSError and lost connections as
+    ConnectionError."""
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self._reader = reader
+        self._writer = writer
+
+    @classmethod
+    async def connect(cls, host: str, port: int, user: str,
+                      password: str) -> 'AsyncSession':
+        reader, writer = await asyncio.open_connection(host, port)
+        session = cls(reader, writer)
+        try:
+            response = (await session._receive_string()).split(':')
+            if len(response) > 1:
+                code = '{}:{}:{}'.format(user, response[0], password)
+                nonce = response[1]
+            else:
+                code = password
+                nonce = response[0]
+            digest = hashlib.md5(
+                hashlib.md5(code.encode('us-ascii')).hexdigest()
+                .encode('us-ascii') + nonce.encode('us-ascii')
+            ).hexdigest()
+            await session._send(user + chr(0) + digest)
+            if not await session._success():
+                raise OSError('Access Denied.')
+        except BaseException:
+            writer.close()
+            raise
+        return session
+
+    async def _send(self, value: str) -> None:
+        self._writer.write(value.encode('utf-8') + b'\0')
+        await self._writer.drain()
+
+    async def _receive_byte(self) -> int:
+        try:
+            return (await self._reader.readexactly(1))[0]
+        except asyncio.IncompleteReadError:
+            raise ConnectionError('Connection closed by BaseX')
+
+    async def _receive_string(self) -> str:
+        data = bytearray()
+        try:
+            while True:
+                try:
+                    data += await self._reader.readuntil(b'\0')
+                    break
+                except asyncio.LimitOverrunError as err:
+                    # The string does not fit in the buffer of the reader
+                    data += await self._reader.readexactly(err.consumed)
+        except asyncio.IncompleteReadError:
+            raise ConnectionError('Connection closed by BaseX')
+        return data[:-1].decode('utf-8')
+
+    async def _success(self) -> bool:
+        return await self._receive_byte() == 0
+
+    async def _command(self, code: str, argument: str) -> str:
+        """Send a query command and return its result"""
+        await self._send(code + argument)
+        result = await self._receive_string()
+        if not await self._success():
+            raise OSError(await self._receive_string())
+        return result
+
+    async def execute(self, command: str) -> str:
+        await self._send(command)
+        result = await self._receive_string()
+        info = await self._receive_string()
+        if not await self._success():
+            raise OSError(info)
+        return result
+
+    async def query(self, query: str) -> 'AsyncQuery':
+        return AsyncQuery(self, await self._command(chr(0), query))
+
+    async def close(self) -> None:
+        try:
+            await self._send('exit')
+        finally:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+
+
+class AsyncQuery:
+    def __init__(self, session: AsyncSession, query_id: str):
+        self._session = session
+        self._id = query_id
+
+    async def execute(self) -> str:
+        return await self._session._command(chr(5), self._id)
+
+    async def iter(self) -> AsyncIterator[Tuple[int, str]]:
+        """Yield (typecode, item) for all items returned by the query"""
+        session = self._session
+        await session._send(chr(4) + self._id)
+        typecode = await session._receive_byte()
+        while typecode > 0:
+            yield typecode, await session._receive_string()
+            typecode = await session._receive_byte()
+        if not await session._success():
+            raise OSError(await session._receive_string())
+
+
+class AsyncBaseXService:
+    """asyncio counterpart of BaseXService for read-only queries, used by
+    the async views. The node and server of every query are chosen by
+    the given BaseXService, so that synchronous and asynchronous queries
+    share the load and health of the servers."""
+
+    def __init__(self, service: BaseXService):
+        self.service = service
+
+    async def get_node(self, database: Optional[str] = None) -> str:
+        if database is None or len(settings.BASEX_NODES) == 1:
+            return settings.BASEX_DEFAULT_NODE
+        # Reading the nodes of databases may access the database
+        return await sync_to_async(self.service.get_node)(database)
+
+    async def get_session(self, node=None, server=None) -> AsyncSession:
+        configuration = self.service._get_configuration(
+            server if server is not None else
+            node if node is not None else settings.BASEX_DEFAULT_NODE
+        )
+        return await AsyncSession.connect(
+            configuration['HOST'],
+            configuration['PORT'],
+            configuration['USER'],
+            configuration['PASSWORD']
+        )
+
+    async def _read(self, database, node, operation, retry=lambda: True):
+        """Run operation(session) on a server and yield its results,
+        retrying like BaseXService._read"""
+        if node is None:
+            node = await self.get_node(database)
+        tried: List[str] = []
+        while True:
+            server = self.service._acquire_server(node, tried)
+            tried.append(server)
+            error = None
+            try:
+                session = await self.get_session(server=server)
+                try:
+                    async for item in operation(session):
+                        yield item
+                finally:
+                    await session.close()
+                return
+            except OSError as err:
+                if not _is_connection_error(err):
+                    raise
+                error = err
+                if len(tried) == len(self.service.get_servers(node)) or \
+                        not retry():
+                    raise
+            finally:
+                self.service._release_server(server, error)
+
+    async def perform_query(self, query, database=None, node=None) -> str:
+        async def operation(session):
+            yield await (await session.query(query)).execute()
+
+        with _measure('query'):
+            responses = [response async for response
+                         in self._read(database, node, operation)]
+        return responses[0]
+
+    async def perform_query_iter(self, query, database=None, node=None):
+        async def operation(session):
+            async for item in (await session.query(query)).iter():
+                yield item
+
+        received = False
+        with _measure('query_iter'):
+            async for item in self._read(database, node, operation,
+                                         lambda: not received):
+                received = True
+                yield item
+
+
+async_basex = AsyncBaseXService(basex)
@@ -0,0 +1,199 @@
+'''Counters, gauges and histograms in the Prometheus text format. Values
+are kept in Redis, so that the web server processes and the Celery workers
+record into the same metrics. Recording never raises: if Redis is not
+available the observation is dropped and Redis is not tried again for a
+while.'''
+
+from django.conf import settings
+
+from contextlib import contextmanager
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+COUNTER = 'counter'
+HISTOGRAM = 'histogram'
+GAUGE = 'gauge'
+
+# Name: (type, help text)
+METRICS = {
+    'gretel_search_phase_duration_seconds': (
+        HISTOGRAM, 'Time spent per phase of searching and reading results'),
+    'gretel_search_duration_seconds': (
+        HISTOGRAM, 'Total time of searching a component'),
+    'gretel_cache_requests_total': (
+        COUNTER, 'Component results that were found in the cache (hit) or '
+                 'had to be searched (miss)'),
+    'gretel_tree_cache_requests_total': (
+        COUNTER, 'Sentence trees that were found in the tree cache (hit) '
+                 'or had to be fetched from BaseX (miss)'),
+    'gretel_cache_evictions_total': (
+        COUNTER, 'Component results deleted to keep the cache small'),
+    'gretel_cache_evicted_bytes_total': (
+        COUNTER, 'Bytes deleted to keep the cache small'),
+    'gretel_queue_wait_seconds': (
+        HISTOGRAM, 'Time tasks waited in a Celery queue before they were '
+                   'started'),
+    'gretel_basex_queries_total': (
+        COUNTER, 'Queries and commands sent to BaseX'),
+    'gretel_basex_errors_total': (
+        COUNTER, 'Queries and commands sent to BaseX that failed'),
+    'gretel_basex_query_duration_seconds': (
+        HISTOGRAM, 'Time of BaseX queries and commands'),
+    'gretel_basex_unavailable_total': (
+        COUNTER, 'Queries that could not be sent to a BaseX server'),
+    'gretel_alpino_parse_duration_seconds': (
+        HISTOGRAM, 'Time of parsing a sentence with Alpino'),
+    'gretel_alpino_errors_total': (
+        COUNTER, 'Sentences that could not be parsed by Alpino'),
+    'gretel_alpino_parses_waiting': (
+        GAUGE, 'Sentences waiting for other Alpino parses to finish'),
+    'gretel_alpino_parses_in_progress': (
+        GAUGE, 'Sentences being parsed by Alpino'),
+}
+
+REDIS_KEY = 'gretel:metrics'
+RETRY_AFTER = 30  # Seconds to wait before trying Redis again after an error
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+    ) + '}'
+
+
+class MetricsRegistry:
+    _client = None
+    _unavailable_until = 0.0
+
+    def _get_client(self) -> Optional[redis.Redis]:
+        if not settings.METRICS_ENABLED or \
+                time.monotonic() < self._unavailable_until:
+            return None
+        if self._client is None:
+            self._client = redis.Redis.from_url(
+                settings.METRICS_REDIS_URL,
+                socket_timeout=0.5, socket_connect_timeout=0.5
+            )
+        return self._client
+
+    def _run(self, commands) -> Optional[list]:
+        '''Execute commands (a function adding commands to a pipeline)
+        and return the results, or None if Redis is not available.'''
+        client = self._get_client()
+        if client is None:
+            return None
+        try:
+            pipeline = client.pipeline(transaction=False)
+            commands(pipeline)
+            return pipeline.execute()
+        except redis.RedisError as err:
+            logger.debug('Cannot record metrics: {}'.format(err))
+            self._unavailable_until = time.monotonic() + RETRY_AFTER
+            return None
+
+    def increment(self, name: str, amount: float = 1, **labels) -> None:
+        assert METRICS[name][0] == COUNTER
+        field = name + _format_labels(labels)
+        self._run(lambda p: p.hincrbyfloat(REDIS_KEY, field, amount))
+
+    @contextmanager
+    def in_progress(self, name: str, **labels):
+        '''Context manager incrementing a gauge while its body runs. The
+        gauge is shared by all processes, so a process that is killed
+        while running the body leaves it too high until the metrics are
+        reset.'''
+        assert METRICS[name][0] == GAUGE
+        field = name + _format_labels(labels)
+        self._run(lambda p: p.hincrbyfloat(REDIS_KEY, field, 1))
+        try:
+            yield
+        finally:
+            self._run(lambda p: p.hincrbyfloat(REDIS_KEY, field, -1))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        '''Add an observation to a histogram'''
+        assert METRICS[name][0] == HISTOGRAM
+
+        def commands(pipeline):
+            for bucket in settings.METRICS_BUCKETS:
+                if value <= bucket:
+                    pipeline.hincrby(REDIS_KEY, name + '_bucket' +
+                                     _format_labels(dict(labels, le=bucket)))
+            pipeline.hincrby(REDIS_KEY, name + '_bucket' +
+                             _format_labels(dict(labels, le='+Inf')))
+            pipeline.hincrbyfloat(REDIS_KEY,
+                                  name + '_sum' + _format_labels(labels),
+                                  value)
+            pipeline.hincrby(REDIS_KEY,
+                             name + '_count' + _format_labels(labels))
+        self._run(commands)
+
+    def observe_phases(self, phases: Dict[str, float]) -> None:
+        '''Add the phases of a PhaseTimer to the phase histogram'''
+        for phase, seconds in phases.items():
+            self.observe('gretel_search_phase_duration_seconds', seconds,
+                         phase=phase)
+
+    @contextmanager
+    def time(self, name: str, error_counter: Optional[str] = None,
+             **labels):
+        '''Context manager observing the duration of its body in a
+        histogram and, if the body raises an exception, incrementing
+        error_counter'''
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            if error_counter:
+                self.increment(error_counter, **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def get_values(self) -> Dict[str, float]:
+        '''Return all stored counter, gauge and histogram values, using the
+        metric names with labels as keys'''
+        results = self._run(lambda p: p.hgetall(REDIS_KEY))
+        if not results:
+            return {}
+        return {key.decode(): float(value)
+                for key, value in results[0].items()}
+
+    def render(self, gauges: List[Tuple[str, str, float]]) -> str:
+        '''Render all stored metrics and the given gauges (tuples of name
+        with labels, help text and value) in the Prometheus text
+        format'''
+        values = self.get_values()
+        lines = []
+        for name, (type_, help_text) in METRICS.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, type_))
+            for key in sorted(values):
+                base = key.split('{')[0]
+                if base == name or (type_ == HISTOGRAM and base in (
+                        name + '_bucket', name + '_sum', name + '_count')):
+                    lines.append('{} {}'.format(key, repr(values[key])))
+        documented = set()
+        for name, help_text, value in gauges:
+            base = name.split('{')[0]
+            if base not in documented:
+                lines.append('# HELP {} {}'.format(base, help_text))
+                lines.append('# TYPE {} {}'.format(base, GAUGE))
+                documented.add(base)
+            lines.append('{} {}'.format(name, repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        self._run(lambda p: p.delete(REDIS_KEY))
+
+
+metrics = MetricsRegistry()
@@ -1,7 +1,15 @@
 from django.test import TestCase
 from django.conf import settings
 
-from .alpino import alpino, AlpinoError
+import asyncio
+import socket
+import threading
+
+from .alpino import alpino, AlpinoError, AlpinoService
+from .basex import BaseXService
+from .basex_async import AsyncBaseXService
+from . import metrics as metrics_module
+from .metrics import metrics
 
 
 class AlpinoServiceTestCase(TestCase):
@@ -26,3 +34,203 @@ class AlpinoServiceTestCase(TestCase):
             except AlpinoError:
                 self.skipTest('cannot use Alpino executable')
             alpino.client.parse_line('Werkt Alpino?', 'testzin')
+
+
+class FakeAlpinoClient:
+    def __init__(self, *errors):
+        # Errors raised by the next calls to parse_line
+        self.errors = list(errors)
+        self.calls = 0
+
+    def parse_line(self, line, sentence_id):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return '<alpino_ds version="1.0"/>'
+
+
+class AlpinoParseTestCase(TestCase):
+    def setUp(self):
+        self.service = AlpinoService()
+        self.service.semaphore = threading.BoundedSemaphore(1)
+
+    def test_connection_refused_is_retried(self):
+        self.service.client = FakeAlpinoClient(ConnectionRefusedError())
+        self.assertEqual(self.service.parse_line('test', 'test'),
+                         '<alpino_ds version="1.0"/>')
+        self.assertEqual(self.service.client.calls, 2)
+
+    def test_timeout_is_not_retried(self):
+        self.service.client = FakeAlpinoClient(socket.timeout('timed out'))
+        with self.assertRaises(AlpinoError):
+            self.service.parse_line('test', 'test')
+        self.assertEqual(self.service.client.calls, 1)
+
+    def test_concurrent_parses_bounded(self):
+        self.service.client = FakeAlpinoClient()
+        with self.settings(ALPINO_PARSE_WAIT_TIMEOUT=0.01):
+            with self.service.semaphore:
+                with self.assertRaises(AlpinoError):
+                    self.service.parse_line('test', 'test')
+            self.assertEqual(self.service.client.calls, 0)
+            self.service.parse_line('test', 'test')
+        self.assertEqual(self.service.client.calls, 1)
+
+    def test_version_is_cached(self):
+        self.service.client = FakeAlpinoClient()
+        self.assertEqual(self.service.get_alpino_version(), '1.0')
+        self.assertEqual(self.service.get_alpino_version(), '1.0')
+        self.assertEqual(self.service.client.calls, 1)
+
+
+def get_closed_port():
+    """Return a local port on which nothing is listening"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def replicated_nodes(primary, *replicas):
+    return {'default': {**primary, 'REPLICAS': list(replicas)}}
+
+
+class BaseXReplicaTestCase(TestCase):
+    def setUp(self):
+        self.service = BaseXService()
+        self.unreachable = {'HOST': '127.0.0.1', 'PORT': get_closed_port(),
+                            'USER': 'admin', 'PASSWORD': 'admin'}
+
+    def test_servers(self):
+        nodes = replicated_nodes(self.unreachable, {'HOST': 'replica'})
+        with self.settings(BASEX_NODES=nodes):
+            self.assertEqual(self.service.get_servers(),
+                             ['default', 'default/1'])
+            configuration = self.service._get_configuration('default/1')
+        self.assertEqual(configuration['HOST'], 'replica')
+        self.assertEqual(configuration['PORT'], self.unreachable['PORT'])
+
+    def test_least_loaded(self):
+        nodes = replicated_nodes(self.unreachable, {}, {})
+        with self.settings(BASEX_NODES=nodes):
+            first = self.service._acquire_server('default', [])
+            second = self.service._acquire_server('default', [])
+            third = self.service._acquire_server('default', [])
+            self.assertEqual(len({first, second, third}), 3)
+            self.service._release_server(second, None)
+            self.assertEqual(
+                self.service._acquire_server('default', []), second)
+            # Unhealthy servers are only used if no other server is left
+            self.service._release_server(first, ConnectionError())
+            self.service._release_server(third, None)
+            self.assertEqual(
+                self.service._acquire_server('default', []), third)
+            self.assertEqual(
+                self.service._acquire_server('default', [second, third]),
+                first)
+
+    def test_all_unreachable(self):
+        nodes = replicated_nodes(self.unreachable, {})
+        with self.settings(BASEX_NODES=nodes):
+            with self.assertRaises(ConnectionError):
+                self.service.perform_query('1')
+            self.assertFalse(self.service.is_healthy('default'))
+            self.assertFalse(self.service.is_healthy('default/1'))
+            self.assertEqual(
+                self.service.perform_query_everywhere('1'), [])
+        self.assertEqual(self.service._active,
+                         {'default': 0, 'default/1': 0})
+
+    def test_failover(self):
+        available = settings.BASEX_NODES[settings.BASEX_DEFAULT_NODE]
+        if not self.service.test_connection():
+            self.skipTest('cannot connect to BaseX')
+        nodes = replicated_nodes(self.unreachable, available)
+        with self.settings(BASEX_NODES=nodes):
+            self.assertEqual(self.service.perform_query('1 + 1'), '2')
+            items = self.service.perform_query_iter('1 to 3')
+            self.assertEqual([item for _, item in items], ['1', '2', '3'])
+            self.assertFalse(self.service.is_healthy('default'))
+            self.assertTrue(self.service.is_healthy('default/1'))
+
+
+class AsyncBaseXTestCase(TestCase):
+    def setUp(self):
+        self.service = AsyncBaseXService(BaseXService())
+
+    def test_query(self):
+        if not self.service.service.test_connection():
+            self.skipTest('cannot connect to BaseX')
+
+        async def query():
+            result = await self.service.perform_query('1 + 1')
+            items = [item async for _, item
+                     in self.service.perform_query_iter('1 to 3')]
+            with self.assertRaises(OSError):
+                await self.service.perform_query('error(')
+            return result, items
+
+        self.assertEqual(asyncio.run(query()), ('2', ['1', '2', '3']))
+
+    def test_unreachable(self):
+        unreachable = {'HOST': '127.0.0.1', 'PORT': get_closed_port(),
+                       'USER': 'admin', 'PASSWORD': 'admin'}
+        with self.settings(BASEX_NODES=replicated_nodes(unreachable, {})):
+            with self.assertRaises(ConnectionError):
+                asyncio.run(self.service.perform_query('1'))
+            self.assertFalse(self.service.service.is_healthy('default/1'))
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        # Keep the metrics of a running GrETEL instance in the same Redis
+        # database out of the tests
+        self.redis_key = metrics_module.REDIS_KEY
+        metrics_module.REDIS_KEY = 'gretel:metrics:test'
+
+    def tearDown(self):
+        metrics.reset()
+        metrics_module.REDIS_KEY = self.redis_key
+
+    def test_render_without_redis(self):
+        with self.settings(METRICS_ENABLED=False):
+            metrics.increment('gretel_basex_queries_total', operation='query')
+            output = metrics.render([
+                ('gretel_test{queue="a"}', 'Test gauge', 3),
+                ('gretel_test{queue="b"}', 'Test gauge', 4),
+            ])
+        self.assertIn('# TYPE gretel_basex_queries_total counter\n', output)
+        self.assertNotIn('gretel_basex_queries_total{', output)
+        self.assertEqual(output.count('# TYPE gretel_test gauge'), 1)
+        self.assertIn('gretel_test{queue="b"} 4.0\n', output)
+
+    def test_record(self):
+        metrics._unavailable_until = 0.0
+        metrics.reset()
+        if metrics._get_client() is None or metrics._unavailable_until:
+            self.skipTest('cannot connect to Redis')
+        metrics.increment('gretel_basex_queries_total', operation='query')
+        metrics.increment('gretel_basex_queries_total', operation='query')
+        with self.assertRaises(ValueError):
+            with metrics.time('gretel_basex_query_duration_seconds',
+                              'gretel_basex_errors_total', operation='query'):
+                raise ValueError
+        with metrics.in_progress('gretel_alpino_parses_waiting'):
+            self.assertEqual(
+                metrics.get_values()['gretel_alpino_parses_waiting'], 1)
+        values = metrics.get_values()
+        self.assertEqual(values['gretel_alpino_parses_waiting'], 0)
+        self.assertEqual(
+            values['gretel_basex_queries_total{operation="query"}'], 2)
+        self.assertEqual(
+            values['gretel_basex_errors_total{operation="query"}'], 1)
+        self.assertEqual(values['gretel_basex_query_duration_seconds_bucket'
+                                '{le="+Inf",operation="query"}'], 1)
+        self.assertEqual(values['gretel_basex_query_duration_seconds_bucket'
+                                '{le="0.005",operation="query"}'], 1)
+
+    def test_metrics_view(self):
+        with self.settings(METRICS_ENABLED=False):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'gretel_cache_entries 0.0\n', response.content)
+        self.assertIn(b'gretel_cache_maximum_size_bytes', response.content)
@@ -31,3 +31,6 @@ class ComponentAdmin(admin.ModelAdmin):
                     'total_database_size', 'treebank')
     ordering = ('treebank', 'slug')
     inlines = [BaseXDBInline]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('databases')
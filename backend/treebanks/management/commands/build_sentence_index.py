@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from treebanks.models import BaseXDB
+
+
+class Command(BaseCommand):
+    help = 'Store the locations of the sentences in BaseX databases, ' \
+           'so that trees can be retrieved directly, e.g. for databases ' \
+           'that were uploaded before locations were stored'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--treebank', default=None,
+                            help='only index the databases of this treebank')
+        parser.add_argument('--missing', action='store_true',
+                            help='only index databases without stored '
+                                 'locations')
+
+    def handle(self, *args, **options):
+        databases = BaseXDB.objects.order_by('dbname')
+        if options['treebank'] is not None:
+            databases = databases.filter(
+                component__treebank__slug=options['treebank'])
+            if not databases.exists():
+                raise CommandError('Treebank {} has no databases'
+                                   .format(options['treebank']))
+        if options['missing']:
+            databases = databases.filter(sentence_locations__isnull=True)
+        for database in databases:
+            try:
+                number = database.build_sentence_index()
+            except OSError as err:
+                self.stdout.write(self.style.WARNING(
+                    'Cannot index database {}: {}'.format(database, err)
+                ))
+                continue
+            self.stdout.write('Stored the locations of {} sentences of {}'
+                              .format(number, database))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0005_remove_component_contains_metadata_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basexdb',
+            name='alpino_version',
+            field=models.CharField(blank=True, default='', help_text='Version of Alpino with which the sentences were parsed', max_length=100),
+        ),
+    ]
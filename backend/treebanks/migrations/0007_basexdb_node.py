@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0006_basexdb_alpino_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basexdb',
+            name='node',
+            field=models.CharField(default='default', help_text='Name of the BaseX node on which the database is stored (see settings.BASEX_NODES)', max_length=100),
+        ),
+    ]
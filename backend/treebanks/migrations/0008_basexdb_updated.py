@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0007_basexdb_node'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basexdb',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.30 on 2026-10-19 19:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('treebanks', '0008_basexdb_updated'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SentenceLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sentence_id', models.CharField(max_length=255)),
+                ('pre', models.PositiveBigIntegerField()),
+                ('database', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sentence_locations', to='treebanks.basexdb')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sentencelocation',
+            constraint=models.UniqueConstraint(fields=('database', 'sentence_id'), name='one_location_per_sentence'),
+        ),
+    ]
@@ -1,15 +1,18 @@
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.conf import settings
 
 import logging
+from typing import Dict, Iterable, Tuple
 
 from services.basex import basex
 from search.basex_search import (
     generate_xquery_count_words, generate_xquery_count_sentences,
-    generate_xquery_get_version
+    generate_xquery_get_version, generate_xquery_statistics,
+    generate_xquery_sentence_locations, parse_statistics_result
 )
 
 logger = logging.getLogger(__name__)
@@ -75,7 +78,17 @@ class Component(models.Model):
     def get_databases(self):
         '''Return a dictionary of all BaseX databases (keys) and their
         sizes in KiB (values)'''
-        return {db['dbname']: db['size'] for db in self.databases.values()}
+        # Use all() so that prefetched databases are not fetched again
+        return {db.dbname: db.size for db in self.databases.all()}
+
+    def get_database_versions(self):
+        '''Return a dictionary of all BaseX databases (keys) and their
+        size in KiB and Alpino version (values). If any of these change,
+        search results of this component are no longer valid.'''
+        return {
+            db.dbname: {'size': db.size, 'alpino_version': db.alpino_version}
+            for db in self.databases.all()
+        }
 
     def serialize(self):
         '''Serialize component information (including its database info) to
@@ -97,17 +110,28 @@ class Component(models.Model):
 
     @property
     def total_database_size(self):
-        if self.databases.all().count() == 0:
-            return 0
-        return self.databases.all().aggregate(models.Sum('size'))['size__sum']
+        # Sum in Python so that prefetched databases can be used
+        return sum(db.size for db in self.databases.all())
 
 
 class BaseXDB(models.Model):
     dbname = models.CharField(max_length=200, primary_key=True,
                               verbose_name='Database name')
     size = models.IntegerField(help_text='Size of BaseX database in KiB')
+    alpino_version = models.CharField(
+        max_length=100, blank=True, default='',
+        help_text='Version of Alpino with which the sentences were parsed'
+    )
     component = models.ForeignKey(Component, on_delete=models.CASCADE,
                                   related_name='databases')
+    node = models.CharField(
+        max_length=100, default='default',
+        help_text='Name of the BaseX node on which the database is stored '
+                  '(see settings.BASEX_NODES)'
+    )
+    # Changes whenever the database is uploaded again, so that cached
+    # trees of the database can be recognized as outdated
+    updated = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = 'BaseX database'
@@ -115,29 +139,50 @@ class BaseXDB(models.Model):
     def __str__(self):
         return str(self.dbname)
 
+    @staticmethod
+    def choose_node() -> str:
+        """Return the node on which a new database should be stored: the
+        node with the smallest total size of databases"""
+        sizes = dict.fromkeys(basex.nodes, 0)
+        for node, size in BaseXDB.objects.values_list('node') \
+                .annotate(total=Sum('size')):
+            if node in sizes:
+                sizes[node] = size or 0
+        return min(sizes, key=lambda node: sizes[node])
+
     def get_db_size(self):
         """Get database size in KiB. An OSError will be raised if
         the database does not exist."""
         dbsize = int(basex.perform_query(
-                        'db:property("{}", "size")'.format(self.dbname)
+                        'db:property("{}", "size")'.format(self.dbname),
+                        node=self.node
                     ))
         return int(dbsize / 1024)
 
     def get_number_of_words(self):
         return int(basex.perform_query(
-            generate_xquery_count_words(self.dbname)
+            generate_xquery_count_words(self.dbname), node=self.node
         ))
 
     def get_number_of_sentences(self):
         return int(basex.perform_query(
-            generate_xquery_count_sentences(self.dbname)
+            generate_xquery_count_sentences(self.dbname), node=self.node
+        ))
+
+    def get_statistics(self) -> dict:
+        """Get size in KiB, number of words, number of sentences and
+        Alpino version of the database using a single query. Return
+        them as a dict with keys size, words, sentences and version.
+        An OSError will be raised if the database does not exist."""
+        return parse_statistics_result(basex.perform_query(
+            generate_xquery_statistics(self.dbname), node=self.node
         ))
 
     def delete_basex_db(self):
         """Delete this database from BaseX (called when BaseXDB objects
         are deleted)"""
         try:
-            basex.get_session().execute('DROP DB {}'.format(self.dbname))
+            basex.execute('DROP DB {}'.format(self.dbname), node=self.node)
             logger.info('Deleted database {} from BaseX.'.format(self.dbname))
         except OSError as err:
             logger.error(
@@ -147,7 +192,81 @@ class BaseXDB(models.Model):
 
     def get_alpino_version(self):
         xquery = generate_xquery_get_version(self.dbname)
-        return basex.perform_query(xquery)
+        return basex.perform_query(xquery, node=self.node)
+
+    def build_sentence_index(self) -> int:
+        """Store the locations of all sentences of this database (see
+        SentenceLocation), replacing those stored earlier, and return the
+        number of sentences. Should be called whenever the database has
+        been (re)created. An OSError will be raised if the database does
+        not exist."""
+        items = basex.perform_query_iter(
+            generate_xquery_sentence_locations(self.dbname), node=self.node
+        )
+        number = 0
+        with transaction.atomic():
+            self.sentence_locations.all().delete()
+            batch = []
+            # Every pre value is preceded by its sentence id
+            for (_, sentence_id), (_, pre) in zip(items, items):
+                batch.append(SentenceLocation(
+                    database=self, sentence_id=sentence_id, pre=int(pre)
+                ))
+                if len(batch) == SentenceLocation.BATCH_SIZE:
+                    number += len(batch)
+                    # Only the first of duplicate sentence ids is kept
+                    SentenceLocation.objects.bulk_create(
+                        batch, ignore_conflicts=True)
+                    batch = []
+            number += len(batch)
+            SentenceLocation.objects.bulk_create(batch, ignore_conflicts=True)
+        return number
+
+
+class SentenceLocation(models.Model):
+    """Location of a sentence in a BaseX database: the pre value of its
+    alpino_ds element, with which it can be opened directly (using
+    db:open-pre) instead of being looked up by its id"""
+    BATCH_SIZE = 5000
+
+    database = models.ForeignKey(BaseXDB, on_delete=models.CASCADE,
+                                 related_name='sentence_locations')
+    sentence_id = models.CharField(max_length=255)
+    pre = models.PositiveBigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['database', 'sentence_id'],
+                                    name='one_location_per_sentence')
+        ]
+
+    def __str__(self):
+        return '{}:{}'.format(self.database_id, self.sentence_id)
+
+    @classmethod
+    def get_pres(cls, sentences: Iterable[Tuple[str, str]]) \
+            -> Dict[Tuple[str, str], int]:
+        """Return the pre values of the given (database, sentence id)
+        pairs, for the sentences of which the location is known"""
+        sentence_ids: Dict[str, set] = {}
+        for database, sentence_id in sentences:
+            sentence_ids.setdefault(database, set()).add(sentence_id)
+        if not sentence_ids:
+            return {}
+        condition = Q()
+        for database, ids in sentence_ids.items():
+            condition |= Q(database_id=database, sentence_id__in=ids)
+        return {
+            (database, sentence_id): pre
+            for database, sentence_id, pre in cls.objects.filter(condition)
+            .values_list('database_id', 'sentence_id', 'pre')
+        }
+
+
+@receiver(post_save, sender=BaseXDB)
+def basexdb_saved_callback(sender, instance, using, **kwargs):
+    # The database may have been added or moved to another node
+    basex.clear_node_cache()
 
 
 @receiver(pre_delete, sender=BaseXDB)
@@ -1,6 +1,8 @@
 from django.test import TestCase
 
-from .models import Treebank, Component, BaseXDB
+from services.basex import basex
+
+from .models import Treebank, Component, BaseXDB, SentenceLocation
 
 
 class TreebankTestCase(TestCase):
@@ -22,3 +24,63 @@ class TreebankTestCase(TestCase):
         self.assertEqual(ser['components'][0]['slug'], 'testcomp1')
         self.assertEqual(len(ser['components'][0]['databases']), 1)
         self.assertEqual(ser['components'][0]['databases'][0], 'TESTDB')
+
+
+NODES = {
+    name: {'HOST': 'localhost', 'PORT': 1984, 'USER': 'admin',
+           'PASSWORD': 'admin'}
+    for name in ['first', 'second']
+}
+
+
+class BaseXNodeTestCase(TestCase):
+    def setUp(self):
+        treebank = Treebank.objects.create(slug='nodes', title='Nodes')
+        self.component = Component.objects.create(
+            slug='comp', title='comp', nr_sentences=0, nr_words=0,
+            treebank=treebank
+        )
+
+    def test_choose_node(self):
+        with self.settings(BASEX_NODES=NODES, BASEX_DEFAULT_NODE='first'):
+            BaseXDB.objects.create(dbname='NODES_1', size=10, node='first',
+                                   component=self.component)
+            self.assertEqual(BaseXDB.choose_node(), 'second')
+            BaseXDB.objects.create(dbname='NODES_2', size=20, node='second',
+                                   component=self.component)
+            self.assertEqual(BaseXDB.choose_node(), 'first')
+
+    def test_get_node(self):
+        with self.settings(BASEX_NODES=NODES, BASEX_DEFAULT_NODE='first'):
+            BaseXDB.objects.create(dbname='NODES_1', size=10, node='second',
+                                   component=self.component)
+            self.assertEqual(basex.get_node('NODES_1'), 'second')
+            self.assertEqual(basex.get_node('UNKNOWN'), 'first')
+            self.assertEqual(basex.get_node(), 'first')
+
+
+class SentenceLocationTestCase(TestCase):
+    def test_get_pres(self):
+        treebank = Treebank.objects.create(slug='locations', title='Loc')
+        component = Component.objects.create(
+            slug='comp', title='comp', nr_sentences=0, nr_words=0,
+            treebank=treebank
+        )
+        databases = [
+            BaseXDB.objects.create(dbname=dbname, size=0, component=component)
+            for dbname in ['LOCATIONS_1', 'LOCATIONS_2']
+        ]
+        SentenceLocation.objects.bulk_create([
+            SentenceLocation(database=databases[0], sentence_id='s1', pre=2),
+            SentenceLocation(database=databases[0], sentence_id='s2', pre=9),
+            SentenceLocation(database=databases[1], sentence_id='s1', pre=5),
+        ])
+        self.assertEqual(
+            SentenceLocation.get_pres([('LOCATIONS_1', 's2'),
+                                       ('LOCATIONS_2', 's1'),
+                                       ('LOCATIONS_2', 's2')]),
+            {('LOCATIONS_1', 's2'): 9, ('LOCATIONS_2', 's1'): 5}
+        )
+        self.assertEqual(SentenceLocation.get_pres([]), {})
+        databases[0].delete()
+        self.assertEqual(SentenceLocation.objects.count(), 1)
@@ -0,0 +1,228 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from itertools import accumulate
+from pathlib import Path
+import gzip
+import random
+
+from lxml import etree
+
+SYLLABLES = ['ba', 'de', 'ko', 'lu', 'mi', 'na', 'po', 're', 'si', 'ta',
+             'ver', 'ge', 'on', 'ik', 'stra', 'jen', 'wol', 'aar', 'ut', 'em']
+
+
+class Vocabulary:
+    '''A list of made-up lemmas for one part of speech, from which lemmas
+    can be drawn according to a Zipf distribution, so that a few lemmas
+    are very frequent and most are rare, like in real text.'''
+    def __init__(self, rng: random.Random, size: int, suffix: str,
+                 exponent: float):
+        self.rng = rng
+        self.lemmas = [self._make_lemma(number) + suffix
+                       for number in range(1, size + 1)]
+        rng.shuffle(self.lemmas)
+        self.cum_weights = list(accumulate(
+            1 / (rank ** exponent) for rank in range(1, size + 1)
+        ))
+
+    def _make_lemma(self, number: int) -> str:
+        # Write number in base len(SYLLABLES) using syllables as digits,
+        # so that every number gives a different lemma
+        syllables = []
+        while number:
+            number, digit = divmod(number, len(SYLLABLES))
+            syllables.append(SYLLABLES[digit])
+        return ''.join(syllables)
+
+    def draw(self) -> str:
+        return self.rng.choices(self.lemmas, cum_weights=self.cum_weights)[0]
+
+
+class SentenceGenerator:
+    '''Generator of Alpino trees of simple declarative sentences (subject,
+    finite verb, object and optionally an adjective and a prepositional
+    phrase) using the attributes that Alpino produces for these words.'''
+    DETERMINERS = ['de', 'het', 'een']
+    PREPOSITIONS = ['in', 'op', 'met', 'van', 'voor', 'bij']
+
+    def __init__(self, rng: random.Random, vocabulary_size: int,
+                 exponent: float, metadata_fields: int,
+                 metadata_values: int, version: str):
+        self.rng = rng
+        self.nouns = Vocabulary(rng, vocabulary_size, '', exponent)
+        self.verbs = Vocabulary(rng, vocabulary_size, 'en', exponent)
+        self.adjectives = Vocabulary(rng, vocabulary_size, 'ig', exponent)
+        self.metadata_fields = metadata_fields
+        self.metadata_values = metadata_values
+        self.version = version
+
+    def _word(self, parent, rel: str, word: str, lemma: str, pt: str,
+              pos: str, postag: str):
+        node = etree.SubElement(parent, 'node')
+        node.set('begin', str(self.position))
+        node.set('end', str(self.position + 1))
+        node.set('id', str(self.node_id))
+        node.set('lemma', lemma)
+        node.set('pos', pos)
+        node.set('postag', postag)
+        node.set('pt', pt)
+        node.set('rel', rel)
+        node.set('root', lemma)
+        node.set('word', word)
+        self.words.append(word)
+        self.position += 1
+        self.node_id += 1
+        return node
+
+    def _phrase(self, parent, rel: str, cat: str):
+        node = etree.SubElement(parent, 'node')
+        node.set('begin', str(self.position))
+        node.set('cat', cat)
+        node.set('end', '')  # Filled in by _close()
+        node.set('id', str(self.node_id))
+        node.set('rel', rel)
+        self.node_id += 1
+        return node
+
+    def _close(self, node):
+        node.set('end', str(self.position))
+
+    def _np(self, parent, rel: str, with_adjective: bool):
+        np = self._phrase(parent, rel, 'np')
+        determiner = self.rng.choice(self.DETERMINERS)
+        self._word(np, 'det', determiner, determiner, 'lid', 'det',
+                   'LID(bep,stan,rest)')
+        if with_adjective:
+            adjective = self.adjectives.draw()
+            self._word(np, 'mod', adjective + 'e', adjective, 'adj', 'adj',
+                       'ADJ(prenom,basis,met-e,stan)')
+        noun = self.nouns.draw()
+        self._word(np, 'hd', noun, noun, 'n', 'noun',
+                   'N(soort,ev,basis,zijd,stan)')
+        self._close(np)
+
+    def generate(self):
+        '''Return a new sentence as an alpino_ds element'''
+        self.position = 0
+        self.node_id = 0
+        self.words = []
+        alpino_ds = etree.Element('alpino_ds', version=self.version)
+        if self.metadata_fields:
+            metadata = etree.SubElement(alpino_ds, 'metadata')
+            for field in range(self.metadata_fields):
+                value = self.rng.randrange(self.metadata_values)
+                # Alternate numeric and textual metadata
+                if field % 2:
+                    etree.SubElement(metadata, 'meta', type='text',
+                                     name='field{}'.format(field),
+                                     value='value{}'.format(value))
+                else:
+                    etree.SubElement(metadata, 'meta', type='int',
+                                     name='field{}'.format(field),
+                                     value=str(value))
+        top = self._phrase(alpino_ds, 'top', 'top')
+        smain = self._phrase(top, '--', 'smain')
+        self._np(smain, 'su', self.rng.random() < 0.3)
+        verb = self.verbs.draw()
+        self._word(smain, 'hd', verb[:-2] + 't', verb, 'ww', 'verb',
+                   'WW(pv,tgw,met-t)')
+        self._np(smain, 'obj1', self.rng.random() < 0.5)
+        if self.rng.random() < 0.4:
+            pp = self._phrase(smain, 'mod', 'pp')
+            preposition = self.rng.choice(self.PREPOSITIONS)
+            self._word(pp, 'hd', preposition, preposition, 'vz', 'prep',
+                       'VZ(init)')
+            self._np(pp, 'obj1', self.rng.random() < 0.3)
+            self._close(pp)
+        self._close(smain)
+        self._word(top, '--', '.', '.', 'let', 'punct', 'LET()')
+        self._close(top)
+        self.words[0] = self.words[0].capitalize()
+        sentence = etree.SubElement(alpino_ds, 'sentence')
+        sentence.text = ' '.join(self.words)
+        return alpino_ds
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic treebank of Alpino parses in the LASSY ' \
+           '.data.dz format, to be used with upload-lassy for scale and ' \
+           'load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output_dir',
+            help='output directory, in which a folder named COMPACT will be '
+                 'created; its name is used as the name of the treebank'
+        )
+        parser.add_argument('--sentences', type=int, default=10000,
+                            help='total number of sentences')
+        parser.add_argument('--components', type=int, default=4,
+                            help='number of components')
+        parser.add_argument('--files-per-component', type=int, default=1,
+                            help='number of .data.dz files (i.e. BaseX '
+                                 'databases) per component')
+        parser.add_argument('--metadata-fields', type=int, default=3,
+                            help='number of metadata fields per sentence')
+        parser.add_argument('--metadata-values', type=int, default=10,
+                            help='number of different values per metadata '
+                                 'field')
+        parser.add_argument('--vocabulary', type=int, default=5000,
+                            help='number of different lemmas per part of '
+                                 'speech')
+        parser.add_argument('--zipf-exponent', type=float, default=1.1,
+                            help='exponent of the Zipf distribution of '
+                                 'lemmas (higher means more skewed)')
+        parser.add_argument('--alpino-version', default='1.16',
+                            help='Alpino version to write to the trees')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed for the random generator')
+
+    def write_file(self, path: Path, generator: SentenceGenerator,
+                   number_of_sentences: int):
+        with gzip.open(path, 'wb') as f:
+            for _ in range(number_of_sentences):
+                f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+                f.write(etree.tostring(generator.generate(),
+                                       pretty_print=True, encoding='utf-8'))
+
+    def handle(self, *args, **options):
+        for option in ('sentences', 'components', 'files_per_component',
+                       'metadata_values', 'vocabulary'):
+            if options[option] < 1:
+                raise CommandError('--{} should be at least 1'
+                                   .format(option.replace('_', '-')))
+        compact_dir = Path(options['output_dir']) / 'COMPACT'
+        try:
+            compact_dir.mkdir(parents=True)
+        except FileExistsError:
+            raise CommandError('{} already exists.'.format(compact_dir))
+
+        generator = SentenceGenerator(
+            random.Random(options['seed']), options['vocabulary'],
+            options['zipf_exponent'], options['metadata_fields'],
+            options['metadata_values'], options['alpino_version']
+        )
+        number_of_files = \
+            options['components'] * options['files_per_component']
+        sentences_per_file, remainder = \
+            divmod(options['sentences'], number_of_files)
+        file_number = 0
+        for component in range(options['components']):
+            for part in range(options['files_per_component']):
+                # upload-lassy groups files into components using the
+                # part before the underscore (--group-by=_1)
+                path = compact_dir / 'comp{:04d}_{:04d}.data.dz' \
+                    .format(component, part)
+                number_of_sentences = sentences_per_file + \
+                    (1 if file_number < remainder else 0)
+                self.write_file(path, generator, number_of_sentences)
+                file_number += 1
+            self.stdout.write('Generated component {} of {}.'
+                              .format(component + 1, options['components']))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated {} sentences in {} files. Upload them using:\n'
+            '  python manage.py upload-lassy {} --group-by=_1'
+            .format(options['sentences'], number_of_files,
+                    options['output_dir'])
+        ))
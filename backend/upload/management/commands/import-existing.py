@@ -1,11 +1,14 @@
 from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
 from django.conf import settings
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 import json
 
 from treebanks.models import Treebank, Component, BaseXDB
 from services.basex import basex
+from search.tasks import schedule_warm_up
 
 
 def userinputyesno(prompt, default=False):
@@ -42,20 +45,43 @@ class Command(BaseCommand):
     class ArgumentError(RuntimeError):
         pass
 
+    def get_statistics(self, dbnames: list) -> dict:
+        '''Get the statistics of all given databases concurrently, using
+        one query per database. Return a dict with the database names as
+        keys and the statistics (see BaseXDB.get_statistics) as values.'''
+        statistics = {}
+        with ThreadPoolExecutor(
+            max_workers=settings.BASEX_MAX_CONCURRENT_QUERIES
+        ) as executor:
+            futures = {
+                executor.submit(self.get_database_statistics, dbname): dbname
+                for dbname in set(dbnames)
+            }
+            for future in as_completed(futures):
+                dbname = futures[future]
+                try:
+                    statistics[dbname] = future.result()
+                except (OSError, ValueError) as err:
+                    raise CommandError(
+                        'Error accessing BaseX database {}: {}'
+                        ' - probably this database does not exist.'
+                        .format(dbname, str(err))
+                    )
+        return statistics
+
+    def get_database_statistics(self, dbname: str) -> dict:
+        '''Return the statistics of a database, including the node on
+        which it is stored'''
+        node = basex.find_node(dbname)
+        return dict(BaseXDB(dbname, node=node).get_statistics(), node=node)
+
     def create_database(self, dbname: str):
-        # Get database size (and check if it exists)
-        basex_db = BaseXDB(dbname)
-        try:
-            basex_db.size = basex_db.get_db_size()
-            words = basex_db.get_number_of_words()
-            sentences = basex_db.get_number_of_sentences()
-        except OSError as err:
-            raise CommandError(
-                'Error accessing BaseX database {}: {}'
-                ' - probably this database does not exist.'
-                .format(dbname, str(err))
-            )
-        return basex_db, words, sentences
+        # Statistics have been collected beforehand by get_statistics()
+        statistics = self.statistics[dbname]
+        basex_db = BaseXDB(dbname, size=statistics['size'],
+                           alpino_version=statistics['version'],
+                           node=statistics['node'])
+        return basex_db, statistics['words'], statistics['sentences']
 
     def create_component(self, comp: dict):
         try:
@@ -84,6 +110,20 @@ class Command(BaseCommand):
         component.nr_sentences = nr_sentences
         return component, basex_dbs
 
+    def build_sentence_indexes(self, db_objs):
+        '''Store the locations of the sentences of the databases. Failing
+        to do so is not fatal, because sentences can still be found by
+        their id.'''
+        for db_obj in db_objs:
+            try:
+                db_obj.build_sentence_index()
+            except (OSError, DatabaseError) as err:
+                self.stdout.write(self.style.WARNING(
+                    'Could not store the locations of the sentences of '
+                    '{}: {}. Use the build_sentence_index command to try '
+                    'again.'.format(db_obj, err)
+                ))
+
     def handle(self, *args, **options):
         if not basex.test_connection():
             raise CommandError('Cannot connect to BaseX. '
@@ -116,6 +156,16 @@ class Command(BaseCommand):
         self.treebank.groups = self.configuration.get('groups', '{}')
         self.treebank.metadata = self.configuration.get('metadata', '{}')
 
+        # Get the statistics of all databases in one parallel sweep
+        try:
+            dbnames = [dbname for component_config in self.config_components
+                       for dbname in component_config['databases']]
+        except KeyError as err:
+            raise CommandError('Key {} missing in component definition.'
+                               .format(err))
+        self.statistics = self.get_statistics(dbnames)
+        versions = set(x['version'] for x in self.statistics.values())
+
         # Get all Component and BaseXDB objects
         component_objs = []
         all_db_objs = []  # A flat list of all BaseXDB objects
@@ -130,11 +180,15 @@ class Command(BaseCommand):
             component_obj.save()
         for db_obj in all_db_objs:
             db_obj.save()
+        self.build_sentence_indexes(all_db_objs)
+        schedule_warm_up(component_objs)
 
         self.stdout.write(self.style.SUCCESS(
             'Successfully imported treebank {} with existing BaseX databases'
             .format(self.treebank.slug)
         ))
+        self.stdout.write('Alpino version(s) used: {}'
+                          .format(', '.join(sorted(versions))))
 
         if settings.DELETE_COMPONENTS_FROM_BASEX:
             self.stdout.write(self.style.WARNING(
@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
 from django.utils.text import slugify
 from django.utils import timezone
 
@@ -12,6 +13,8 @@ import csv
 
 from treebanks.models import Treebank, Component, BaseXDB
 from services.basex import basex
+from search.basex_search import generate_xquery_get_version
+from search.tasks import schedule_warm_up
 
 
 def userinputyesno(prompt, default=False):
@@ -203,9 +206,10 @@ class Command(BaseCommand):
                 )
 
     def check_existing_databases(self, treebank_name):
-        all_basex_dbs = basex.execute('LIST').split('\n')
-        current_dbs = [x[0:x.find(' ')]
-                       for x in all_basex_dbs
+        # Databases may exist on any node
+        current_dbs = [(x[0:x.find(' ')], node)
+                       for node in basex.nodes
+                       for x in basex.execute('LIST', node=node).split('\n')
                        if x.startswith(treebank_name)]
         if len(current_dbs) > 0:
             self.stdout.write(self.style.WARNING(
@@ -215,9 +219,9 @@ class Command(BaseCommand):
             if self.use_defaults or userinputyesno(
                 'Delete them? (they may be overwritten!)', True
             ):
-                for db in current_dbs:
+                for db, node in current_dbs:
                     try:
-                        basex.execute('DROP DB {}'.format(db))
+                        basex.execute('DROP DB {}'.format(db), node=node)
                     except OSError as err:
                         raise CommandError(
                             'Could not delete database: {}'.format(err)
@@ -246,6 +250,20 @@ class Command(BaseCommand):
             ))
         self.treebank.processed = timezone.now()
         self.treebank.save()
+        schedule_warm_up(self.treebank.components.all())
+
+    def build_sentence_index(self, basexdb_obj):
+        """Store the locations of the sentences of a database. Failing to
+        do so is not fatal, because sentences can still be found by their
+        id."""
+        try:
+            basexdb_obj.build_sentence_index()
+        except (OSError, DatabaseError) as err:
+            self.stdout.write(self.style.WARNING(
+                'Could not store the locations of the sentences of {}: {}. '
+                'Use the build_sentence_index command to try again.'
+                .format(basexdb_obj, err)
+            ))
 
     def handle(self, *args, **options):
         self.group_by = options['group_by']
@@ -341,13 +359,18 @@ class Command(BaseCommand):
                 # Determine BaseX database name
                 basex_db = treebank_db + '_' + file_title.upper()
                 # Add to BaseX and wrap up if this succeeds
+                node = BaseXDB.choose_node()
                 try:
-                    basex.create(basex_db, output)
+                    basex.create(basex_db, output, node=node)
                     # Get database size in KiB
                     dbsize = int(basex.perform_query(
-                        'db:property("{}", "size")'.format(basex_db)
+                        'db:property("{}", "size")'.format(basex_db),
+                        node=node
                     ))
                     dbsize_kib = int(dbsize / 1024)
+                    alpino_version = basex.perform_query(
+                        generate_xquery_get_version(basex_db), node=node
+                    )
                 except OSError as err:
                     self.stdout.write(self.style.ERROR(
                         'Adding file {} to BaseX failed: {}.'
@@ -358,9 +381,12 @@ class Command(BaseCommand):
                     component.nr_sentences += number_of_sentences
                     component.nr_words += number_of_words
                     component.save()
-                    basexdb_obj = BaseXDB(dbname=basex_db, size=dbsize_kib)
+                    basexdb_obj = BaseXDB(dbname=basex_db, size=dbsize_kib,
+                                          node=node)
                     basexdb_obj.component = component
+                    basexdb_obj.alpino_version = alpino_version
                     basexdb_obj.save()
+                    self.build_sentence_index(basexdb_obj)
                     self.total_number_of_files += 1
                     self.total_number_of_sentences += number_of_sentences
                     self.total_number_of_words += number_of_words
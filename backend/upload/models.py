@@ -1,9 +1,9 @@
+from io import BytesIO
 from pathlib import Path
-import re
 from lxml import etree
 import logging
 
-from django.db import models
+from django.db import DatabaseError, models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 
@@ -15,6 +15,7 @@ from corpus2alpino.writers.lassy import LassyWriter
 from treebanks.models import Treebank, Component, BaseXDB
 from services.alpino import alpino, AlpinoError
 from services.basex import basex
+from search.tasks import schedule_warm_up
 
 logger = logging.getLogger(__name__)
 
@@ -90,39 +91,68 @@ class TreebankUpload(models.Model):
             datas.append(data)
         return datas
 
-    def _discover_metadata(self, xml: str):
-        '''Helper method to discover the metadata for a number of sentences
-        (to be passed in xml as the argument to this method). This method
-        updates the private _metadata class attribute.'''
-        root = etree.fromstring(xml)
-        for sentence in root.findall('alpino_ds'):
-            metadata = sentence.find('metadata')
-            for meta in metadata.findall('meta'):
-                name = meta.get('name')
-                type_ = meta.get('type')
-                value = meta.get('value')
-                m = self._metadata.get(name, None)
-                if m:
-                    if len(m['values']) <= (self.MAX_METADATA_OPTIONS + 1):
-                        # Only add to values set if not too large -
-                        # we only use this to test if a filter should be
-                        # created
-                        m['values'].add(value)
-                    if m.get('allnumeric', None):
-                        if value.isnumeric():
-                            m['min_value'] = min(m['min_value'], int(value))
-                            m['max_value'] = max(m['max_value'], int(value))
-                        else:
-                            m['allnumeric'] = False
-                else:
-                    m = {}
-                    m['type'] = type_
-                    m['values'] = {value}
+    def _discover_metadata(self, sentence: etree._Element):
+        '''Helper method to discover the metadata for a single sentence
+        (to be passed as an alpino_ds element). This method updates the
+        private _metadata class attribute.'''
+        metadata = sentence.find('metadata')
+        if metadata is None:
+            return
+        for meta in metadata.findall('meta'):
+            name = meta.get('name')
+            type_ = meta.get('type')
+            value = meta.get('value')
+            m = self._metadata.get(name, None)
+            if m:
+                if len(m['values']) <= (self.MAX_METADATA_OPTIONS + 1):
+                    # Only add to values set if not too large -
+                    # we only use this to test if a filter should be
+                    # created
+                    m['values'].add(value)
+                if m.get('allnumeric', None):
                     if value.isnumeric():
-                        m['allnumeric'] = True
-                        m['min_value'] = int(value)
-                        m['max_value'] = int(value)
-                    self._metadata[name] = m
+                        m['min_value'] = min(m['min_value'], int(value))
+                        m['max_value'] = max(m['max_value'], int(value))
+                    else:
+                        m['allnumeric'] = False
+            else:
+                m = {}
+                m['type'] = type_
+                m['values'] = {value}
+                if value.isnumeric():
+                    m['allnumeric'] = True
+                    m['min_value'] = int(value)
+                    m['max_value'] = int(value)
+                self._metadata[name] = m
+
+    def _process_parse(self, parse: str, componentslug: str, first_id: int):
+        '''Go through the sentences of a converted file in one streaming
+        pass, adding an id to each sentence for identification in GrETEL
+        and discovering metadata on the way. Each sentence is cleared as
+        soon as it has been serialized, so that only one sentence is kept
+        as a tree at a time. Return a tuple of the list of serialized
+        sentences and the number of words.'''
+        sentences = []
+        nr_words = 0
+        current_id = first_id
+        for _, sentence in etree.iterparse(BytesIO(parse.encode()),
+                                           events=('end',),
+                                           tag='alpino_ds'):
+            top = sentence.find('node[@cat="top"]')
+            if top is not None:
+                # Like gretel-upload, determine number of words using the
+                # 'end' attribute in the top-level node
+                nr_words += int(top.get('end'))
+            sentence.set('id', '{}:{}'.format(componentslug, current_id))
+            current_id += 1
+            self._discover_metadata(sentence)
+            sentences.append(
+                etree.tostring(sentence, encoding='unicode', with_tail=False)
+            )
+            sentence.clear()
+            while sentence.getprevious() is not None:
+                del sentence.getparent()[0]
+        return sentences, nr_words
 
     def _probe_file(self, path):
         '''Probe file format to allow autodiscovery'''
@@ -191,10 +221,8 @@ class TreebankUpload(models.Model):
     def _generate_blocks(self, filenames, componentslug):
         '''A generator function converting all files in filenames to
         Alpino, yielding multiple strings ready to be added to BaseX,
-        respecting MAXIMUM_DATABASE_SIZE.'''
-        # This method directly manipulates the XML using regular expressions,
-        # but it may be a good idea to use lxml for this because of
-        # possible changes in what Alpino returns.
+        respecting MAXIMUM_DATABASE_SIZE. Metadata is discovered while
+        the blocks are generated.'''
         current_output = []
         current_length = 0
         current_id = 0
@@ -209,41 +237,21 @@ class TreebankUpload(models.Model):
             parses = converter.convert()
             try:
                 results = list(parses)
+                assert len(results) == 1
+                sentences, words = self._process_parse(
+                    results[0], componentslug, current_id
+                )
             except Exception as e:
                 logger.error('Could not process file {} - skipping: {}'
                              .format(filename, str(e)))
                 current_file += 1
                 continue
-            assert len(results) == 1
-            parse = results[0]
             current_file += 1
-            current_length += len(parse)
-            stripped = parse.strip()
-            stripped = re.sub(
-                '^' + re.escape(
-                    '<?xml version="1.0" encoding="UTF-8"?>\n<treebank>'
-                ), '', stripped
-            )  # Alternative for str.removeprefix()
-            stripped = re.sub(
-                re.escape('</treebank>') + '$', '', stripped
-            )
-            lines = stripped.split('\n')
-            for line in lines:
-                if 'cat="top"' in line:
-                    # Like gretel-upload, determine number of words using the
-                    # 'end' attribute in the top-level node
-                    nr_words += int(
-                        re.search('end=\"(.+?)\"', line).group(1)
-                    )
-                if '<alpino_ds' in line:
-                    # Each <alpino_ds> tag contains one sentence
-                    nr_sentences += 1
-                    # Add id to the end of the tag for identification in GrETEL
-                    tagend_pos = line.find('">') + 1
-                    id_attr = ' id="{}:{}"'.format(componentslug, current_id)
-                    line = line[:tagend_pos] + id_attr + line[tagend_pos:]
-                    current_id += 1
-                current_output.append(line)
+            current_id += len(sentences)
+            nr_sentences += len(sentences)
+            nr_words += words
+            current_length += sum(len(x) for x in sentences)
+            current_output.extend(sentences)
             if current_length > MAXIMUM_DATABASE_SIZE:
                 # Yield as soon as the maximum length is reached
                 yield ('<treebank>' + ''.join(current_output) + '</treebank>',
@@ -302,7 +310,6 @@ class TreebankUpload(models.Model):
             db_sequence = 0
             for result in self._generate_blocks(filenames, componentslug):
                 doc, words, sentences, files_processed = result
-                self._discover_metadata(doc)
                 nr_words += words
                 nr_sentences += sentences
                 comp_obj.nr_sentences = nr_sentences
@@ -313,9 +320,20 @@ class TreebankUpload(models.Model):
                 basexdb_obj = BaseXDB(dbname)
                 basexdb_objs.append(basexdb_obj)
                 basexdb_obj.component = comp_obj
-                basex.create(dbname, doc)
+                basexdb_obj.node = BaseXDB.choose_node()
+                basex.create(dbname, doc, node=basexdb_obj.node)
                 basexdb_obj.size = basexdb_obj.get_db_size()
+                basexdb_obj.alpino_version = basexdb_obj.get_alpino_version()
                 basexdb_obj.save()
+                try:
+                    basexdb_obj.build_sentence_index()
+                except (OSError, DatabaseError) as err:
+                    # Sentences can still be found by their id without
+                    # the index
+                    logger.warning('Could not store the locations of the '
+                                   'sentences of {}: {}. Use the '
+                                   'build_sentence_index command to try '
+                                   'again.'.format(dbname, err))
                 db_sequence += 1
                 percentage_component = int(files_processed
                                            / len(filenames) * 100)
@@ -327,3 +345,4 @@ class TreebankUpload(models.Model):
             total_processed_files += files_processed
         treebank.metadata = self.get_metadata()
         treebank.save()
+        schedule_warm_up(treebank.components.all())
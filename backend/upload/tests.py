@@ -1,3 +1,77 @@
-# from django.test import TestCase
+from django.test import TestCase
+from django.core.management import call_command, load_command_class
 
-# Create your tests here.
+from lxml import etree
+from io import StringIO
+from pathlib import Path
+import tempfile
+
+from .models import TreebankUpload
+
+PARSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<treebank>
+<alpino_ds version="1.6">
+  <metadata>
+    <meta type="text" name="speaker" value="A"/>
+    <meta type="int" name="age" value="30"/>
+  </metadata>
+  <node begin="0" cat="top" end="3" id="0" rel="top"/>
+  <sentence sentid="1">Dit is zin.</sentence>
+</alpino_ds>
+<alpino_ds version="1.6">
+  <metadata>
+    <meta type="text" name="speaker" value="B"/>
+    <meta type="int" name="age" value="40"/>
+  </metadata>
+  <node begin="0" cat="top" end="2" id="0" rel="top"/>
+  <sentence sentid="2">Nog een.</sentence>
+</alpino_ds>
+</treebank>
+'''
+
+
+class TreebankUploadTestCase(TestCase):
+    def test_process_parse(self):
+        upload = TreebankUpload()
+        upload._metadata = {}
+        sentences, nr_words = upload._process_parse(PARSE, 'comp', 5)
+        self.assertEqual(len(sentences), 2)
+        self.assertEqual(nr_words, 5)
+        ids = [etree.fromstring(x).get('id') for x in sentences]
+        self.assertEqual(ids, ['comp:5', 'comp:6'])
+        self.assertEqual(upload._metadata['speaker']['values'], {'A', 'B'})
+        self.assertEqual(upload._metadata['age']['min_value'], 30)
+        self.assertEqual(upload._metadata['age']['max_value'], 40)
+        metadata = upload.get_metadata()
+        self.assertEqual(
+            [x['facet'] for x in metadata], ['checkbox', 'slider']
+        )
+
+
+class GenerateLassyTestCase(TestCase):
+    def test_generate_lassy(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output_dir = Path(tmp) / 'SYNTHETIC'
+            call_command('generate-lassy', str(output_dir), sentences=25,
+                         components=2, files_per_component=2,
+                         stdout=StringIO())
+            files = sorted((output_dir / 'COMPACT').glob('*.data.dz'))
+            self.assertEqual(len(files), 4)
+            # The files should be readable by upload-lassy
+            upload_lassy = load_command_class('upload', 'upload-lassy')
+            total_sentences = 0
+            for path in files:
+                output, sentences, words = \
+                    upload_lassy.process_file(str(path))
+                treebank = etree.fromstring(output)
+                self.assertEqual(len(treebank.findall('alpino_ds')),
+                                 sentences)
+                self.assertGreater(words, sentences)
+                total_sentences += sentences
+            self.assertEqual(total_sentences, 25)
+            # Files should be grouped into components as suggested
+            upload_lassy.group_by = '_1'
+            self.assertEqual(
+                upload_lassy.determine_component_id(files[0].name),
+                'comp0000'
+            )
@@ -104,8 +104,9 @@ export class ResultsService {
         behaviour = this.defaultBehaviour,
     ): Observable<SearchResults> {
         const observable = new Observable<SearchResults>(observer => {
+            let queryId: number = undefined;
+            let completed = false;
             const worker = async () => {
-                let queryId: number = undefined;
                 let retrievedMatches: number = 0;
 
                 while (!observer.closed) {
@@ -147,10 +148,12 @@ export class ResultsService {
                                     "Search was cancelled at " +
                                     percentage + "%", "warning"
                                 );
+                                completed = true;
                                 observer.complete();
                             }
 
                             if (results.searchPercentage === 100) {
+                                completed = true;
                                 if (results.errors) {
                                     // TODO work on error notifications
                                     this.notificationService.add('Errors occured while searching (check JavaScript console).');
@@ -166,11 +169,40 @@ export class ResultsService {
                 }
             };
             worker();
+
+            return () => {
+                if (queryId !== undefined && !completed) {
+                    // stop the search on the server when nobody is
+                    // interested in the results anymore
+                    this.cancel(
+                        behaviour.supersetXpath ?? this.createFilteredQuery(xpath, metadataFilters),
+                        queryId);
+                }
+            };
         });
 
         return observable.pipe(publishReplay(1), refCount());
     }
 
+    /**
+     * Cancels a running search query.
+     *
+     * @param xpath The XPath of the query as it was sent to the API
+     * @param queryId The query number given back by the API
+     */
+    private async cancel(xpath: string, queryId: number): Promise<void> {
+        try {
+            await this.http.post(
+                await this.configurationService.getDjangoUrl('search/cancel/'), {
+                xpath,
+                query_id: queryId,
+            }, httpOptions).toPromise();
+        } catch (e) {
+            // the search will be stopped anyway when it is not polled anymore
+            console.warn(e);
+        }
+    }
+
     /**
      * Queries the treebank and returns the matching hits.
      * On error the returned promise rejects with @type {HttpErrorResponse}
@@ -238,9 +270,10 @@ export class ResultsService {
             database: database,
             sentence_id: sentenceId
         }
-        const response = await this.http.post<ApiTreeResult>(
+        // GET, so that the browser can cache the tree
+        const response = await this.http.get<ApiTreeResult>(
             url2,
-            data
+            { params: data }
         ).toPromise();
         return this.highlightSentenceNodes(response.tree, nodeIds);
     }